@@ -0,0 +1,761 @@
+"""
+Shift allocation for the weekend reporter app
+
+Each reporter gets one shift. Reporters with complete preferences are
+placed in random order:
+
+1. Top 10 preferences, in rank order (any week, but the last week - week 21 -
+   is capped at WEEK_21_MAX_SLOTS slots in total)
+2. Fallback: a shift of their preferred types in the other weeks, avoiding
+   their bottom 5
+3. Emergency: any open shift in the other weeks, even a bottom-5 one
+
+Reporters without (complete) preferences then get a random open shift
+outside the capped week.
+
+Week 21 is the default cap; any groups of shifts can be capped instead
+(see caps.py), and "the other weeks" are then every shift outside a
+top_10_only cap.
+
+That is the 'greedy' mode, and its result depends on the shuffle. The
+'optimal' mode solves the same problem as a min-cost flow (see
+allocate_optimal) so the total preference cost is as low as possible.
+
+Every allocation takes a seed, and all of its random choices come from a
+random.Random(seed) of its own: the same inputs and seed always give the
+same assignments, so a recorded seed lets anyone reproduce and audit an
+allocation. ALLOCATOR_VERSION says which code produced it.
+
+Because one shuffle is a gamble, allocate_draws() runs several independent
+draws (one seed each) in a process pool, and best_draw() / pareto_front()
+pick among them using the allocation report's metrics.
+
+Placements are recorded in a decisions.DecisionTrace, if one is passed,
+rather than logged line by line; the log keeps the phase headers and totals.
+"""
+
+import random
+import secrets
+from concurrent.futures import ProcessPoolExecutor
+from mincost import MinCostFlow
+from preference_matrix import BOTTOM_5, compile_preferences, score_allocation
+from shifts import ShiftType, ranked_types
+from caps import CapCounter, cap_tree, default_caps, describe_caps, restricted_shifts
+from decisions import EMERGENCY, FALLBACK, RANDOM, TOP_10, UNASSIGNED, DecisionTrace
+from trading import apply_trades, trade_shifts
+
+# Bump whenever a change can give different assignments for the same inputs
+# and seed: cached results (previews.py) and recorded seeds of another
+# version no longer apply
+ALLOCATOR_VERSION = 3
+
+# Week 21 capacity limit
+WEEK_21_MAX_SLOTS = 3
+
+ALLOCATION_MODES = ('greedy', 'optimal')
+
+# Optimal mode costs: top-10 rank 1-10 costs 1-10, a shift of a preferred type
+# FALLBACK_COST + type rank, any other shift EMERGENCY_COST and a bottom-5
+# shift BOTTOM_5_COST. Reporters without preferences cost the most so that, as
+# in greedy mode, they are the ones left out if there are not enough slots.
+FALLBACK_COST = 20
+EMERGENCY_COST = 100
+BOTTOM_5_COST = 500
+NO_PREFERENCE_COST = 1000
+
+# Upper limit on draws per allocation request
+MAX_DRAWS = 64
+
+# Random draws FreeShiftPool.choice_excluding() makes before picking among the allowed ids directly
+CHOICE_TRIES = 8
+
+def _quiet(*args):
+    pass
+
+class OpenShifts:
+    """The not-yet-full shifts of one ordered sequence.
+    
+    first_open(i) is the first open position at or after i. Full shifts are
+    skipped with path-compressed next pointers (as in union-find), so walking
+    past any number of full shifts costs amortised O(1) instead of a rescan.
+    """
+    
+    def __init__(self, shifts):
+        self.shifts = shifts
+        self.position = {shift.id: i for i, shift in enumerate(shifts)}
+        self._next = list(range(len(shifts) + 1))
+    
+    def first_open(self, i=0):
+        root = i
+        while self._next[root] != root:
+            root = self._next[root]
+        while self._next[i] != root:
+            self._next[i], i = root, self._next[i]
+        return root
+    
+    def close(self, shift_id):
+        i = self.position.get(shift_id)
+        if i is not None:
+            self._next[i] = i + 1
+    
+    def __iter__(self):
+        i = self.first_open(0)
+        while i < len(self.shifts):
+            yield self.shifts[i]
+            i = self.first_open(i + 1)
+
+class FreeShiftPool:
+    """Shift ids with O(1) add, remove and uniform random choice"""
+    
+    def __init__(self, shift_ids=()):
+        self._ids = []
+        self._index = {}
+        for shift_id in shift_ids:
+            self.add(shift_id)
+    
+    def __len__(self):
+        return len(self._ids)
+    
+    def __contains__(self, shift_id):
+        return shift_id in self._index
+    
+    def add(self, shift_id):
+        if shift_id not in self._index:
+            self._index[shift_id] = len(self._ids)
+            self._ids.append(shift_id)
+    
+    def discard(self, shift_id):
+        # Move the last id into the removed id's place
+        i = self._index.pop(shift_id, None)
+        if i is None:
+            return
+        last = self._ids.pop()
+        if i < len(self._ids):
+            self._ids[i] = last
+            self._index[last] = i
+    
+    def choice(self, rng=random):
+        return self._ids[rng.randrange(len(self._ids))]
+    
+    def choice_excluding(self, excluded, rng=random):
+        """A random id not in excluded, each equally likely, or None if every id is excluded"""
+        ids = self._ids
+        if not ids:
+            return None
+        # Rejection sampling: excluded is small (a bottom 5), so a draw is rarely rejected
+        for _ in range(CHOICE_TRIES):
+            shift_id = ids[rng.randrange(len(ids))]
+            if shift_id not in excluded:
+                return shift_id
+        
+        # Mostly excluded: draw a rank among the allowed ids and step over
+        # the excluded positions below it, O(len(excluded))
+        skipped = sorted(self._index[shift_id] for shift_id in excluded if shift_id in self._index)
+        if len(skipped) == len(ids):
+            return None
+        i = rng.randrange(len(ids) - len(skipped))
+        for position in skipped:
+            if position > i:
+                break
+            i += 1
+        return ids[i]
+
+def has_complete_preferences(prefs):
+    return len(prefs.get('top_10', [])) == 10 and len(prefs.get('bottom_5', [])) == 5
+
+def _partition_reporters(reporters_data, preferences):
+    """(all reporters, with complete preferences, without, warnings)"""
+    # Get list of non-manager reporters
+    reporter_list = [user for user, rep in reporters_data.items() if not rep.get('is_manager') and user != 'test']
+    
+    # Separate reporters into those WITH and WITHOUT preferences
+    reporters_with_prefs = []
+    reporters_without_prefs = []
+    warnings = []
+    
+    for rep in reporter_list:
+        if rep in preferences:
+            if has_complete_preferences(preferences[rep]):
+                reporters_with_prefs.append(rep)
+            else:
+                reporters_without_prefs.append(rep)
+                rep_name = reporters_data[rep]['name']
+                warnings.append(f"{rep_name} has incomplete preferences - will be randomly assigned")
+        else:
+            reporters_without_prefs.append(rep)
+            rep_name = reporters_data[rep]['name']
+            warnings.append(f"{rep_name} did not submit preferences - will be randomly assigned")
+    
+    return reporter_list, reporters_with_prefs, reporters_without_prefs, warnings
+
+def new_seed():
+    """A fresh, unpredictable seed for an allocation"""
+    return secrets.randbits(32)
+
+def allocate(reporters_data, preferences, shifts, week21_max_slots=WEEK_21_MAX_SLOTS,
+             capped_week=None, log=_quiet, mode='greedy', matrix=None, progress=None, caps=None,
+             trade=False, seed=None, trace=None):
+    """Allocate one shift per non-manager reporter with the chosen mode.
+    
+    matrix is the PreferenceMatrix for preferences; it is compiled here if
+    not given. progress, if given, is called as progress(phase, percent)
+    while the allocation runs. caps is a list of caps.Cap; by default
+    capped_week (the last week) takes at most week21_max_slots reporters.
+    trade runs the top trading cycles pass (trading.py) on the result and
+    adds its report as result['trading'].
+    
+    The same inputs and seed give the same result. Without a seed a new
+    one is drawn; either way it is returned as result['seed'].
+    
+    trace, if given, is a decisions.DecisionTrace that gets one record per
+    placement (and per trade) instead of a log line each. log (print, say)
+    gets the phase headers and totals; by default nothing is logged.
+    """
+    if mode not in ALLOCATION_MODES:
+        raise ValueError(f"Unknown allocation mode {mode!r}")
+    if matrix is None:
+        matrix = compile_preferences(preferences, shifts)
+    if seed is None:
+        seed = new_seed()
+    rng = random.Random(seed)
+    if mode == 'optimal':
+        result = allocate_optimal(reporters_data, preferences, shifts, week21_max_slots, capped_week, log, matrix,
+                                  progress, caps, rng, trace)
+    else:
+        result = allocate_greedy(reporters_data, preferences, shifts, week21_max_slots, capped_week, log, matrix,
+                                 progress, caps, rng, trace)
+    result['seed'] = seed
+    if trade:
+        if progress:
+            progress('trading', 100)
+        changed, report = trade_shifts(result['assignments'], preferences, matrix)
+        apply_trades(result, changed, report, log, trace, matrix)
+    if trace is not None:
+        counts = ', '.join(f'{n} {phase}' for phase, n in trace.counts().items() if n)
+        log(f"Trace: {len(trace)} decisions ({counts})")
+    return result
+
+def allocate_greedy(reporters_data, preferences, shifts, week21_max_slots=WEEK_21_MAX_SLOTS,
+                    capped_week=None, log=_quiet, matrix=None, progress=None, caps=None, rng=random, trace=None):
+    """Allocate one shift per non-manager reporter, phase by phase.
+    
+    shifts is a ShiftCatalog. Each cap limits the reporters across its
+    shifts; shifts of top_10_only caps are only given from top-10
+    preferences. Without caps, capped_week (default: the last week) may
+    take at most week21_max_slots reporters. Returns a dict with
+    assignments, shift_assignments, warnings, counts and stats.
+    
+    Capacity is tracked incrementally (remaining slots per shift, a
+    CapCounter, OpenShifts sequences and a FreeShiftPool), so each
+    assignment costs O(1) however many shifts there are, and checking the
+    caps costs O(1) however many overlap.
+    
+    The shuffle and the random picks come from rng. Each placement is
+    appended to trace (a DecisionTrace), if given.
+    """
+    if matrix is None:
+        matrix = compile_preferences(preferences, shifts)
+    if capped_week is None:
+        capped_week = shifts.weeks[-1]
+    if caps is None:
+        caps = default_caps(shifts, week21_max_slots, capped_week)
+    progress = progress or _quiet
+    record = trace.records.extend if trace is not None else _quiet
+    restricted = restricted_shifts(caps)
+    main_shifts = [shift for shift in shifts if shift.id not in restricted]
+    
+    reporter_list, reporters_with_prefs, reporters_without_prefs, warnings = \
+        _partition_reporters(reporters_data, preferences)
+    
+    # Initialize assignments
+    assignments = {rep: [] for rep in reporter_list}
+    shift_assignments = {shift.id: [] for shift in shifts}
+    
+    # Live capacity: remaining slots per shift and slots used per cap
+    remaining = {shift.id: shift.slots for shift in shifts}
+    counter = CapCounter(caps, shifts)
+    # Open shifts outside top-10-only caps: in order (emergency), per
+    # fallback shift type (NEW 'saturday_morning' etc. and OLD 'saturday'
+    # alike), and as a pool for random picks
+    open_main = OpenShifts(main_shifts)
+    open_by_type = {shift_type: OpenShifts([s for s in type_shifts if s.id not in restricted])
+                    for shift_type, type_shifts in shifts.by_type.items()}
+    free_pool = FreeShiftPool(shift.id for shift in main_shifts
+                              if shift.slots > 0 and counter.has_room(shift.id))
+    
+    def close(shift_id):
+        open_main.close(shift_id)
+        for open_shifts in open_by_type.values():
+            open_shifts.close(shift_id)
+        free_pool.discard(shift_id)
+    
+    # Shifts whose caps are full from the start (max_slots 0)
+    for shift in main_shifts:
+        if not counter.has_room(shift.id):
+            close(shift.id)
+    
+    def assign(rep, shift):
+        assignments[rep].append(shift.id)
+        shift_assignments[shift.id].append(rep)
+        remaining[shift.id] -= 1
+        if remaining[shift.id] <= 0:
+            close(shift.id)
+        # A cap that just filled closes all of its shifts at once
+        for shift_id in counter.add(shift.id):
+            close(shift_id)
+    
+    # The shuffle comes from rng, seeded with a fresh seed per allocation, so
+    # nobody can predict it; the seed is recorded, so anyone can replay it
+    
+    # PHASE 1: Allocate for reporters WITH preferences
+    # Strategy: Fill the uncapped shifts, allow each capped group up to its limit
+    log(f"\n=== PHASE 1: TOP 10 PREFERENCES ({describe_caps(caps)}) ===")
+    log(f"Strategy: Fill the uncapped shifts completely, allow each capped group up to its limit")
+    
+    shuffled_reporters = reporters_with_prefs.copy()
+    rng.shuffle(shuffled_reporters)
+    
+    # Percent done counts reporters placed (phases 1-3, then phase 4)
+    total = len(shuffled_reporters) + len(reporters_without_prefs)
+    step = max(1, total // 100)
+    
+    # Assign one shift to each reporter
+    for done, rep in enumerate(shuffled_reporters):
+        if done % step == 0:
+            progress('preferences', 100 * done / total)
+        prefs = preferences[rep]
+        top_10 = prefs['top_10']
+        # Rank of every shift for this reporter (0 = neither top 10 nor bottom 5)
+        ranks = matrix.row(rep)
+        
+        # Try to assign from top 10 preferences (any week, within the caps)
+        assigned = False
+        # For the trace: bit i if choice i + 1 hit a full cap, bit 10 + i if it is no shift at all
+        skipped = 0
+        
+        for rank, shift_id in enumerate(top_10, start=1):
+            shift = shifts.get(shift_id)
+            if shift is None:
+                skipped |= 1 << (rank + 9)
+                continue
+            
+            # Check if shift is full
+            if remaining[shift_id] <= 0:
+                continue
+            
+            # One of the shift's caps (e.g. week 21) is at capacity
+            if not counter.has_room(shift_id):
+                skipped |= 1 << (rank - 1)
+                continue
+            
+            # Assign shift
+            assign(rep, shift)
+            assigned = True
+            record((rep, shift_id, TOP_10, rank, skipped, top_10 if rank > 1 else None))
+            break
+        
+        # PHASE 2: Fallback (non-bottom-5 shifts outside top-10-only caps)
+        if not assigned:
+            for type_rank, shift_type in enumerate(ranked_types(prefs.get('shift_type_pref', {})), start=1):
+                # Open shifts of this type, in date order
+                for shift in open_by_type[shift_type]:
+                    if ranks[shift.id]:
+                        continue  # top 10 (already full) or bottom 5
+                    
+                    assign(rep, shift)
+                    assigned = True
+                    record((rep, shift.id, FALLBACK, type_rank, skipped, top_10))
+                    break
+                
+                if assigned:
+                    break
+        
+        # PHASE 3: Emergency assignment (ANY shift outside top-10-only caps, even bottom 5)
+        if not assigned:
+            i = open_main.first_open()
+            if i < len(main_shifts):
+                shift = main_shifts[i]
+                assign(rep, shift)
+                assigned = True
+                record((rep, shift.id, EMERGENCY, 0, skipped, top_10))
+        
+        if not assigned:
+            record((rep, None, UNASSIGNED, 0, skipped, top_10))
+            warnings.append(f"{reporters_data[rep]['name']} could not be assigned - critical error!")
+    
+    # PHASE 4: Random allocation for reporters WITHOUT preferences
+    if reporters_without_prefs:
+        log("\n=== PHASE 4: RANDOM ALLOCATION (NO PREFERENCES) ===")
+        
+        # Assign 1 shift to each reporter outside top-10-only caps
+        for done, rep in enumerate(reporters_without_prefs, start=len(shuffled_reporters)):
+            if done % step == 0:
+                progress('random', 100 * done / total)
+            # Random pick from the pool of open shifts
+            if free_pool:
+                shift = shifts[free_pool.choice(rng)]
+                assign(rep, shift)
+                record((rep, shift.id, RANDOM, 0, 0, None))
+            else:
+                record((rep, None, UNASSIGNED, 0, 0, None))
+                warnings.append(f"{reporters_data[rep]['name']} could not be assigned - no capacity remaining")
+    
+    return _result(assignments, shift_assignments, warnings, reporters_with_prefs, reporters_without_prefs,
+                   shifts, capped_week, caps, log)
+
+def allocate_optimal(reporters_data, preferences, shifts, week21_max_slots=WEEK_21_MAX_SLOTS,
+                     capped_week=None, log=_quiet, matrix=None, progress=None, caps=None, rng=random, trace=None):
+    """Allocate with a min-cost flow: as many reporters as possible, lowest total cost.
+    
+    Network: source -> reporter (1) -> shift -> sink, with each shift's
+    capacity its slots. A reporter has a direct arc to each top-10 shift
+    (cost = rank) and to each bottom-5 shift (BOTTOM_5_COST), arcs to the
+    shifts of each ranked type outside their bottom 5 (FALLBACK_COST + type
+    rank) and to every other shift outside their bottom 5 (EMERGENCY_COST).
+    Reporters without preferences reach every shift at NO_PREFERENCE_COST.
+    Only top-10 arcs go into top-10-only caps.
+    
+    One arc per reporter and shift would be far too many, so the shifts
+    outside top-10-only caps are laid out in a row where each type is a run,
+    with a node over every power-of-two stretch of the row (a sparse table:
+    node k, i reaches positions i to i + 2**k - 1). A type with a reporter's
+    bottom 5 cut out is at most six stretches, each two overlapping table
+    nodes, so the network has O(reporters + shifts log shifts) arcs.
+    
+    Each cap is a node with capacity max_slots: a shift drains through its
+    innermost cap, that cap through the next one out, and so on to the
+    sink. Caps must therefore be nested or disjoint (cap_tree raises
+    ValueError otherwise).
+    
+    Each reporter's unit of flow is then followed down the table to a
+    shift, so the assignments (and stats['cost']) are exactly the solver's.
+    Ties are broken by a random reporter order and random steps down the
+    table (from rng).
+    """
+    if matrix is None:
+        matrix = compile_preferences(preferences, shifts)
+    if capped_week is None:
+        capped_week = shifts.weeks[-1]
+    if caps is None:
+        caps = default_caps(shifts, week21_max_slots, capped_week)
+    parents = cap_tree(caps)
+    progress = progress or _quiet
+    record = trace.records.extend if trace is not None else _quiet
+    restricted = restricted_shifts(caps)
+    reporter_list, reporters_with_prefs, reporters_without_prefs, warnings = \
+        _partition_reporters(reporters_data, preferences)
+    
+    log(f"\n=== OPTIMAL ALLOCATION (MIN-COST FLOW, {describe_caps(caps)}) ===")
+    # Percent done: building the network 0-10, solving 10-90 (by flow
+    # pushed, at most one unit per reporter), matching reporters to shifts 90-100
+    progress('network', 0)
+    
+    SOURCE, SINK = 0, 1
+    flow = MinCostFlow(2)
+    cap_node = [flow.add_node() for _ in caps]
+    for i, cap in enumerate(caps):
+        flow.add_edge(cap_node[i], SINK if parents[i] is None else cap_node[parents[i]], cap.max_slots, 0)
+    # Innermost cap of each shift: larger caps first, smaller ones overwrite
+    innermost = {}
+    for i in sorted(range(len(caps)), key=lambda i: -len(caps[i].shift_ids)):
+        for shift_id in caps[i].shift_ids:
+            innermost[shift_id] = cap_node[i]
+    
+    shift_node = {}
+    for shift in shifts:
+        node = shift_node[shift.id] = flow.add_node()
+        flow.add_edge(node, innermost.get(shift.id, SINK), shift.slots, 0)
+    shift_at = {node: shift_id for shift_id, node in shift_node.items()}
+    
+    order = reporters_with_prefs + reporters_without_prefs
+    rng.shuffle(order)
+    
+    # The row: sorted by membership of the largest types first, so each type
+    # (they are nested or disjoint: a Saturday shift type is inside SATURDAY)
+    # is one run of positions
+    largest_first = sorted(ShiftType, key=lambda t: -len(shifts.by_type[t]))
+    row = sorted((shift for shift in shifts if shift.id not in restricted),
+                 key=lambda s: ([not t.covers(s) for t in largest_first], s.id))
+    position = {shift.id: i for i, shift in enumerate(row)}
+    table = [[shift_node[shift.id] for shift in row]]
+    down = {}  # table node -> its two (arc, node) halves
+    width = 1
+    while 2 * width <= len(row):
+        below = table[-1]
+        level = []
+        for i in range(len(row) - 2 * width + 1):
+            node = flow.add_node()
+            down[node] = [(flow.add_edge(node, below[j], len(order), 0), below[j]) for j in (i, i + width)]
+            level.append(node)
+        table.append(level)
+        width *= 2
+    
+    def runs(positions):
+        """Sorted positions as (start, stop) runs"""
+        found = []
+        for p in positions:
+            if found and found[-1][1] == p:
+                found[-1][1] = p + 1
+            else:
+                found.append([p, p + 1])
+        return found
+    
+    def stretch(start, stop):
+        """Table nodes reaching positions start to stop - 1"""
+        k = (stop - start).bit_length() - 1
+        first, last = table[k][start], table[k][stop - (1 << k)]
+        return (first,) if first == last else (first, last)
+    
+    spans = {}  # (start, stop) -> one node reaching exactly those positions
+    
+    def span(start, stop):
+        if (start, stop) not in spans:
+            nodes = stretch(start, stop)
+            if len(nodes) == 1:
+                spans[start, stop] = nodes[0]
+            else:
+                node = spans[start, stop] = flow.add_node()
+                down[node] = [(flow.add_edge(node, half, len(order), 0), half) for half in nodes]
+        return spans[start, stop]
+    
+    def cut(groups, bottom_5):
+        """Nodes reaching the runs in groups minus the bottom-5 positions.
+        
+        Whole runs and the pieces at either end of one recur across
+        reporters, so they get a shared node each (one arc per reporter);
+        pieces in the middle are two table nodes.
+        """
+        nodes = []
+        for start, stop in groups:
+            piece = start
+            for p in sorted(b for b in bottom_5 if start <= b < stop) + [stop]:
+                if piece < p:
+                    nodes += (span(piece, p),) if piece == start or p == stop else stretch(piece, p)
+                piece = p + 1
+        return nodes
+    
+    type_runs = {t: runs(sorted(position[s.id] for s in shifts.by_type[t] if s.id in position)) for t in ShiftType}
+    other_runs = {}  # ranked types -> runs of the positions none of them cover
+    
+    reporter_arcs = {}  # reporter -> [(arc, node, phase, detail)]
+    for rep in order:
+        node = flow.add_node()
+        flow.add_edge(SOURCE, node, 1, 0)
+        arcs = reporter_arcs[rep] = []
+        prefs = preferences.get(rep, {})
+        if not has_complete_preferences(prefs):
+            if row:
+                target = span(0, len(row))
+                arcs.append((flow.add_edge(node, target, 1, NO_PREFERENCE_COST), target, RANDOM, 0))
+            continue
+        
+        for rank, shift_id in enumerate(prefs['top_10'], start=1):
+            if shift_id in shift_node:
+                target = shift_node[shift_id]
+                arcs.append((flow.add_edge(node, target, 1, rank), target, TOP_10, rank))
+        bottom_5 = [position[shift_id] for shift_id in prefs['bottom_5'] if shift_id in position]
+        types = ranked_types(prefs.get('shift_type_pref', {}))
+        for type_rank, shift_type in enumerate(types, start=1):
+            for target in cut(type_runs[shift_type], bottom_5):
+                arcs.append((flow.add_edge(node, target, 1, FALLBACK_COST + type_rank), target, FALLBACK, type_rank))
+        key = frozenset(types)
+        if key not in other_runs:
+            covered = {p for t in key for start, stop in type_runs[t] for p in range(start, stop)}
+            other_runs[key] = runs(p for p in range(len(row)) if p not in covered)
+        for target in cut(other_runs[key], bottom_5):
+            arcs.append((flow.add_edge(node, target, 1, EMERGENCY_COST), target, EMERGENCY, 0))
+        # Every other shift is reachable for less, so at this price only
+        # the bottom 5 are worth taking
+        if bottom_5:
+            target = span(0, len(row))
+            arcs.append((flow.add_edge(node, target, 1, BOTTOM_5_COST), target, EMERGENCY, 0))
+    
+    progress('solving', 10)
+    reporter_count = max(1, len(order))
+    total_flow, total_cost = flow.solve(SOURCE, SINK,
+                                        progress=lambda f: progress('solving', 10 + 80 * f / reporter_count))
+    progress('matching', 90)
+    log(f"Flow: {total_flow} reporters placed, cost {total_cost}, {flow.phases} shortest-path phases")
+    
+    traced = {}  # table arc -> units of its flow already followed
+    
+    def descend(node):
+        """The shift one unit of flow into node ends on, taking it off the table"""
+        while node in down:
+            (a, left), (b, right) = down[node]
+            on_a = flow.flow(a) - traced.get(a, 0)
+            on_b = flow.flow(b) - traced.get(b, 0)
+            arc, node = (a, left) if rng.random() * (on_a + on_b) < on_a else (b, right)
+            traced[arc] = traced.get(arc, 0) + 1
+        return shift_at[node]
+    
+    assignments = {rep: [] for rep in reporter_list}
+    shift_assignments = {shift.id: [] for shift in shifts}
+    decisions = []  # (reporter, shift id or None, phase, detail)
+    for rep in order:
+        for arc, target, phase, detail in reporter_arcs[rep]:
+            if flow.flow(arc):
+                shift_id = descend(target)
+                assignments[rep].append(shift_id)
+                shift_assignments[shift_id].append(rep)
+                decisions.append((rep, shift_id, phase, detail))
+                if phase == EMERGENCY and matrix.rank(rep, shift_id) == BOTTOM_5:
+                    warnings.append(f"{reporters_data[rep]['name']} had to be given a bottom-5 shift")
+                break
+        else:
+            decisions.append((rep, None, UNASSIGNED, 0))
+            warnings.append(f"{reporters_data[rep]['name']} could not be assigned - no capacity remaining")
+    
+    if trace is not None:
+        # Everyone is placed at once, so the choices a reporter was passed
+        # over for are the ones full (or with a full cap) at the end: the
+        # optimum would have moved them to any with room left
+        counter = CapCounter(caps, shifts)
+        for shift_id, holders in shift_assignments.items():
+            for _ in holders:
+                counter.add(shift_id)
+        for rep, shift_id, phase, detail in decisions:
+            prefs = preferences.get(rep, {})
+            if phase == RANDOM or (phase == TOP_10 and detail == 1) or not has_complete_preferences(prefs):
+                record((rep, shift_id, phase, detail, 0, None))
+                continue
+            top_10 = prefs['top_10']
+            skipped = 0
+            for i, choice in enumerate(top_10[:detail - 1] if phase == TOP_10 else top_10):
+                shift = shifts.get(choice)
+                if shift is None:
+                    skipped |= 1 << (10 + i)
+                elif len(shift_assignments[choice]) < shift.slots and not counter.has_room(choice):
+                    skipped |= 1 << i
+            record((rep, shift_id, phase, detail, skipped, top_10))
+    
+    result = _result(assignments, shift_assignments, warnings, reporters_with_prefs, reporters_without_prefs,
+                     shifts, capped_week, caps, log)
+    result['stats']['cost'] = total_cost
+    return result
+
+def _result(assignments, shift_assignments, warnings, reporters_with_prefs, reporters_without_prefs,
+            shifts, capped_week, caps, log):
+    # Verify results
+    capped_shifts = shifts.by_week.get(capped_week, [])
+    main_shifts = [shift for shift in shifts if shift.week != capped_week]
+    total_assigned = len([a for a in assignments.values() if a])
+    week21_filled = sum(len(shift_assignments[s.id]) for s in capped_shifts)
+    weeks_1_20_filled = sum(len(a) for a in shift_assignments.values()) - week21_filled
+    
+    log(f"\n=== ALLOCATION COMPLETE ===")
+    log(f"Total reporters: {len(assignments)}")
+    log(f"Assigned: {total_assigned}")
+    log(f"Weeks 1-{capped_week - 1}: {weeks_1_20_filled}/{shifts.total_slots(main_shifts)}")
+    log(f"Week {capped_week}: {week21_filled}/{shifts.total_slots(capped_shifts)}")
+    cap_usage = {}
+    for cap in caps:
+        used = sum(len(shift_assignments[shift_id]) for shift_id in cap.shift_ids)
+        cap_usage[cap.name] = {'used': used, 'max_slots': cap.max_slots}
+        log(f"Cap {cap.name}: {used}/{cap.max_slots}")
+    
+    return {
+        'assignments': assignments,
+        'shift_assignments': shift_assignments,
+        'warnings': warnings,
+        'reporters_with_prefs': len(reporters_with_prefs),
+        'reporters_without_prefs': len(reporters_without_prefs),
+        'stats': {
+            'total_assigned': total_assigned,
+            'weeks_1_20_filled': weeks_1_20_filled,
+            'week21_filled': week21_filled,
+            'caps': cap_usage
+        }
+    }
+
+# Inputs shared by every draw in a worker process (set by _init_draws)
+_draw_inputs = None
+
+def _init_draws(reporters_data, preferences, shifts, mode, week21_max_slots, matrix, caps, trade, traced, log):
+    global _draw_inputs
+    _draw_inputs = (reporters_data, preferences, shifts, mode, week21_max_slots, matrix, caps, trade, traced, log)
+
+def _run_draw(seed, progress=None):
+    reporters_data, preferences, shifts, mode, week21_max_slots, matrix, caps, trade, traced, log = _draw_inputs
+    trace = DecisionTrace(mode) if traced else None
+    result = allocate(reporters_data, preferences, shifts, week21_max_slots, log=log, mode=mode, matrix=matrix,
+                      progress=progress, caps=caps, trade=trade, seed=seed, trace=trace)
+    if traced:
+        result['trace'] = trace
+    return seed, result, score_allocation(result['assignments'], matrix)
+
+def allocate_draws(reporters_data, preferences, shifts, seeds, week21_max_slots=WEEK_21_MAX_SLOTS,
+                   mode='greedy', workers=1, matrix=None, log=None, progress=None, caps=None, trade=False,
+                   trace=False):
+    """Run one allocation per seed, spread over up to `workers` processes.
+    
+    Draw s is exactly allocate(..., seed=s), so any draw can be
+    reproduced from its seed. Returns [(seed, result, score)] in
+    seed order, score being score_allocation() of the result. Draws run in
+    worker processes are quiet; log is only used when running in-process.
+    
+    progress(phase, percent), if given, follows each draw's phases when
+    running in-process, and counts finished draws otherwise.
+    
+    With trace set, each result carries its DecisionTrace as result['trace'].
+    """
+    global _draw_inputs
+    if matrix is None:
+        matrix = compile_preferences(preferences, shifts)
+    inputs = (reporters_data, preferences, shifts, mode, week21_max_slots, matrix, caps, trade, trace)
+    progress = progress or _quiet
+    count = len(seeds)
+    
+    def draw_progress(k):
+        if count == 1:
+            return progress
+        return lambda phase, percent: progress(f"draw {k + 1}/{count}: {phase}", (100 * k + percent) / count)
+    
+    if workers <= 1 or count <= 1:
+        try:
+            _init_draws(*inputs, log or _quiet)
+            return [_run_draw(seed, draw_progress(k)) for k, seed in enumerate(seeds)]
+        finally:
+            _draw_inputs = None
+    
+    # Workers are forked with the inputs already in memory; only seeds and
+    # results cross the process boundary
+    draws = []
+    with ProcessPoolExecutor(max_workers=min(workers, count), initializer=_init_draws,
+                             initargs=inputs + (_quiet,)) as pool:
+        for draw in pool.map(_run_draw, seeds):
+            draws.append(draw)
+            progress(f"draws ({len(draws)}/{count} done)", 100 * len(draws) / count)
+    return draws
+
+def _draw_metrics(draw):
+    """Lower is better on every component: (-assigned, bottom 5, -top 10, mean rank)"""
+    _, result, score = draw
+    mean_rank = score['mean_rank'] if score['mean_rank'] is not None else 11
+    return (-result['stats']['total_assigned'], len(score['bottom_5']), -score['top_10'], mean_rank)
+
+def best_draw(draws):
+    """Most reporters placed, then fewest bottom-5 shifts, most top-10 shifts, lowest mean rank"""
+    return min(draws, key=_draw_metrics)
+
+def pareto_front(draws):
+    """The draws no other draw matches or beats on every metric while beating on one"""
+    metrics = [_draw_metrics(draw) for draw in draws]
+    front = []
+    for draw, mine in zip(draws, metrics):
+        dominated = any(other != mine and all(o <= m for o, m in zip(other, mine)) for other in metrics)
+        if not dominated:
+            front.append(draw)
+    return front
+
+def draw_summary(draw):
+    """Seed and headline metrics of one draw (JSON-friendly)"""
+    seed, result, score = draw
+    return {
+        'seed': seed,
+        'assigned': result['stats']['total_assigned'],
+        'top_10': score['top_10'],
+        'top_10_rate': round(score['top_10_rate'], 4),
+        'mean_rank': round(score['mean_rank'], 3) if score['mean_rank'] is not None else None,
+        'bottom_5_violations': len(score['bottom_5'])
+    }
@@ -1,16 +1,25 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_file
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_file, Response
 from datetime import datetime, timedelta
 import json
 import os
 from werkzeug.security import generate_password_hash, check_password_hash
 import secrets
 import random
-try:
-    import fcntl
-    HAS_FCNTL = True
-except ImportError:
-    # fcntl is not available on Windows
-    HAS_FCNTL = False
+import atexit
+from storage import DATASETS, get_storage, get_cache_stats, load_json, save_json, AbortUpdate
+from shifts import generate_shifts
+from allocator import (ALLOCATION_MODES, ALLOCATOR_VERSION, MAX_DRAWS, WEEK_21_MAX_SLOTS, allocate_draws, best_draw,
+                       draw_summary, pareto_front)
+from caps import cap_tree, default_caps, parse_caps
+from decisions import PHASES, explain, select
+from preference_matrix import compile_preferences, score_allocation
+from repair import AllocationIndex, repair
+from previews import (PreferencesHasher, PreviewStore, content_hash, is_current, preferences_hash, preview_key,
+                      reporters_hash)
+from reports import allocation_report_data, mailmerge_csv, schedule_workbook
+from jobs import JobBusy, JobRunner
+from swaps import SwapError, SwapMarket
+from backups import BackupStore, BackupWorker, RetentionPolicy, iter_archive, read_archive, validate_datasets
 
 # Determine the base directory (where this script is located)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -22,82 +31,51 @@ app = Flask(__name__, template_folder=template_folder)
 # Fixed secret key for session persistence across restarts
 app.secret_key = 'weekend-reporter-shifts-secret-key-2025'
 
-# Data storage (in production, use a proper database)
+# Data storage (JSON files by default, SQLite via STORAGE_BACKEND=sqlite)
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 os.makedirs(DATA_DIR, exist_ok=True)
 
 BACKUP_DIR = os.path.join(DATA_DIR, 'backups')
 os.makedirs(BACKUP_DIR, exist_ok=True)
+backup_store = BackupStore(BACKUP_DIR)
+# Everything from the last hour, hourly for a day, daily for a season, all within
+# BACKUP_BUDGET_MB (the data disk in render.yaml is 1 GB)
+backup_retention = RetentionPolicy(
+    daily_seconds=int(os.environ.get('BACKUP_RETENTION_DAYS', '90')) * 86400,
+    max_bytes=int(os.environ.get('BACKUP_BUDGET_MB', '200')) * 1024 * 1024
+)
 
-REPORTERS_FILE = os.path.join(DATA_DIR, 'reporters.json')
-PREFERENCES_FILE = os.path.join(DATA_DIR, 'preferences.json')
-SETTINGS_FILE = os.path.join(DATA_DIR, 'settings.json')
-ASSIGNMENTS_FILE = os.path.join(DATA_DIR, 'assignments.json')
+# JSON files (default) or SQLite, chosen by the STORAGE_BACKEND env var
+storage = get_storage(DATA_DIR)
+
+# Seeds and scores of the draws behind the current allocation
+ALLOCATION_META_PATH = os.path.join(DATA_DIR, 'allocation_meta.json')
+
+# One record per placement behind the current allocation (see decisions.py)
+ALLOCATION_TRACE_PATH = os.path.join(DATA_DIR, 'allocation_trace.json')
+
+# Allocation previews (see previews.py)
+previews = PreviewStore(os.path.join(DATA_DIR, 'previews'))
+
+# Allocations run as background jobs, one at a time across workers
+jobs = JobRunner(os.path.join(DATA_DIR, 'jobs'))
+
+# Shift swaps between reporters after allocation (see swaps.py)
+swaps = SwapMarket(os.path.join(DATA_DIR, 'swap_offers.json'))
+
+# Processes used to run several allocation draws at once
+ALLOCATION_WORKERS = int(os.environ.get('ALLOCATION_WORKERS', os.cpu_count() or 1))
 
 # Generate 84 weekend shifts (21 weekends starting Dec 13, 2025)
 # 4 shifts per weekend: Sat morning, Sat evening, Sun morning, Sun evening
 # Total capacity: 126 slots (for 123 reporters - excludes TEST account)
-def generate_shifts():
-    shifts = []
-    start_date = datetime(2025, 12, 13)  # Saturday Dec 13, 2025
-    shift_id = 0
-    
-    for week in range(21):
-        saturday = start_date + timedelta(weeks=week)
-        sunday = saturday + timedelta(days=1)
-        
-        # Saturday morning shift - 1 reporter
-        shifts.append({
-            'id': shift_id,
-            'date': saturday.strftime('%Y-%m-%d'),
-            'day': 'Saturday',
-            'time': '8:00 AM - 4:00 PM',
-            'slots': 1,
-            'week': week + 1
-        })
-        shift_id += 1
-        
-        # Saturday evening shift - 1 reporter
-        shifts.append({
-            'id': shift_id,
-            'date': saturday.strftime('%Y-%m-%d'),
-            'day': 'Saturday',
-            'time': '3:00 PM - 10:00 PM',
-            'slots': 1,
-            'week': week + 1
-        })
-        shift_id += 1
-        
-        # Sunday morning shift - 2 reporters
-        shifts.append({
-            'id': shift_id,
-            'date': sunday.strftime('%Y-%m-%d'),
-            'day': 'Sunday',
-            'time': '8:00 AM - 4:00 PM',
-            'slots': 2,
-            'week': week + 1
-        })
-        shift_id += 1
-        
-        # Sunday evening shift - 2 reporters
-        shifts.append({
-            'id': shift_id,
-            'date': sunday.strftime('%Y-%m-%d'),
-            'day': 'Sunday',
-            'time': '3:00 PM - 10:00 PM',
-            'slots': 2,
-            'week': week + 1
-        })
-        shift_id += 1
-    
-    return shifts
-
+# Shift catalog: O(1) lookup by id (SHIFTS.get) plus indexes by week, day and kind
 SHIFTS = generate_shifts()
 
 # Initialize data files
 def init_data_files():
     # Create 123 reporters (use reload-reporters-from-csv endpoint to load actual credentials)
-    if not os.path.exists(REPORTERS_FILE):
+    if not storage.exists('reporters'):
         reporters = {}
         
         # Manager account
@@ -116,82 +94,133 @@ def init_data_files():
                 'password': generate_password_hash('password')
             }
         
-        with open(REPORTERS_FILE, 'w') as f:
-            json.dump(reporters, f, indent=2)
+        storage.save('reporters', reporters)
     
-    if not os.path.exists(PREFERENCES_FILE):
-        with open(PREFERENCES_FILE, 'w') as f:
-            json.dump({}, f)
+    if not storage.exists('preferences'):
+        storage.save('preferences', {})
     
-    if not os.path.exists(SETTINGS_FILE):
+    if not storage.exists('settings'):
         # Default deadline: 7 days from now
         deadline = (datetime.now() + timedelta(days=7)).isoformat()
-        with open(SETTINGS_FILE, 'w') as f:
-            json.dump({'deadline': deadline, 'is_locked': False}, f)
+        storage.save('settings', {'deadline': deadline, 'is_locked': False})
     
-    if not os.path.exists(ASSIGNMENTS_FILE):
-        with open(ASSIGNMENTS_FILE, 'w') as f:
-            json.dump({}, f)
+    if not storage.exists('assignments'):
+        storage.save('assignments', {})
 
 init_data_files()
 
 # Helper functions
-def load_json(filepath):
-    with open(filepath, 'r') as f:
-        return json.load(f)
-
-def save_json(filepath, data):
-    """Save JSON with file locking to prevent race conditions (Unix only)"""
-    with open(filepath, 'w') as f:
-        if HAS_FCNTL:
-            # Acquire exclusive lock (Unix only)
-            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
-        try:
-            json.dump(data, f, indent=2)
-        finally:
-            if HAS_FCNTL:
-                # Release lock
-                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
-
 def get_reporters():
-    return load_json(REPORTERS_FILE)
+    return storage.load('reporters')
 
 def get_preferences():
-    return load_json(PREFERENCES_FILE)
+    return storage.load('preferences')
 
 def get_settings():
-    return load_json(SETTINGS_FILE)
+    return storage.load('settings')
 
 def get_assignments():
-    return load_json(ASSIGNMENTS_FILE)
+    return storage.load('assignments')
+
+def get_shifts(settings=None):
+    """SHIFTS with any slot changes made by allocation repairs (settings['shift_slots'])"""
+    if settings is None:
+        settings = get_settings()
+    slots = settings.get('shift_slots')
+    return SHIFTS.with_slots({int(shift_id): n for shift_id, n in slots.items()}) if slots else SHIFTS
+
+def get_caps(settings, shifts):
+    """Capacity caps from settings['allocation_caps'] (default: week 21 at WEEK_21_MAX_SLOTS)"""
+    if 'allocation_caps' not in settings:
+        return default_caps(shifts, WEEK_21_MAX_SLOTS)
+    return parse_caps(settings['allocation_caps'], shifts)
+
+# (preferences version, PreferenceMatrix) for this worker
+_preference_matrix = None
+
+def get_compiled_preferences():
+    """Preferences plus their rank matrix, recompiled only when preferences change"""
+    global _preference_matrix
+    version = storage.version('preferences')
+    preferences = get_preferences()
+    # A write between the two version reads means we cannot tell which one we loaded
+    stable = storage.version('preferences') == version
+    cached = _preference_matrix
+    if stable and cached is not None and cached[0] == version:
+        return preferences, cached[1]
+    matrix = compile_preferences(preferences, SHIFTS)
+    if stable:
+        _preference_matrix = (version, matrix)
+    return preferences, matrix
+
+# ((preferences version, reporters version), (preferences hash, reporters hash)) for this worker
+_input_hashes = None
+hash_preferences = PreferencesHasher()
+
+def get_input_hashes():
+    """Content hashes of the preferences and reporters (see previews.py), rehashed only when they change"""
+    global _input_hashes
+    versions = (storage.version('preferences'), storage.version('reporters'))
+    cached = _input_hashes
+    if cached is not None and cached[0] == versions:
+        return cached[1]
+    hashes = (hash_preferences(get_preferences()), reporters_hash(get_reporters()))
+    if (storage.version('preferences'), storage.version('reporters')) == versions:
+        _input_hashes = (versions, hashes)
+    return hashes
+
+# {dataset: (version, content hash)} for this worker
+_content_hashes = {}
+
+def get_content_hash(dataset):
+    """content_hash() of a dataset, rehashed only when it changes"""
+    version = storage.version(dataset)
+    cached = _content_hashes.get(dataset)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    digest = content_hash(storage.load(dataset))
+    if storage.version(dataset) == version:
+        _content_hashes[dataset] = (version, digest)
+    return digest
+
+# ((assignments hash, preferences hash), score_allocation()) for this worker
+_allocation_score = None
+
+def get_allocation_score():
+    """How the saved assignments score against the preferences, recomputed only when either changes"""
+    global _allocation_score
+    # Keyed on content, so saving or restoring the same data keeps the score
+    key = (get_content_hash('assignments'), get_input_hashes()[0])
+    cached = _allocation_score
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    _, matrix = get_compiled_preferences()
+    score = score_allocation(get_assignments(), matrix)
+    if (get_content_hash('assignments'), get_input_hashes()[0]) == key:
+        _allocation_score = (key, score)
+    return score
 
 def create_auto_backup():
     """Create an automatic backup of all data files"""
     try:
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_data = {
+        # Unchanged datasets dedupe to existing objects, so they cost only a manifest entry.
+        # Expired backups (auto and manual) are removed in the same pass.
+        backup_store.create({
             'reporters': get_reporters(),
             'preferences': get_preferences(),
             'settings': get_settings(),
-            'assignments': get_assignments(),
-            'timestamp': datetime.now().isoformat()
-        }
-        
-        backup_file = os.path.join(BACKUP_DIR, f'auto_backup_{timestamp}.json')
-        with open(backup_file, 'w') as f:
-            json.dump(backup_data, f, indent=2)
-        
-        # Keep only last 30 backups to save space
-        backup_files = sorted([f for f in os.listdir(BACKUP_DIR) if f.startswith('auto_backup_')])
-        if len(backup_files) > 30:
-            for old_backup in backup_files[:-30]:
-                os.remove(os.path.join(BACKUP_DIR, old_backup))
+            'assignments': get_assignments()
+        }, retention=backup_retention)
         
         return True
     except Exception as e:
         print(f"Auto-backup failed: {e}")
         return False
 
+# Runs create_auto_backup off the request path; 50 submissions within a minute produce one backup
+backup_worker = BackupWorker(create_auto_backup, coalesce_seconds=60)
+atexit.register(backup_worker.shutdown)
+
 def format_deadline(iso_datetime_str):
     """Format ISO datetime to readable format: 'Nov. 27, 2025 2:37 pm ET'"""
     dt = datetime.fromisoformat(iso_datetime_str.replace('Z', '+00:00'))
@@ -275,7 +304,7 @@ def manager_dashboard():
                          total_reporters=len([r for r in reporters.values() if not r.get('is_manager')]),
                          assignments=assignments,
                          preferences=preferences,
-                         shifts=SHIFTS)
+                         shifts=SHIFTS.as_dicts())
 
 @app.route('/reporter/dashboard')
 def reporter_dashboard():
@@ -296,7 +325,7 @@ def reporter_dashboard():
     
     return render_template('reporter_dashboard.html',
                          username=username,
-                         shifts=SHIFTS,
+                         shifts=SHIFTS.as_dicts(),
                          preferences=user_prefs,
                          assignments=user_assignments,
                          deadline=formatted_deadline,
@@ -330,15 +359,14 @@ def manage_preferences():
         if len(data['bottom_5']) != 5:
             return jsonify({'error': 'Must select exactly 5 least wanted shifts'}), 400
         
-        preferences[username] = {
+        storage.set_preference(username, {
             'top_10': data['top_10'],
             'bottom_5': data['bottom_5'],
             'shift_type_pref': data['shift_type_pref']
-        }
-        save_json(PREFERENCES_FILE, preferences)
+        })
         
-        # Create auto-backup after preference submission
-        create_auto_backup()
+        # Queue an auto-backup; the background worker coalesces bursts into one
+        backup_worker.request()
         
         return jsonify({'success': True})
     
@@ -353,266 +381,449 @@ def manage_settings():
     if not session.get('is_manager'):
         return jsonify({'error': 'Unauthorized'}), 403
     
-    settings = get_settings()
-    
     if request.method == 'POST':
         data = request.json
         
-        if 'deadline' in data:
-            settings['deadline'] = data['deadline']
+        if 'allocation_mode' in data and data['allocation_mode'] not in ALLOCATION_MODES:
+            return jsonify({'error': f'Unknown allocation mode: {data["allocation_mode"]}'}), 400
         
-        if 'is_locked' in data:
-            settings['is_locked'] = data['is_locked']
+        # [{"name": ..., "weeks"/"days"/"kinds"/"dates"/"shift_ids": [...], "max_slots": N}, ...]
+        if 'allocation_caps' in data:
+            try:
+                parse_caps(data['allocation_caps'], SHIFTS)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
         
-        save_json(SETTINGS_FILE, settings)
+        def apply(settings):
+            if 'deadline' in data:
+                settings['deadline'] = data['deadline']
+            
+            if 'is_locked' in data:
+                settings['is_locked'] = data['is_locked']
+            
+            if 'allocation_mode' in data:
+                settings['allocation_mode'] = data['allocation_mode']
+            
+            if 'allocation_caps' in data:
+                settings['allocation_caps'] = data['allocation_caps']
+            
+            if 'allocation_trading' in data:
+                settings['allocation_trading'] = bool(data['allocation_trading'])
+        
+        # Locked read-modify-write so concurrent changes are not lost
+        storage.update('settings', apply)
         return jsonify({'success': True})
     
-    return jsonify(settings)
+    return jsonify(get_settings())
+
+def run_allocation(mode, seeds, preferences, matrix, reporters_data, shifts, caps, trade=False, progress=None):
+    """Run the draws and pick one; returns (response payload, allocation meta, decision trace)"""
+    # Placements go to each draw's trace; a single draw logs its phases and
+    # totals, multiple draws only the summary
+    all_draws = allocate_draws(reporters_data, preferences, shifts, seeds, mode=mode,
+                               workers=ALLOCATION_WORKERS, matrix=matrix,
+                               log=print if len(seeds) == 1 else None, progress=progress, caps=caps,
+                               trade=trade, trace=True)
+    traces = {draw[0]: draw[1].pop('trace') for draw in all_draws}
+    chosen = best_draw(all_draws)
+    front = pareto_front(all_draws)
+    trace = traces[chosen[0]].to_dict(caps, seed=chosen[0])
+    
+    summaries = [draw_summary(draw) for draw in all_draws]
+    if len(seeds) > 1:
+        print(f"\n=== {len(seeds)} DRAWS ({mode.upper()}) ===")
+        for summary in summaries:
+            marker = '★' if summary['seed'] == chosen[0] else ' '
+            print(f"{marker} seed {summary['seed']:10}: {summary['assigned']} assigned, "
+                  f"{summary['top_10']} top 10, mean rank {summary['mean_rank']}, "
+                  f"{summary['bottom_5_violations']} bottom 5")
+    
+    # Every seed is recorded so the allocation can be reproduced and audited
+    meta = {
+        'mode': mode,
+        'allocator_version': ALLOCATOR_VERSION,
+        'seed': chosen[0],
+        'draws': summaries,
+        'pareto_seeds': [draw[0] for draw in front]
+    }
+    if 'trading' in chosen[1]:
+        meta['trading'] = chosen[1]['trading']
+    payload = {'success': True, **chosen[1], 'seed': chosen[0], 'draws': summaries,
+               'pareto': [draw_summary(draw) for draw in front]}
+    return payload, meta, trace
+
+def save_allocation(assignments, meta, trace=None):
+    """Save assignments, lock preferences and record how they were drawn (and each decision)"""
+    storage.commit_allocation(assignments)
+    save_json(ALLOCATION_META_PATH, dict(meta, allocated_at=datetime.now().isoformat()))
+    # Results cached before traces were kept have none; don't leave an older allocation's
+    save_json(ALLOCATION_TRACE_PATH, trace or {})
+    # Open swap offers were for the shifts of the old allocation
+    swaps.clear()
 
 @app.route('/api/allocate', methods=['POST'])
 def allocate_shifts():
     if not session.get('is_manager'):
         return jsonify({'error': 'Unauthorized'}), 403
     
-    # Create backup before allocation
-    create_auto_backup()
+    # 'greedy' (default) or 'optimal'; the request overrides the saved setting
+    options = request.get_json(silent=True) or {}
+    settings = get_settings()
+    mode = options.get('mode') or settings.get('allocation_mode', 'greedy')
+    if mode not in ALLOCATION_MODES:
+        return jsonify({'error': f'Unknown allocation mode: {mode}'}), 400
+    
+    # {"draws": N} runs N independent draws and keeps the best one;
+    # {"seed": S} reproduces a recorded draw
+    draws = options.get('draws', 1)
+    seed = options.get('seed')
+    if seed is not None:
+        if not isinstance(seed, int) or isinstance(seed, bool) or seed < 0:
+            return jsonify({'error': 'seed must be a non-negative integer'}), 400
+        seeds = [seed]
+    else:
+        if not isinstance(draws, int) or isinstance(draws, bool) or not 1 <= draws <= MAX_DRAWS:
+            return jsonify({'error': f'draws must be between 1 and {MAX_DRAWS}'}), 400
+        seeds = [secrets.randbits(32) for _ in range(draws)]
+    
+    # {"trade": true} finishes each draw with a top trading cycles pass
+    trade = bool(options.get('trade', settings.get('allocation_trading', False)))
     
-    preferences = get_preferences()
+    # Caps were checked when saved, but optimal mode also needs them nested
+    shifts = get_shifts(settings)
+    try:
+        caps = get_caps(settings, shifts)
+        if mode == 'optimal':
+            cap_tree(caps)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # {"preview": true} runs the allocator without saving or locking anything.
+    # Results are memoised under a hash of their inputs (see previews.py), so
+    # the same preview, or an allocation with a seed that was run before, is
+    # served from the cache
+    preview = bool(options.get('preview'))
+    key = preview_key(*get_input_hashes(), settings, caps, mode,
+                      [seed] if seed is not None else None, draws, trade)
+    preview_id = previews.preview_id(key)
+    cached = previews.get(preview_id) if preview or seed is not None else None
+    if cached is not None:
+        if preview:
+            return jsonify(dict(cached['payload'], preview=True, preview_id=preview_id, cached=True))
+        backup_worker.backup_now()
+        save_allocation(cached['payload']['assignments'], dict(cached['meta'], inputs=cached['key'],
+                                                               result_id=preview_id), cached.get('trace'))
+        print(f"♻️ Seed {seed}: same inputs as result {preview_id}, saved without re-running")
+        return jsonify(dict(cached['payload'], result_id=preview_id, cached=True))
+    
+    def work(progress):
+        if not preview:
+            # Create backup before allocation (synchronous - we are about to overwrite)
+            progress('backup', 0)
+            backup_worker.backup_now()
+        progress('compiling preferences', 0)
+        hashes = get_input_hashes()
+        preferences, matrix = get_compiled_preferences()
+        reporters_data = get_reporters()
+        if get_input_hashes() != hashes:
+            # Changed while loading: hash exactly what is being allocated
+            hashes = (preferences_hash(preferences)[0], reporters_hash(reporters_data))
+        payload, meta, trace = run_allocation(mode, seeds, preferences, matrix, reporters_data,
+                                              shifts, caps, trade, progress)
+        
+        # Memoised under the data actually allocated and, unless it is a
+        # preview without a seed, the seeds
+        result_key = preview_key(*hashes, settings, caps, mode,
+                                 None if preview and seed is None else seeds, draws, trade)
+        result_id = previews.preview_id(result_key)
+        previews.put(result_id, {'key': result_key, 'created': datetime.now().isoformat(),
+                                 'payload': payload, 'meta': meta, 'trace': trace})
+        if preview:
+            return dict(payload, preview=True, preview_id=result_id, cached=False)
+        
+        progress('saving', 100)
+        save_allocation(payload['assignments'], dict(meta, inputs=result_key, result_id=result_id), trace)
+        return dict(payload, result_id=result_id)
+    
+    # The allocation runs in the background: poll status_url, then fetch
+    # the result. The same request while it runs attaches to the same job.
+    description = f"{'Preview' if preview else 'Allocation'} ({mode}, {len(seeds)} draw(s))"
+    try:
+        job, attached = jobs.submit(dict(key, preview=preview), work, description)
+    except JobBusy as e:
+        running = e.job or {}
+        return jsonify({'error': 'Another allocation is already running - wait for it to finish',
+                        'job_id': running.get('id')}), 409
+    print(f"⏳ {description}: job {job['id']}{' (attached)' if attached else ''}")
+    return jsonify({'success': True, 'job_id': job['id'], 'attached': attached,
+                    'status_url': url_for('allocation_job', job_id=job['id'])}), 202
+
+def _job_status(job):
+    """What a status poll shows: everything but the inputs and the result"""
+    return {k: v for k, v in job.items() if k not in ('key', 'result')}
+
+@app.route('/api/allocate/jobs/<job_id>')
+def allocation_job(job_id):
+    """Phase and percent done of an allocation job (ADMIN ONLY)"""
+    if not session.get('is_manager'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    status = _job_status(job)
+    status['result_url'] = url_for('allocation_job_result', job_id=job_id)
+    return jsonify(status)
+
+@app.route('/api/allocate/jobs/<job_id>/result')
+def allocation_job_result(job_id):
+    """The finished job's response, as /api/allocate used to return it (ADMIN ONLY)"""
+    if not session.get('is_manager'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job['state'] == 'failed':
+        return jsonify({'error': f"Allocation failed: {job['error']}", 'job': _job_status(job)}), 500
+    if job['state'] != 'done':
+        return jsonify({'error': 'Allocation is still running', 'job': _job_status(job)}), 409
+    return jsonify(job['result'])
+
+@app.route('/api/allocate/commit', methods=['POST'])
+def commit_preview():
+    """Save a preview's assignments exactly as previewed (no re-run)"""
+    if not session.get('is_manager'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    options = request.get_json(silent=True) or {}
+    stored = previews.get(options.get('preview_id'))
+    if stored is None:
+        return jsonify({'error': 'Preview not found - run the preview again'}), 404
+    
+    # A preview of older preferences would drop the submissions made since
+    if not is_current(stored['key'], *get_input_hashes()):
+        return jsonify({'error': 'Preferences or reporters changed since this preview - run it again'}), 409
+    
+    backup_worker.backup_now()
+    save_allocation(stored['payload']['assignments'], dict(stored['meta'], inputs=stored['key'],
+                                                           preview_id=options['preview_id']), stored.get('trace'))
+    return jsonify(dict(stored['payload'], committed_from_preview=options['preview_id']))
+
+# (assignments version, settings version, AllocationIndex) for this worker,
+# kept up to date by repairs
+_allocation_index = None
+
+@app.route('/api/repair-allocation', methods=['POST'])
+def repair_allocation():
+    """Apply late changes to the current allocation without re-running it.
+    
+    Body: {"remove": [...], "add": [...], "changed": [...], "capacity": {shift id: slots},
+    "trade": true/false}
+    Only the reporters and shifts involved (and at most one other reporter
+    per placement) are moved, plus any trades if "trade" is set.
+    """
+    global _allocation_index
+    if not session.get('is_manager'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    data = request.get_json(silent=True) or {}
     reporters_data = get_reporters()
+    delta = {}
+    for field in ('remove', 'add', 'changed'):
+        usernames = data.get(field, [])
+        if not isinstance(usernames, list):
+            return jsonify({'error': f'{field} must be a list of usernames'}), 400
+        unknown = [u for u in usernames if u not in reporters_data and field != 'remove']
+        if unknown:
+            return jsonify({'error': f'Unknown reporters: {", ".join(map(str, unknown))}'}), 400
+        delta[field] = usernames
+    try:
+        capacity = {int(shift_id): int(slots) for shift_id, slots in (data.get('capacity') or {}).items()}
+    except (TypeError, ValueError, AttributeError):
+        return jsonify({'error': 'capacity must map shift ids to slot counts'}), 400
     
-    # Week 21 capacity limit
-    WEEK_21_MAX_SLOTS = 3
-    
-    # Get list of non-manager reporters
-    reporter_list = [user for user, rep in reporters_data.items() if not rep.get('is_manager') and user != 'test']
-    
-    # Separate reporters into those WITH and WITHOUT preferences
-    reporters_with_prefs = []
-    reporters_without_prefs = []
-    warnings = []
-    
-    for rep in reporter_list:
-        if rep in preferences:
-            prefs = preferences[rep]
-            if len(prefs.get('top_10', [])) == 10 and len(prefs.get('bottom_5', [])) == 5:
-                reporters_with_prefs.append(rep)
-            else:
-                reporters_without_prefs.append(rep)
-                rep_name = reporters_data[rep]['name']
-                warnings.append(f"{rep_name} has incomplete preferences - will be randomly assigned")
+    backup_worker.backup_now()
+    preferences, matrix = get_compiled_preferences()
+    settings_version = storage.version('settings')
+    settings = get_settings()
+    shifts = get_shifts(settings)
+    try:
+        caps = get_caps(settings, shifts)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # repair() changes the cached index in place, so it is only valid again
+    # once the write has succeeded
+    cached = _allocation_index
+    _allocation_index = None
+    
+    def apply(assignments):
+        if cached is not None and cached[:2] == (storage.version('assignments'), settings_version):
+            index = cached[2]
         else:
-            reporters_without_prefs.append(rep)
-            rep_name = reporters_data[rep]['name']
-            warnings.append(f"{rep_name} did not submit preferences - will be randomly assigned")
-    
-    # Initialize assignments
-    assignments = {rep: [] for rep in reporter_list}
-    shift_assignments = {shift['id']: [] for shift in SHIFTS}
-    
-    # Use truly random shuffle (no fixed seed)
-    # This ensures no one can claim the allocation was predetermined
-    
-    # PHASE 1: Allocate for reporters WITH preferences
-    # Strategy: Fill weeks 1-20 (shifts 0-79), allow week 21 (shifts 80-83) up to 3 slots total
-    print("\n=== PHASE 1: TOP 10 PREFERENCES (CAP WEEK 21 AT 3 SLOTS) ===")
-    print("Strategy: Fill weeks 1-20 (shifts 0-79) completely, allow week 21 up to 3 slots")
-    
-    shuffled_reporters = reporters_with_prefs.copy()
-    random.shuffle(shuffled_reporters)
-    
-    # Assign one shift to each reporter
-    for rep in shuffled_reporters:
-        prefs = preferences[rep]
-        top_10 = prefs['top_10']
-        bottom_5 = prefs['bottom_5']
-        
-        # Try to assign from top 10 preferences (any week, but cap week 21 at 3 total slots)
-        assigned = False
-        
-        for shift_id in top_10:
-            shift = next(s for s in SHIFTS if s['id'] == shift_id)
-            
-            # Check if shift is full
-            if len(shift_assignments[shift_id]) >= shift['slots']:
-                continue
-            
-            # Special handling for week 21 (shifts 80-83)
-            if shift_id >= 80:
-                # Count total slots used in week 21
-                week21_total = sum(len(shift_assignments[s['id']]) for s in SHIFTS if s['id'] >= 80)
-                
-                if week21_total >= WEEK_21_MAX_SLOTS:
-                    continue  # Week 21 is at capacity, skip this shift
-            
-            # Assign shift
-            assignments[rep].append(shift_id)
-            shift_assignments[shift_id].append(rep)
-            assigned = True
-            rank = top_10.index(shift_id) + 1
-            week_label = f"week {shift['week']}" if shift['week'] <= 20 else "WEEK 21"
-            print(f"✓ {rep:30} → Shift {shift_id:2} ({week_label}, preference #{rank})")
-            break
-        
-        # PHASE 2: Fallback (non-bottom-5 shifts in weeks 1-20 ONLY)
-        if not assigned:
-            shift_type_pref = prefs.get('shift_type_pref', {})
-            sorted_types = sorted(shift_type_pref.items(), key=lambda x: x[1])
-            
-            for shift_type, _ in sorted_types:
-                for shift in SHIFTS:
-                    shift_id = shift['id']
-                    
-                    # ONLY weeks 1-20 for fallback
-                    if shift_id >= 80:
-                        continue
-                    
-                    if shift_id in bottom_5 or shift_id in top_10:
-                        continue
-                    
-                    # Check shift type match (support both OLD and NEW structures)
-                    shift_matches = False
-                    # OLD structure: 'saturday' matches any Saturday
-                    if shift_type == 'saturday' and shift['day'] == 'Saturday':
-                        shift_matches = True
-                    # NEW structure: 'saturday_morning' and 'saturday_evening'
-                    elif shift_type == 'saturday_morning' and shift['day'] == 'Saturday' and '8:00 AM' in shift['time']:
-                        shift_matches = True
-                    elif shift_type == 'saturday_evening' and shift['day'] == 'Saturday' and '3:00 PM' in shift['time']:
-                        shift_matches = True
-                    # Both structures: Sunday shifts
-                    elif shift_type == 'sunday_morning' and shift['day'] == 'Sunday' and '8:00 AM' in shift['time']:
-                        shift_matches = True
-                    elif shift_type == 'sunday_evening' and shift['day'] == 'Sunday' and '3:00 PM' in shift['time']:
-                        shift_matches = True
-                    
-                    if not shift_matches:
-                        continue
-                    
-                    if len(shift_assignments[shift_id]) >= shift['slots']:
-                        continue
-                    
-                    assignments[rep].append(shift_id)
-                    shift_assignments[shift_id].append(rep)
-                    assigned = True
-                    print(f"⚠ {rep:30} → Shift {shift_id:2} (week {shift['week']}, fallback)")
-                    break
-                
-                if assigned:
-                    break
-        
-        # PHASE 3: Emergency assignment (ANY shift in weeks 1-20, even bottom 5)
-        if not assigned:
-            for shift in SHIFTS:
-                shift_id = shift['id']
-                
-                # ONLY weeks 1-20 (shifts 0-79)
-                if shift_id >= 80:
-                    continue
-                
-                if len(shift_assignments[shift_id]) >= shift['slots']:
-                    continue
-                
-                assignments[rep].append(shift_id)
-                shift_assignments[shift_id].append(rep)
-                assigned = True
-                print(f"🚨 {rep:30} → Shift {shift_id:2} (week {shift['week']}, EMERGENCY)")
-                break
-        
-        if not assigned:
-            print(f"✗ {rep:30} → Could not assign shift - CRITICAL ERROR")
-            warnings.append(f"{reporters_data[rep]['name']} could not be assigned - critical error!")
+            index = AllocationIndex(assignments, shifts, caps)
+        outcome = repair(index, preferences, matrix, reporters_data, capacity=capacity,
+                         trade=bool(data.get('trade')), **delta)
+        for username in outcome['removed']:
+            assignments.pop(username, None)
+        assignments.update(outcome['assignments'])
+        return outcome, index
+    
+    outcome, index = storage.update('assignments', apply)
+    
+    # Keep slot changes for later allocations, previews and repairs
+    if capacity:
+        def save_slots(settings):
+            slots = settings.setdefault('shift_slots', {})
+            for shift_id in capacity:
+                if shift_id in index.slots:
+                    slots[str(shift_id)] = index.slots[shift_id]
+        storage.update('settings', save_slots)
+    
+    # Assignments and settings are only written by manager actions, so
+    # nothing else can land between the updates and these reads
+    _allocation_index = (storage.version('assignments'), storage.version('settings'), index)
+    return jsonify({'success': True, **outcome})
+
+@app.route('/api/allocation-meta')
+def allocation_meta():
+    """Seeds and scores of the draws behind the current allocation (ADMIN ONLY)"""
+    if not session.get('is_manager'):
+        return jsonify({'error': 'Unauthorized'}), 403
     
-    # PHASE 4: Random allocation for reporters WITHOUT preferences
-    if reporters_without_prefs:
-        print("\n=== PHASE 4: RANDOM ALLOCATION (NO PREFERENCES) ===")
-        
-        # Assign 1 shift to each reporter in weeks 1-20 only
-        for rep in reporters_without_prefs:
-            # Create pool of available shifts in weeks 1-20 (shifts 0-79)
-            available_shifts = []
-            
-            for shift in SHIFTS:
-                shift_id = shift['id']
-                
-                # ONLY weeks 1-20 (shifts 0-79)
-                if shift_id >= 80:
-                    continue
-                
-                filled = len(shift_assignments[shift_id])
-                capacity = shift['slots']
-                
-                if filled < capacity:
-                    available_shifts.append(shift_id)
-            
-            # Assign random shift
-            if available_shifts:
-                random.shuffle(available_shifts)
-                shift_id = available_shifts[0]
-                shift = next(s for s in SHIFTS if s['id'] == shift_id)
-                assignments[rep].append(shift_id)
-                shift_assignments[shift_id].append(rep)
-                print(f"🎲 {rep:30} → Shift {shift_id:2} (week {shift['week']}, random)")
-            else:
-                print(f"✗ {rep:30} → No shifts available")
-                warnings.append(f"{reporters_data[rep]['name']} could not be assigned - no capacity remaining")
-    
-    # Save assignments
-    save_json(ASSIGNMENTS_FILE, assignments)
-    
-    # Lock preferences
-    settings = get_settings()
-    settings['is_locked'] = True
-    save_json(SETTINGS_FILE, settings)
+    if not os.path.exists(ALLOCATION_META_PATH):
+        return jsonify({})
+    return jsonify(load_json(ALLOCATION_META_PATH))
+
+@app.route('/api/allocation-trace')
+def allocation_trace():
+    """Why each reporter got their shift in the current allocation (ADMIN ONLY).
+    
+    ?reporter=X explains X's placement; ?phase= (top_10, fallback, ...) and
+    ?shift_id= list matching decisions (at most ?limit=, default 100).
+    Without any of them, the counts per phase.
+    """
+    if not session.get('is_manager'):
+        return jsonify({'error': 'Unauthorized'}), 403
     
-    # Verify results
-    total_assigned = len([a for a in assignments.values() if a])
-    weeks_1_20_filled = sum(len(shift_assignments[s['id']]) for s in SHIFTS if s['id'] < 80)
-    week21_filled = sum(len(shift_assignments[s['id']]) for s in SHIFTS if s['id'] >= 80)
+    trace = load_json(ALLOCATION_TRACE_PATH) if os.path.exists(ALLOCATION_TRACE_PATH) else {}
+    if not trace.get('columns'):
+        return jsonify({'error': 'No decision trace for the current allocation - run it again'}), 404
+    summary = {k: trace[k] for k in ('mode', 'seed', 'counts')}
+    
+    reporter = request.args.get('reporter')
+    if reporter:
+        decisions = explain(trace, reporter)
+        if not decisions:
+            return jsonify({'error': f'{reporter} is not in the allocation'}), 404
+        return jsonify(dict(summary, reporter=reporter, decisions=decisions))
+    
+    phase = request.args.get('phase')
+    if phase is not None and phase not in PHASES:
+        return jsonify({'error': f'phase must be one of {", ".join(PHASES)}'}), 400
+    shift_id = request.args.get('shift_id')
+    try:
+        shift_id = int(shift_id) if shift_id is not None else None
+        limit = max(1, int(request.args.get('limit', 100)))
+    except ValueError:
+        return jsonify({'error': 'shift_id and limit must be numbers'}), 400
+    if phase is None and shift_id is None:
+        return jsonify(summary)
+    return jsonify(dict(summary, decisions=select(trace, phase, shift_id, limit)))
+
+def execute_swap(trades):
+    """Apply one swap to the assignments; returns the usernames whose side of it no longer holds"""
+    def apply(assignments):
+        stale = [username for username, given, taken in trades
+                 if given not in assignments.get(username, []) or taken in assignments.get(username, [])]
+        if stale:
+            raise AbortUpdate(stale)
+        for username, given, taken in trades:
+            held = assignments[username]
+            held[held.index(given)] = taken
     
-    print(f"\n=== ALLOCATION COMPLETE ===")
-    print(f"Total reporters: {len(reporter_list)}")
-    print(f"Assigned: {total_assigned}")
-    print(f"Weeks 1-20: {weeks_1_20_filled}/120")
-    print(f"Week 21: {week21_filled}/6 (target: 3)")
+    try:
+        storage.update('assignments', apply)
+    except AbortUpdate as e:
+        return e.args[0]
+    return []
+
+@app.route('/api/swaps', methods=['GET', 'POST'])
+def swap_offers():
+    """Shift swap offers (a reporter sees their own, the manager sees all).
+    
+    POST {"shift_id": 12, "wants": [40, 41]} offers one of your assigned
+    shifts for any of the wanted ones (best first). If the offer completes
+    a direct swap or a three-way chain with open offers, the swap is made
+    at once; otherwise it stays open until one comes along.
+    """
+    if 'username' not in session:
+        return jsonify({'error': 'Unauthorized'}), 403
+    username = session['username']
     
-    return jsonify({
-        'success': True,
-        'assignments': assignments,
-        'shift_assignments': shift_assignments,
-        'warnings': warnings,
-        'reporters_with_prefs': len(reporters_with_prefs),
-        'reporters_without_prefs': len(reporters_without_prefs),
-        'stats': {
-            'total_assigned': total_assigned,
-            'weeks_1_20_filled': weeks_1_20_filled,
-            'week21_filled': week21_filled
-        }
-    })
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            shift_id = int(data.get('shift_id'))
+            wants = list(dict.fromkeys(int(s) for s in data.get('wants') or []))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'shift_id and wants must be shift ids'}), 400
+        held = get_assignments().get(username, [])
+        if shift_id not in held:
+            return jsonify({'error': f'You are not assigned shift {shift_id}'}), 400
+        if not wants:
+            return jsonify({'error': 'List at least one shift you would take instead'}), 400
+        unknown = [s for s in wants if SHIFTS.get(s) is None]
+        if unknown:
+            return jsonify({'error': f'Unknown shifts: {", ".join(map(str, unknown))}'}), 400
+        if any(s in held for s in wants):
+            return jsonify({'error': 'You already hold one of the shifts you asked for'}), 400
+        
+        try:
+            offer, swap = swaps.post(username, shift_id, wants, execute_swap)
+        except SwapError as e:
+            return jsonify({'error': str(e)}), 409
+        return jsonify({'success': True, 'offer': offer, 'swap': swap})
+    
+    data = swaps.load()
+    offers = list(data['offers'].values())
+    executed = data['swaps']
+    if not session.get('is_manager'):
+        offers = [o for o in offers if o['username'] == username]
+        executed = [s for s in executed if any(t['username'] == username for t in s['trades'])]
+    return jsonify({'offers': offers, 'swaps': executed})
+
+@app.route('/api/swaps/<offer_id>/cancel', methods=['POST'])
+def cancel_swap_offer(offer_id):
+    """Withdraw an open offer (your own; the manager may withdraw any)"""
+    if 'username' not in session:
+        return jsonify({'error': 'Unauthorized'}), 403
+    owner = None if session.get('is_manager') else session['username']
+    offer = swaps.cancel(offer_id, owner)
+    if offer is None:
+        return jsonify({'error': 'No such open offer'}), 404
+    return jsonify({'success': True, 'offer': offer})
 
 @app.route('/api/backup')
 def backup_data():
-    """Download all data files as JSON for backup"""
+    """Download all data as a compressed backup archive"""
     if not session.get('is_manager'):
         return jsonify({'error': 'Unauthorized'}), 403
     
-    backup_data = {
+    datasets = {
         'reporters': get_reporters(),
         'preferences': get_preferences(),
         'settings': get_settings(),
-        'assignments': get_assignments(),
-        'timestamp': datetime.now().isoformat()
+        'assignments': get_assignments()
     }
     
-    from io import BytesIO
-    output = BytesIO()
-    output.write(json.dumps(backup_data, indent=2).encode('utf-8'))
-    output.seek(0)
-    
-    return send_file(
-        output,
-        mimetype='application/json',
-        as_attachment=True,
-        download_name=f'backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json'
+    # Streamed chunk by chunk instead of building the whole file in memory
+    filename = f'backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.jsonl.gz'
+    return Response(
+        iter_archive(datasets),
+        mimetype='application/gzip',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
     )
 
 @app.route('/api/populate-test-data', methods=['POST'])
@@ -657,154 +868,40 @@ def populate_test_data():
         }
     
     # Save preferences
-    save_json(PREFERENCES_FILE, preferences)
+    storage.save('preferences', preferences)
     
     return jsonify({
         'success': True,
         'message': f'Populated random preferences for {len(preferences)} reporters'
     })
 
+# (content hashes of the assignments, preferences, reporters and settings, .xlsx bytes) for this worker
+_schedule_export = None
+
+def _schedule_export_key():
+    return (get_content_hash('assignments'), *get_input_hashes(), get_content_hash('settings'))
+
 @app.route('/api/export-excel')
 def export_excel():
+    global _schedule_export
     if not session.get('is_manager'):
         return jsonify({'error': 'Unauthorized'}), 403
     
     try:
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, PatternFill, Alignment
-        from io import BytesIO
-        
-        assignments = get_assignments()
-        reporters = get_reporters()
-        preferences = get_preferences()
-        
-        # Create workbook
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Reporter Schedule"
-        
-        # Title
-        ws['A1'] = 'Weekend Reporter Shift Schedule - Dec 2025 - Apr 2026'
-        ws['A1'].font = Font(size=16, bold=True)
-        ws.merge_cells('A1:H1')
-        
-        # Headers
-        headers = ['Date', 'Day', 'Time', 'Assigned Reporters', 'Preference Rank', 'Status', 'Week', 'Notes']
-        header_row = 3
-        for col, header in enumerate(headers, start=1):
-            cell = ws.cell(row=header_row, column=col)
-            cell.value = header
-            cell.font = Font(bold=True, color="FFFFFF")
-            cell.fill = PatternFill(start_color="FF6B35", end_color="FF6B35", fill_type="solid")
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-        
-        # Data
-        row = header_row + 1
-        for shift in SHIFTS:
-            shift_id = shift['id']
-            assigned = []
-            
-            for rep, rep_shifts in assignments.items():
-                if shift_id in rep_shifts:
-                    assigned.append(rep)
-            
-            ws.cell(row=row, column=1).value = shift['date']
-            ws.cell(row=row, column=2).value = shift['day']
-            ws.cell(row=row, column=3).value = shift['time']
-            
-            # Assigned reporters (can be 0, 1, or 2)
-            if assigned:
-                rep_names = []
-                pref_ranks = []
-                for rep in assigned:
-                    rep_names.append(reporters[rep]['name'])
-                    
-                    if rep in preferences:
-                        prefs = preferences[rep]
-                        if shift_id in prefs.get('top_10', []):
-                            rank = prefs['top_10'].index(shift_id) + 1
-                            pref_ranks.append(f"#{rank}")
-                        elif shift_id in prefs.get('bottom_5', []):
-                            pref_ranks.append("Bottom-5")
-                        else:
-                            pref_ranks.append("N/A")
-                    else:
-                        pref_ranks.append("N/A")
-                
-                ws.cell(row=row, column=4).value = ", ".join(rep_names)
-                ws.cell(row=row, column=5).value = ", ".join(pref_ranks)
-            else:
-                ws.cell(row=row, column=4).value = "VACANT"
-                ws.cell(row=row, column=4).font = Font(color="FF0000", bold=True)
-            
-            # Status
-            filled = len(assigned)
-            total = shift['slots']
-            if filled >= total:
-                ws.cell(row=row, column=6).value = "FILLED"
-                ws.cell(row=row, column=6).fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
-            else:
-                ws.cell(row=row, column=6).value = f"VACANT ({total - filled})"
-                ws.cell(row=row, column=6).fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
-            
-            ws.cell(row=row, column=7).value = shift['week']
-            
-            row += 1
-        
-        # Reporter summary
-        row += 2
-        ws.cell(row=row, column=1).value = "Reporter Summary"
-        ws.cell(row=row, column=1).font = Font(size=14, bold=True)
-        
-        row += 1
-        summary_headers = ['Reporter', 'Shifts Assigned', 'Shift Details', 'Status']
-        for col, header in enumerate(summary_headers, start=1):
-            cell = ws.cell(row=row, column=col)
-            cell.value = header
-            cell.font = Font(bold=True, color="FFFFFF")
-            cell.fill = PatternFill(start_color="FF6B35", end_color="FF6B35", fill_type="solid")
-        
-        row += 1
-        for rep, rep_data in reporters.items():
-            if rep_data.get('is_manager'):
-                continue
-            
-            ws.cell(row=row, column=1).value = rep_data['name']
-            
-            rep_shifts = assignments.get(rep, [])
-            ws.cell(row=row, column=2).value = len(rep_shifts)
-            
-            shift_details = []
-            for shift_id in rep_shifts:
-                shift = next(s for s in SHIFTS if s['id'] == shift_id)
-                shift_details.append(f"{shift['date']} {shift['day']} {shift['time']}")
-            ws.cell(row=row, column=3).value = "; ".join(shift_details) if shift_details else "None"
-            
-            if len(rep_shifts) == 1:
-                ws.cell(row=row, column=4).value = "Complete"
-                ws.cell(row=row, column=4).fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
-            else:
-                ws.cell(row=row, column=4).value = f"Incomplete ({len(rep_shifts)}/1)"
-                ws.cell(row=row, column=4).fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
-            
-            row += 1
-        
-        # Adjust column widths
-        ws.column_dimensions['A'].width = 12
-        ws.column_dimensions['B'].width = 12
-        ws.column_dimensions['C'].width = 20
-        ws.column_dimensions['D'].width = 30
-        ws.column_dimensions['E'].width = 15
-        ws.column_dimensions['F'].width = 15
-        ws.column_dimensions['G'].width = 10
-        ws.column_dimensions['H'].width = 30
-        
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
+        # The same saved allocation downloads the same file, built once
+        key = _schedule_export_key()
+        cached = _schedule_export
+        if cached is not None and cached[0] == key:
+            data = cached[1]
+        else:
+            _, matrix = get_compiled_preferences()
+            data = schedule_workbook(get_assignments(), get_reporters(), matrix, get_shifts())
+            if _schedule_export_key() == key:
+                _schedule_export = (key, data)
         
+        from io import BytesIO
         return send_file(
-            output,
+            BytesIO(data),
             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
             as_attachment=True,
             download_name=f'reporter_schedule_{datetime.now().strftime("%Y%m%d")}.xlsx'
@@ -837,12 +934,24 @@ def change_password():
     if username not in reporters:
         return jsonify({'error': 'User not found'}), 404
     
-    if not check_password_hash(reporters[username]['password'], current_password):
+    verified_hash = reporters[username]['password']
+    if not check_password_hash(verified_hash, current_password):
         return jsonify({'error': 'Current password is incorrect'}), 401
     
-    # Update password
-    reporters[username]['password'] = generate_password_hash(new_password)
-    save_json(REPORTERS_FILE, reporters)
+    # Hash outside the lock - it is deliberately slow
+    new_hash = generate_password_hash(new_password)
+    
+    def apply(reporters):
+        # Someone changed this password since we verified it
+        if username not in reporters or reporters[username]['password'] != verified_hash:
+            raise AbortUpdate()
+        reporters[username]['password'] = new_hash
+    
+    # Update password (locked read-modify-write)
+    try:
+        storage.update('reporters', apply)
+    except AbortUpdate:
+        return jsonify({'error': 'Password was changed by another session, please try again'}), 409
     
     return jsonify({'success': True, 'message': 'Password changed successfully'})
 
@@ -1002,8 +1111,8 @@ def reload_reporters_from_csv():
                 'password': generate_password_hash(password)
             }
         
-        # Save to reporters.json
-        save_json(REPORTERS_FILE, reporters)
+        # Save reporter accounts
+        storage.save('reporters', reporters)
         
         return jsonify({
             'success': True,
@@ -1021,19 +1130,19 @@ def reset_data():
         return jsonify({'error': 'Unauthorized'}), 403
     
     try:
-        # Create backup before resetting
-        create_auto_backup()
+        # Create backup before resetting (synchronous - we are about to clear data)
+        backup_worker.backup_now()
         
         # Clear preferences
-        save_json(PREFERENCES_FILE, {})
+        storage.save('preferences', {})
         
         # Clear assignments
-        save_json(ASSIGNMENTS_FILE, {})
+        storage.save('assignments', {})
         
         # Unlock preferences
-        settings = get_settings()
-        settings['is_locked'] = False
-        save_json(SETTINGS_FILE, settings)
+        def unlock(settings):
+            settings['is_locked'] = False
+        storage.update('settings', unlock)
         
         return jsonify({
             'success': True,
@@ -1049,7 +1158,7 @@ def trigger_backup():
     if not session.get('is_manager'):
         return jsonify({'error': 'Unauthorized'}), 403
     
-    success = create_auto_backup()
+    success = backup_worker.backup_now()
     if success:
         return jsonify({
             'success': True,
@@ -1065,27 +1174,102 @@ def list_backups():
         return jsonify({'error': 'Unauthorized'}), 403
     
     try:
-        backup_files = sorted([f for f in os.listdir(BACKUP_DIR) if f.startswith('auto_backup_')], reverse=True)
-        backups = []
-        
-        for filename in backup_files[:30]:  # Show last 30
-            filepath = os.path.join(BACKUP_DIR, filename)
-            stat = os.stat(filepath)
-            backups.append({
-                'filename': filename,
-                'size': stat.st_size,
-                'created': datetime.fromtimestamp(stat.st_mtime).isoformat()
-            })
+        backups = backup_store.list(limit=30)  # Show last 30
         
         return jsonify({
             'success': True,
             'backups': backups,
-            'total': len(backup_files)
+            'total': len(backup_store.filenames()),
+            'bytes_used': backup_store.usage(),
+            'bytes_budget': backup_retention.max_bytes
         })
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/restore-backup', methods=['POST'])
+def restore_backup():
+    """Restore data from a stored backup or an uploaded backup file (ADMIN ONLY)
+    
+    Send JSON {"filename": ...} to restore one of /api/list-backups, or upload
+    a file downloaded from /api/backup (as the request body or a 'file' field).
+    The current data is backed up first.
+    """
+    if not session.get('is_manager'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    try:
+        if request.is_json:
+            filename = (request.get_json(silent=True) or {}).get('filename', '')
+            backup = backup_store.load(filename)
+            timestamp = backup.pop('timestamp', None)
+            datasets = {name: backup[name] for name in backup if name in DATASETS}
+            validate_datasets(datasets)
+        elif 'file' in request.files:
+            datasets, timestamp = read_archive(request.files['file'].stream)
+        else:
+            datasets, timestamp = read_archive(request.stream)
+    except FileNotFoundError:
+        return jsonify({'error': 'Backup not found'}), 404
+    except ValueError as e:
+        return jsonify({'error': f'Invalid backup: {e}'}), 400
+    
+    if not backup_worker.backup_now():
+        return jsonify({'error': 'Could not back up current data; restore cancelled'}), 500
+    
+    storage.replace_all(datasets)
+    
+    return jsonify({
+        'success': True,
+        'backup_timestamp': timestamp,
+        'restored': {name: len(data) for name, data in datasets.items()}
+    })
+
+@app.route('/api/verify-backups')
+def verify_backups():
+    """Check stored backups against the catalog (ADMIN ONLY)
+    
+    ?deep=1 also re-hashes every backup object. ?repair=1 first rebuilds the
+    catalog from the files on disk.
+    """
+    if not session.get('is_manager'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    repair = backup_store.rebuild_catalog() if request.args.get('repair') == '1' else None
+    problems = backup_store.verify(deep=request.args.get('deep') == '1')
+    
+    return jsonify({
+        'success': True,
+        'ok': not problems,
+        'backups': len(backup_store.catalog()),
+        'problems': problems,
+        'repair': repair
+    })
+
+@app.route('/api/backup-status')
+def backup_status():
+    """Show how stale the latest backup is in this worker (ADMIN ONLY)"""
+    if not session.get('is_manager'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        'backup': backup_worker.status()
+    })
+
+@app.route('/api/cache-stats')
+def cache_stats():
+    """Show JSON cache hit/miss counters for this worker (ADMIN ONLY)"""
+    if not session.get('is_manager'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    return jsonify({
+        'success': True,
+        'backend': storage.name,
+        'cache': get_cache_stats()
+    })
+
 @app.route('/initialize-system', methods=['GET'])
 def initialize_system():
     """PUBLIC ENDPOINT: Initialize reporters.json from embedded credentials (NO AUTH REQUIRED)"""
@@ -1111,8 +1295,8 @@ def initialize_system():
                 'password': generate_password_hash(password)
             }
         
-        # Save to reporters.json
-        save_json(REPORTERS_FILE, reporters)
+        # Save reporter accounts
+        storage.save('reporters', reporters)
         
         return jsonify({
             'success': True,
@@ -1131,63 +1315,9 @@ def allocation_report():
         return jsonify({'error': 'Unauthorized'}), 403
     
     try:
-        preferences = get_preferences()
-        assignments = get_assignments()
-        reporters_data = get_reporters()
-        
-        # Analyze allocation results
-        rank_counts = {i: 0 for i in range(1, 11)}
-        fallback_count = 0
-        bottom_5_violations = []
-        fallback_reporters = []
-        
-        for username, assigned_shifts in assignments.items():
-            if not assigned_shifts or username not in preferences:
-                continue
-            
-            prefs = preferences[username]
-            top_10 = prefs.get('top_10', [])
-            bottom_5 = prefs.get('bottom_5', [])
-            
-            assigned_shift = assigned_shifts[0]
-            
-            # Check if in top_10
-            if assigned_shift in top_10:
-                rank = top_10.index(assigned_shift) + 1
-                rank_counts[rank] += 1
-            # Check if in bottom_5 (should never happen!)
-            elif assigned_shift in bottom_5:
-                bottom_5_violations.append({
-                    'name': reporters_data[username]['name'],
-                    'username': username,
-                    'shift_id': assigned_shift
-                })
-            # Fallback assignment
-            else:
-                fallback_count += 1
-                fallback_reporters.append({
-                    'name': reporters_data[username]['name'],
-                    'username': username,
-                    'shift_id': assigned_shift
-                })
-        
-        total_with_prefs = sum(1 for prefs in preferences.values() 
-                               if prefs and len(prefs.get('top_10', [])) == 10)
-        top_10_total = sum(rank_counts.values())
-        
-        return jsonify({
-            'success': True,
-            'statistics': {
-                'total_with_preferences': total_with_prefs,
-                'got_top_10': top_10_total,
-                'got_fallback': fallback_count,
-                'bottom_5_violations': len(bottom_5_violations),
-                'rank_breakdown': rank_counts,
-                'top_10_percentage': round(top_10_total / total_with_prefs * 100, 1) if total_with_prefs else 0
-            },
-            'fallback_reporters': fallback_reporters,
-            'bottom_5_violations': bottom_5_violations
-        })
+        # What the trading pass (if any) gained at allocation time
+        meta = load_json(ALLOCATION_META_PATH) if os.path.exists(ALLOCATION_META_PATH) else {}
+        return jsonify(allocation_report_data(get_allocation_score(), get_reporters(), meta.get('trading')))
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -1199,66 +1329,10 @@ def export_mailmerge():
         return jsonify({'error': 'Unauthorized'}), 403
     
     try:
-        import csv
-        from io import StringIO
-        
-        assignments = get_assignments()
-        reporters = get_reporters()
-        
-        # Build list of assignments in chronological order
-        shift_assignments = []
-        
-        for shift in SHIFTS:  # SHIFTS are already in chronological order
-            shift_id = shift['id']
-            
-            # Find who's assigned to this shift
-            for username, assigned_shifts in assignments.items():
-                if shift_id in assigned_shifts:
-                    reporter_name = reporters[username]['name']
-                    
-                    # Format date: "Dec. 14" from "2025-12-14"
-                    date_obj = datetime.strptime(shift['date'], '%Y-%m-%d')
-                    month = date_obj.strftime('%b.')
-                    day = str(date_obj.day)  # Removes leading zero automatically
-                    formatted_date = f"{month} {day}"
-                    
-                    # Format time: "8-4" from "8:00 AM - 4:00 PM"
-                    time_str = shift['time']
-                    if '8:00 AM - 4:00 PM' in time_str:
-                        time_formatted = '8-4'
-                    elif '3:00 PM - 10:00 PM' in time_str:
-                        time_formatted = '3-10'
-                    else:
-                        time_formatted = time_str  # Fallback
-                    
-                    # Format: "Saturday, Dec. 14, 8-4 ET"
-                    shift_formatted = f"{shift['day']}, {formatted_date}, {time_formatted} ET"
-                    
-                    shift_assignments.append({
-                        'reporter_name': reporter_name,
-                        'shift': shift_formatted,
-                        'date': shift['date']  # For sorting verification
-                    })
-        
-        # Create CSV
-        output = StringIO()
-        writer = csv.writer(output)
-        
-        # Write header
-        writer.writerow(['Reporter Name', 'Shift'])
-        
-        # Write data (already in chronological order)
-        for assignment in shift_assignments:
-            writer.writerow([assignment['reporter_name'], assignment['shift']])
-        
-        # Convert to bytes
-        output.seek(0)
-        csv_content = output.getvalue()
+        csv_content = mailmerge_csv(get_assignments(), get_reporters(), SHIFTS)
         
         from io import BytesIO
-        bytes_output = BytesIO()
-        bytes_output.write(csv_content.encode('utf-8'))
-        bytes_output.seek(0)
+        bytes_output = BytesIO(csv_content.encode('utf-8'))
         
         return send_file(
             bytes_output,
@@ -1291,14 +1365,11 @@ def upload_preferences_endpoint():
             return jsonify({'error': 'No preferences data provided'}), 400
         
         # Create backup of current preferences first
-        current_prefs = get_preferences()
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_file = os.path.join(BACKUP_DIR, f'manual_backup_before_upload_{timestamp}.json')
-        with open(backup_file, 'w') as f:
-            json.dump(current_prefs, f, indent=2)
+        backup_store.create({'preferences': get_preferences()}, prefix='manual_backup_before_upload',
+                            retention=backup_retention)
         
         # Save new preferences
-        save_json(PREFERENCES_FILE, new_preferences)
+        storage.save('preferences', new_preferences)
         
         return jsonify({
             'success': True,
@@ -0,0 +1,806 @@
+"""
+Content-addressed backups of the weekend reporter data
+
+Each dataset (reporters, preferences, settings, assignments) is serialised
+canonically and stored once under its SHA-256 hash in backups/objects/. A
+backup is a small manifest that names the object for each dataset:
+
+    backups/
+        auto_backup_20251213_101500_123456.manifest.json
+        objects/3f/3fa9...e1.json.gz
+
+A dataset that has not changed since the previous backup hashes to an
+object that already exists, so backing it up writes nothing but the
+manifest entry. backups/catalog.json indexes every backup (size, time,
+datasets, checksum, objects), so listing and pruning never scan the
+directory. Backups written before this format (one pretty-printed JSON
+file holding every dataset) can still be listed and loaded.
+
+Downloaded backups use a streaming archive format: gzip (or xz) compressed
+JSON Lines with a header line, one line per record and a footer carrying
+record counts and a SHA-256 of everything before it:
+
+    {"format": "weekend-reporter-backup", "version": 1, "timestamp": "..."}
+    {"dataset": "reporters", "key": "reporter1", "value": {...}}
+    ...
+    {"end": true, "counts": {"reporters": 123, ...}, "sha256": "..."}
+
+iter_archive() yields it chunk by chunk, and read_archive() parses and
+validates one (or a legacy single-JSON backup) from a file object.
+
+BackupWorker moves automatic backups off the request path: callers ask for
+a backup and return immediately, and a background thread runs one backup
+per burst of requests.
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import os
+import queue
+import re
+import threading
+import time
+import zlib
+from datetime import datetime
+from storage import DATASETS, FileLock, load_json
+
+MANIFEST_SUFFIX = '.manifest.json'
+LEGACY_SUFFIX = '.json'
+CATALOG_FILENAME = 'catalog.json'
+CATALOG_VERSION = 1
+# auto_backup_20251213_101500_123456.manifest.json -> prefix 'auto_backup'
+_BACKUP_NAME = re.compile(r'^(.*?)_\d{8}_\d{6}')
+
+ARCHIVE_FORMAT = 'weekend-reporter-backup'
+ARCHIVE_VERSION = 1
+GZIP_MAGIC = b'\x1f\x8b'
+XZ_MAGIC = b'\xfd7zXZ\x00'
+
+_CHUNK_SIZE = 64 * 1024
+_ENCODER = json.JSONEncoder(sort_keys=True, separators=(',', ':'))
+
+def _write_atomic(path, payload):
+    tmp_path = f'{path}.tmp.{os.getpid()}'
+    with open(tmp_path, 'wb') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def _canonical(data):
+    """Serialise data so equal content always gives identical bytes"""
+    return json.dumps(data, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+def _canonical_chunks(data):
+    """_canonical(data) as ~64 KB chunks, without building the whole document"""
+    buffer = []
+    size = 0
+    for piece in _ENCODER.iterencode(data):
+        buffer.append(piece)
+        size += len(piece)
+        if size >= _CHUNK_SIZE:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+class BackupStore:
+    """Manifests plus deduplicated dataset objects in one backup directory"""
+    
+    def __init__(self, backup_dir):
+        self.backup_dir = backup_dir
+        self.objects_dir = os.path.join(backup_dir, 'objects')
+        self.catalog_path = os.path.join(backup_dir, CATALOG_FILENAME)
+        os.makedirs(self.objects_dir, exist_ok=True)
+    
+    def _lock(self):
+        # Serialises create/prune across workers so garbage collection never
+        # removes an object a new manifest is about to reference
+        return FileLock(os.path.join(self.backup_dir, 'backups'))
+    
+    def _object_path(self, digest, suffix='.json.gz'):
+        return os.path.join(self.objects_dir, digest[:2], f'{digest}{suffix}')
+    
+    def _put_object(self, data):
+        """Store data gzipped under its hash; returns (digest, size, stored, bytes_written)"""
+        # First pass only hashes, so an unchanged dataset is never compressed or written
+        digest = hashlib.sha256()
+        size = 0
+        for chunk in _canonical_chunks(data):
+            digest.update(chunk)
+            size += len(chunk)
+        digest = digest.hexdigest()
+        
+        for existing in (self._object_path(digest), self._object_path(digest, '.json')):
+            if os.path.exists(existing):
+                return digest, size, os.path.getsize(existing), 0
+        path = self._object_path(digest)
+        
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.tmp.{os.getpid()}'
+        with open(tmp_path, 'wb') as raw:
+            # mtime=0 keeps the compressed bytes reproducible
+            with gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as gz:
+                for chunk in _canonical_chunks(data):
+                    gz.write(chunk)
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_path, path)
+        stored = os.path.getsize(path)
+        return digest, size, stored, stored
+    
+    def _get_object(self, digest):
+        path = self._object_path(digest)
+        if os.path.exists(path):
+            with gzip.open(path, 'rb') as f:
+                payload = f.read()
+        else:
+            # Uncompressed object from before objects were gzipped
+            with open(self._object_path(digest, '.json'), 'rb') as f:
+                payload = f.read()
+        if hashlib.sha256(payload).hexdigest() != digest:
+            raise ValueError(f'Backup object {digest} is corrupt')
+        return json.loads(payload)
+    
+    def create(self, datasets, prefix='auto_backup', retention=None):
+        """Back up {dataset name: data}; returns the manifest filename.
+        
+        With a RetentionPolicy, expired backups are removed in the same locked
+        pass, using only the catalog.
+        """
+        with self._lock():
+            filename = self._create(datasets, prefix)
+            if retention is not None:
+                catalog = self._locked_catalog()
+                self._remove(catalog, retention.expired(catalog['backups']))
+            return filename
+    
+    def _create(self, datasets, prefix):
+        now = datetime.now()
+        manifest = {
+            'format': 'manifest-v1',
+            'timestamp': now.isoformat(),
+            'datasets': {}
+        }
+        objects = {}
+        written = 0
+        for name, data in datasets.items():
+            digest, size, stored, new_bytes = self._put_object(data)
+            manifest['datasets'][name] = {'hash': digest, 'size': size}
+            objects[digest] = stored
+            written += new_bytes
+        manifest['bytes_written'] = written
+        
+        filename = f"{prefix}_{now.strftime('%Y%m%d_%H%M%S_%f')}{MANIFEST_SUFFIX}"
+        payload = _canonical(manifest)
+        _write_atomic(os.path.join(self.backup_dir, filename), payload)
+        
+        catalog = self._locked_catalog()
+        catalog['backups'][filename] = self._manifest_entry(prefix, manifest, payload, objects)
+        self._save_catalog(catalog)
+        return filename
+    
+    def _read_manifest(self, filename):
+        with open(os.path.join(self.backup_dir, filename), 'r') as f:
+            return json.load(f)
+    
+    # --- Catalog -----------------------------------------------------------
+    #
+    # backups/catalog.json records every backup (manifests and legacy files)
+    # so listing, pruning and verification never list or stat the directory:
+    #
+    #     {"version": 1, "backups": {filename: {
+    #         "prefix", "created", "size", "datasets",
+    #         "checksum", "file_bytes", "objects": {hash: stored bytes}}}}
+    #
+    # An object found missing when the catalog was rebuilt has stored bytes
+    # null, and the backup is listed as broken.
+    #
+    # It is only written under the backup lock. rebuild_catalog() recreates it
+    # from the files on disk if it is lost or disagrees with them.
+    
+    def _manifest_entry(self, prefix, manifest, payload, objects):
+        return {
+            'prefix': prefix,
+            'created': manifest['timestamp'],
+            'size': sum(d['size'] for d in manifest['datasets'].values()),
+            'datasets': sorted(manifest['datasets']),
+            'checksum': hashlib.sha256(payload).hexdigest(),
+            'file_bytes': len(payload),
+            'objects': objects
+        }
+    
+    def _load_catalog(self):
+        try:
+            catalog = load_json(self.catalog_path)
+        except (FileNotFoundError, ValueError):
+            return None
+        return catalog if catalog.get('version') == CATALOG_VERSION else None
+    
+    def _locked_catalog(self):
+        """The catalog, rebuilt first if missing or unreadable (caller holds the lock)"""
+        catalog = self._load_catalog()
+        return catalog if catalog is not None else self._rebuild_catalog()
+    
+    def _save_catalog(self, catalog):
+        _write_atomic(self.catalog_path, json.dumps(catalog, indent=2).encode('utf-8'))
+    
+    def catalog(self):
+        """{filename: entry} for every backup"""
+        catalog = self._load_catalog()
+        if catalog is None:
+            with self._lock():
+                catalog = self._locked_catalog()
+        return catalog['backups']
+    
+    def rebuild_catalog(self):
+        """Recreate the catalog from the backup files on disk; returns a summary"""
+        with self._lock():
+            old = self._load_catalog() or {'backups': {}}
+            catalog = self._rebuild_catalog()
+            return {
+                'backups': len(catalog['backups']),
+                'added': sorted(set(catalog['backups']) - set(old['backups'])),
+                'dropped': sorted(set(old['backups']) - set(catalog['backups'])),
+                'broken': sorted(f for f, entry in catalog['backups'].items() if None in entry['objects'].values()),
+                'orphan_objects_removed': self._collect_garbage(catalog)
+            }
+    
+    def _rebuild_catalog(self):
+        backups = {}
+        for filename in sorted(os.listdir(self.backup_dir)):
+            if not filename.endswith(LEGACY_SUFFIX) or '.tmp.' in filename or filename == CATALOG_FILENAME:
+                continue
+            path = os.path.join(self.backup_dir, filename)
+            with open(path, 'rb') as f:
+                payload = f.read()
+            match = _BACKUP_NAME.match(filename)
+            prefix = match.group(1) if match else filename.rsplit('.', 1)[0]
+            
+            if filename.endswith(MANIFEST_SUFFIX):
+                try:
+                    manifest = json.loads(payload)
+                except ValueError:
+                    # A torn manifest never finished being created
+                    continue
+                # Every object the manifest names, None if it is gone, so
+                # the backup shows up as broken instead of quietly intact
+                objects = {}
+                for entry in manifest['datasets'].values():
+                    objects[entry['hash']] = None
+                    for suffix in ('.json.gz', '.json'):
+                        object_path = self._object_path(entry['hash'], suffix)
+                        if os.path.exists(object_path):
+                            objects[entry['hash']] = os.path.getsize(object_path)
+                            break
+                backups[filename] = self._manifest_entry(prefix, manifest, payload, objects)
+            else:
+                try:
+                    backup = json.loads(payload)
+                except ValueError:
+                    continue
+                backups[filename] = {
+                    'prefix': prefix,
+                    'created': datetime.fromtimestamp(os.path.getmtime(path)).isoformat(),
+                    'size': len(payload),
+                    'datasets': sorted(name for name in backup if name in DATASETS),
+                    'checksum': hashlib.sha256(payload).hexdigest(),
+                    'file_bytes': len(payload),
+                    'objects': {}
+                }
+        
+        catalog = {'version': CATALOG_VERSION, 'backups': backups}
+        self._save_catalog(catalog)
+        return catalog
+    
+    def verify(self, deep=False):
+        """Check every catalogued backup against disk; returns a list of problems.
+        
+        Checks that each backup file exists with the recorded checksum and that
+        its objects exist; every backup sharing a missing object is reported.
+        deep=True also re-hashes every object.
+        """
+        problems = []
+        faults = {}  # object hash -> what is wrong with it, or None; shared objects are checked once
+        for filename, entry in self.catalog().items():
+            path = os.path.join(self.backup_dir, filename)
+            try:
+                with open(path, 'rb') as f:
+                    payload = f.read()
+            except FileNotFoundError:
+                problems.append(f'{filename}: file is missing')
+                continue
+            if hashlib.sha256(payload).hexdigest() != entry['checksum']:
+                problems.append(f'{filename}: checksum does not match the catalog')
+                continue
+            for digest, stored in entry['objects'].items():
+                if digest not in faults:
+                    faults[digest] = self._object_fault(digest, stored, deep)
+                if faults[digest]:
+                    problems.append(f'{filename}: object {digest[:12]} {faults[digest]}')
+        return problems
+    
+    def _object_fault(self, digest, stored, deep):
+        if stored is None:
+            return 'is missing'
+        if deep:
+            try:
+                self._get_object(digest)
+            except (OSError, ValueError) as e:
+                return f'is unreadable ({e})'
+        elif not (os.path.exists(self._object_path(digest)) or
+                  os.path.exists(self._object_path(digest, '.json'))):
+            return 'is missing'
+        return None
+    
+    # --- Listing and pruning -----------------------------------------------
+    
+    def filenames(self, prefix='auto_backup'):
+        """Backup filenames (manifests and legacy full files), oldest first"""
+        return sorted(f for f, entry in self.catalog().items() if entry['prefix'] == prefix)
+    
+    def list(self, prefix='auto_backup', limit=30):
+        """Newest-first summaries: filename, size (all datasets), created, datasets, broken"""
+        catalog = self.catalog()
+        return [{
+            'filename': filename,
+            'size': catalog[filename]['size'],
+            'created': catalog[filename]['created'],
+            'datasets': catalog[filename]['datasets'],
+            'checksum': catalog[filename]['checksum'],
+            'broken': None in catalog[filename]['objects'].values()
+        } for filename in reversed(self.filenames(prefix)[-limit:])]
+    
+    def load(self, filename):
+        """Rebuild a backup as {dataset: data, 'timestamp': ...}"""
+        if os.path.basename(filename) != filename:
+            raise ValueError('Invalid backup filename')
+        
+        if not filename.endswith(MANIFEST_SUFFIX):
+            # Legacy backup: everything in one JSON file
+            with open(os.path.join(self.backup_dir, filename), 'r') as f:
+                return json.load(f)
+        
+        manifest = self._read_manifest(filename)
+        backup = {name: self._get_object(entry['hash'])
+                  for name, entry in manifest['datasets'].items()}
+        backup['timestamp'] = manifest['timestamp']
+        return backup
+    
+    def prune(self, keep=30, prefix='auto_backup'):
+        """Delete all but the newest `keep` backups, then unreferenced objects"""
+        with self._lock():
+            catalog = self._locked_catalog()
+            filenames = sorted(f for f, entry in catalog['backups'].items() if entry['prefix'] == prefix)
+            # keep=0 deletes them all ([:-0] would have kept them all)
+            return self._remove(catalog, filenames[:max(0, len(filenames) - keep)])
+    
+    def apply_retention(self, retention):
+        """Remove the backups a RetentionPolicy no longer keeps; returns their names"""
+        with self._lock():
+            catalog = self._locked_catalog()
+            expired = retention.expired(catalog['backups'])
+            self._remove(catalog, expired)
+            return expired
+    
+    def usage(self):
+        """Bytes on disk used by all catalogued backups (shared objects counted once)"""
+        return _disk_usage(self.catalog().values())
+    
+    def _remove(self, catalog, filenames):
+        """Delete backups and the objects only they used (caller holds the lock)"""
+        if not filenames:
+            return 0
+        candidates = set()
+        for filename in filenames:
+            entry = catalog['backups'].pop(filename)
+            candidates.update(entry['objects'])
+        # The catalog goes first: a crash after this only leaves orphans for rebuild_catalog()
+        self._save_catalog(catalog)
+        
+        for filename in filenames:
+            try:
+                os.remove(os.path.join(self.backup_dir, filename))
+            except FileNotFoundError:
+                pass
+        
+        for entry in catalog['backups'].values():
+            candidates.difference_update(entry['objects'])
+        removed = 0
+        for digest in candidates:
+            for suffix in ('.json.gz', '.json'):
+                try:
+                    os.remove(self._object_path(digest, suffix))
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+    
+    def _collect_garbage(self, catalog):
+        """Remove every object no catalogued backup refers to (caller holds the lock)"""
+        referenced = set()
+        for entry in catalog['backups'].values():
+            referenced.update(entry['objects'])
+        
+        removed = 0
+        for shard in os.listdir(self.objects_dir):
+            shard_dir = os.path.join(self.objects_dir, shard)
+            for object_file in os.listdir(shard_dir):
+                if object_file.split('.', 1)[0] not in referenced:
+                    os.remove(os.path.join(shard_dir, object_file))
+                    removed += 1
+        return removed
+
+def _disk_usage(entries):
+    objects = {}
+    total = 0
+    for entry in entries:
+        total += entry['file_bytes']
+        objects.update(entry['objects'])
+    return total + sum(stored or 0 for stored in objects.values())
+
+class RetentionPolicy:
+    """Which backups to keep: tiered by age, then within a byte budget.
+    
+    For each backup prefix (auto_backup, manual_backup_before_upload, ...):
+    keep everything from the last keep_all_seconds, the first backup of each
+    hour up to hourly_seconds old, and the first backup of each day up to
+    daily_seconds old. Keeping the first of each period means a backup kept
+    as hourly stays kept as daily, so each run only drops backups that just
+    aged out of a tier. If what is left is over max_bytes, the oldest go
+    first. The newest backup of each prefix is always kept.
+    """
+    
+    def __init__(self, keep_all_seconds=3600, hourly_seconds=86400,
+                 daily_seconds=90 * 86400, max_bytes=None):
+        self.keep_all_seconds = keep_all_seconds
+        self.hourly_seconds = hourly_seconds
+        self.daily_seconds = daily_seconds
+        self.max_bytes = max_bytes
+    
+    def expired(self, backups, now=None):
+        """Filenames to delete, from catalog entries {filename: entry}"""
+        now = now or datetime.now()
+        by_prefix = {}
+        for filename, entry in backups.items():
+            by_prefix.setdefault(entry['prefix'], []).append((entry['created'], filename))
+        
+        keep = []
+        newest = set()
+        expired = []
+        for entries in by_prefix.values():
+            entries.sort()
+            newest.add(entries[-1][1])
+            seen_periods = set()
+            for created, filename in entries:
+                age = (now - datetime.fromisoformat(created)).total_seconds()
+                if age <= self.keep_all_seconds:
+                    period = None
+                elif age <= self.hourly_seconds:
+                    period = created[:13]  # YYYY-MM-DDTHH
+                elif age <= self.daily_seconds:
+                    period = created[:10]  # YYYY-MM-DD
+                else:
+                    period = 'expired'
+                
+                if filename in newest or period is None or (period != 'expired' and period not in seen_periods):
+                    keep.append((created, filename))
+                    if period is not None:
+                        seen_periods.add(period)
+                else:
+                    expired.append(filename)
+        
+        if self.max_bytes is not None:
+            expired.extend(self._over_budget(backups, sorted(keep), newest))
+        return expired
+    
+    def _over_budget(self, backups, keep, protected):
+        """Oldest-first filenames to drop from keep until it fits max_bytes"""
+        refcounts = {}
+        used = 0
+        for _, filename in keep:
+            used += backups[filename]['file_bytes']
+            for digest, stored in backups[filename]['objects'].items():
+                if digest not in refcounts:
+                    used += stored or 0
+                refcounts[digest] = refcounts.get(digest, 0) + 1
+        
+        dropped = []
+        for _, filename in keep:
+            if used <= self.max_bytes:
+                break
+            if filename in protected:
+                continue
+            used -= backups[filename]['file_bytes']
+            for digest, stored in backups[filename]['objects'].items():
+                refcounts[digest] -= 1
+                if refcounts[digest] == 0:
+                    used -= stored or 0
+            dropped.append(filename)
+        return dropped
+
+def iter_archive(datasets, timestamp=None, compression='gzip'):
+    """Yield a backup archive of {dataset: data} as compressed byte chunks"""
+    if compression == 'gzip':
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    elif compression == 'xz':
+        compressor = lzma.LZMACompressor()
+    else:
+        raise ValueError(f'Unknown compression {compression!r}')
+    
+    digest = hashlib.sha256()
+    buffer = []
+    size = 0
+    
+    def lines():
+        yield {'format': ARCHIVE_FORMAT, 'version': ARCHIVE_VERSION,
+               'timestamp': timestamp or datetime.now().isoformat()}
+        for name, data in datasets.items():
+            if isinstance(data, dict):
+                for key, value in data.items():
+                    yield {'dataset': name, 'key': key, 'value': value}
+            else:
+                yield {'dataset': name, 'value': data}
+    
+    for record in lines():
+        line = (json.dumps(record, separators=(',', ':')) + '\n').encode('utf-8')
+        digest.update(line)
+        buffer.append(line)
+        size += len(line)
+        if size >= _CHUNK_SIZE:
+            chunk = compressor.compress(b''.join(buffer))
+            buffer = []
+            size = 0
+            if chunk:
+                yield chunk
+    
+    counts = {name: len(data) if isinstance(data, dict) else 1 for name, data in datasets.items()}
+    footer = {'end': True, 'counts': counts, 'sha256': digest.hexdigest()}
+    buffer.append((json.dumps(footer, separators=(',', ':')) + '\n').encode('utf-8'))
+    yield compressor.compress(b''.join(buffer)) + compressor.flush()
+
+class _PrefixedReader(io.RawIOBase):
+    """Puts back bytes already read from a stream (used to sniff the format)"""
+    
+    def __init__(self, prefix, stream):
+        self._prefix = prefix
+        self._stream = stream
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, b):
+        if self._prefix:
+            n = min(len(b), len(self._prefix))
+            b[:n] = self._prefix[:n]
+            self._prefix = self._prefix[n:]
+            return n
+        data = self._stream.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+def read_archive(stream):
+    """Parse and validate a backup from a binary file object.
+    
+    Accepts gzip or xz archives from iter_archive() and legacy uncompressed
+    single-JSON backups. Returns ({dataset: data}, timestamp) and raises
+    ValueError if the backup is truncated, corrupt or inconsistent.
+    """
+    magic = stream.read(len(XZ_MAGIC))
+    reader = io.BufferedReader(_PrefixedReader(magic, stream), _CHUNK_SIZE)
+    
+    if magic.startswith(GZIP_MAGIC):
+        source = gzip.GzipFile(fileobj=reader, mode='rb')
+    elif magic == XZ_MAGIC:
+        source = lzma.LZMAFile(reader, mode='rb')
+    elif magic.lstrip()[:1] == b'{':
+        try:
+            backup = json.load(reader)
+        except ValueError as e:
+            raise ValueError(f'Backup is not valid JSON: {e}')
+        if not isinstance(backup, dict):
+            raise ValueError('Backup is not a JSON object')
+        timestamp = backup.get('timestamp')
+        datasets = {name: backup[name] for name in DATASETS if name in backup}
+        validate_datasets(datasets)
+        return datasets, timestamp
+    else:
+        raise ValueError('Unrecognised backup format')
+    
+    try:
+        return _read_lines(source)
+    except (EOFError, OSError, lzma.LZMAError, zlib.error) as e:
+        raise ValueError(f'Backup archive is truncated or corrupt: {e}')
+
+def _read_lines(source):
+    digest = hashlib.sha256()
+    datasets = {}
+    header = None
+    footer = None
+    
+    for line in source:
+        if footer is not None:
+            raise ValueError('Data after the end of the backup archive')
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise ValueError('Backup archive contains an unreadable line')
+        
+        if header is None:
+            if record.get('format') != ARCHIVE_FORMAT:
+                raise ValueError('Not a weekend reporter backup archive')
+            if record.get('version') != ARCHIVE_VERSION:
+                raise ValueError(f"Unsupported backup archive version {record.get('version')}")
+            header = record
+        elif record.get('end'):
+            footer = record
+            continue
+        else:
+            name = record.get('dataset')
+            if name not in DATASETS:
+                raise ValueError(f'Unknown dataset {name!r} in backup archive')
+            if 'key' in record:
+                datasets.setdefault(name, {})[record['key']] = record['value']
+            else:
+                datasets[name] = record['value']
+        digest.update(line)
+    
+    if header is None or footer is None:
+        raise ValueError('Backup archive is truncated')
+    if footer.get('sha256') != digest.hexdigest():
+        raise ValueError('Backup archive checksum does not match')
+    for name, count in footer.get('counts', {}).items():
+        # Empty datasets have no record lines
+        datasets.setdefault(name, {})
+        actual = len(datasets[name]) if isinstance(datasets[name], dict) else 1
+        if actual != count:
+            raise ValueError(f'Backup archive has {actual} {name} records, expected {count}')
+    
+    validate_datasets(datasets)
+    return datasets, header.get('timestamp')
+
+def validate_datasets(datasets):
+    """Check restored data has the shape the app expects before it is applied"""
+    if not datasets:
+        raise ValueError('Backup contains no datasets')
+    for name, data in datasets.items():
+        if name not in DATASETS:
+            raise ValueError(f'Unknown dataset {name!r}')
+        if not isinstance(data, dict):
+            raise ValueError(f'{name} must be a JSON object')
+    
+    for username, reporter in datasets.get('reporters', {}).items():
+        if not isinstance(reporter, dict) or 'password' not in reporter:
+            raise ValueError(f'Reporter {username!r} has no password')
+    if 'reporters' in datasets and not any(r.get('is_manager') for r in datasets['reporters'].values()):
+        # Restoring this would lock every manager out
+        raise ValueError('Backup has no manager account')
+    
+    for username, prefs in datasets.get('preferences', {}).items():
+        if not isinstance(prefs, dict):
+            raise ValueError(f'Preferences for {username!r} must be a JSON object')
+    for username, shift_ids in datasets.get('assignments', {}).items():
+        if not isinstance(shift_ids, list) or not all(isinstance(s, int) for s in shift_ids):
+            raise ValueError(f'Assignments for {username!r} must be a list of shift ids')
+
+_STOP = object()
+
+class BackupWorker:
+    """Background thread that coalesces backup requests.
+    
+    request() never blocks: it drops a token on a bounded queue. The thread
+    wakes on the first token, waits coalesce_seconds while absorbing any
+    further tokens, then runs backup_fn once, so a burst of submissions
+    produces a single backup. backup_now() runs a backup synchronously for
+    callers that need one before they continue (allocation, reset).
+    """
+    
+    def __init__(self, backup_fn, coalesce_seconds=60, max_pending=100):
+        self.backup_fn = backup_fn
+        self.coalesce_seconds = coalesce_seconds
+        self._queue = queue.Queue(maxsize=max_pending)
+        # Held while a backup runs, so sync and background backups never overlap
+        self._run_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.pending_since = None
+        self.last_backup_at = None
+        self.last_error = None
+        self.requests = 0
+        self.backups_run = 0
+    
+    def _ensure_started(self):
+        # gunicorn forks workers after import; each worker needs its own thread
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._state_lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+                self._thread = threading.Thread(target=self._loop, name='backup-worker', daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+    
+    def request(self):
+        """Ask for a backup soon; returns immediately"""
+        self._ensure_started()
+        with self._state_lock:
+            self.requests += 1
+            if self.pending_since is None:
+                self.pending_since = time.time()
+        try:
+            self._queue.put_nowait(True)
+        except queue.Full:
+            # The queued tokens already guarantee a backup that will cover this change
+            pass
+    
+    def backup_now(self):
+        """Run a backup synchronously; also satisfies any pending request"""
+        with self._run_lock:
+            return self._run()
+    
+    def _run(self):
+        with self._state_lock:
+            self.pending_since = None
+        try:
+            ok = self.backup_fn()
+            self.last_error = None if ok else 'backup failed'
+        except Exception as e:
+            ok = False
+            self.last_error = str(e)
+        if ok:
+            self.last_backup_at = time.time()
+            self.backups_run += 1
+        return ok
+    
+    def _loop(self):
+        while True:
+            stopping = self._queue.get() is _STOP
+            
+            # Absorb the rest of the burst before backing up
+            deadline = time.time() + self.coalesce_seconds
+            while not stopping:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    stopping = self._queue.get(timeout=remaining) is _STOP
+                except queue.Empty:
+                    break
+            
+            with self._run_lock:
+                # A synchronous backup may already have covered these requests
+                if self.pending_since is not None:
+                    self._run()
+            
+            if stopping:
+                return
+    
+    def shutdown(self, timeout=30):
+        """Flush any pending backup and stop the thread (registered with atexit)"""
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            if self.pending_since is not None:
+                self.backup_now()
+            return
+        self._queue.put(_STOP, timeout=timeout)
+        self._thread.join(timeout)
+    
+    def status(self):
+        """How stale the newest backup is, and whether changes are waiting"""
+        now = time.time()
+        pending_since = self.pending_since
+        return {
+            'last_backup_at': datetime.fromtimestamp(self.last_backup_at).isoformat() if self.last_backup_at else None,
+            'seconds_since_last_backup': round(now - self.last_backup_at, 1) if self.last_backup_at else None,
+            'pending': pending_since is not None,
+            'unbacked_changes_age_seconds': round(now - pending_since, 1) if pending_since else 0,
+            'queue_depth': self._queue.qsize(),
+            'requests': self.requests,
+            'backups_run': self.backups_run,
+            'coalesce_seconds': self.coalesce_seconds,
+            'last_error': self.last_error
+        }
@@ -0,0 +1,547 @@
+"""
+Benchmark shift allocation at today's size and at a much larger roster
+
+Runs allocator.allocate() on synthetic rosters: the real 84-shift season
+(123 reporters) and a 5,000-shift season with enough reporters to fill it.
+Also times shift lookup by id the old way (a linear scan of a list of dicts)
+against the ShiftCatalog.
+
+--scaling doubles the roster (and the season with it) from 1,000 to 64,000
+reporters. With incremental capacity tracking the time per reporter should
+stay flat, i.e. total time grows linearly.
+
+--optimal compares greedy and optimal (min-cost flow) mode on today's season
+and on 10,000 reporters for about 5,000 slots: run time, how many reporters
+got a top-10 shift, the sum of their ranks, fallbacks and bottom-5 shifts.
+
+--matrix times compile_preferences() (the reporter x shift rank matrix) for
+1,000 to 100,000 reporters on today's season, and a report-style rank
+lookup for every reporter against the old list scans.
+
+--draws runs 16 draws of a 5,000-slot season with 1, 2, 4 and 8 worker
+processes (allocate_draws) and reports wall-clock time and speedup. The
+speedup is capped by the machine's core count, which is printed too.
+
+--repair allocates 10,000 and 100,000 reporters, then times repair() for
+changes of 1, 10 and 100 reporters (half dropping out, half joining). The
+time should follow the size of the change, not the headcount.
+
+--caps allocates a 5,000-shift season under 0 to 96 overlapping capacity
+caps (week windows, days, kinds) and times one cap check through the
+CapCounter against scanning every cap, as a per-candidate check would.
+The CapCounter check should not grow with the number of caps.
+
+--trading runs the top trading cycles pass on 1,000 to 100,000 reporters:
+after a greedy allocation (a random serial dictatorship, which leaves no
+trade to make, so this is the pass's pure overhead) and on a random
+assignment (the worst case: nearly everyone trades). Time should grow
+linearly with the roster.
+
+--swaps fills a swap book with 1,000 to 100,000 open offers on today's
+season and times matching a new offer: random offers (which mostly find a
+direct swap) and an offer nobody wants (the worst case: every direct and
+three-way chain is tried and fails). Both should stay flat in the number
+of open offers. It also times a whole SwapMarket.post(), which rewrites
+the offers file.
+
+--memo checks that an allocation is a function of its inputs and seed
+(greedy and optimal, run twice each, must match) and times what the
+result cache key costs, hashing the preferences and reporters, against the
+allocations it saves re-running, for 1,000 to 100,000 reporters. The app
+hashes once per change of the data and keeps the hashes per worker; after
+the first time, a PreferencesHasher re-encodes only the reporters whose
+preferences changed ('rehash ms': one reporter changed). The old hash, one
+sorted JSON dump of everything, is shown for comparison.
+
+--trace times allocate() with and without a DecisionTrace for 1,000 to
+100,000 reporters (greedy, and optimal up to 10,000), the best of several
+runs each. The overhead counts recording every decision and turning the
+trace into columns for saving (to_dict), and has to stay under 5%.
+
+Usage:
+    python benchmark_allocation.py             # 84 and 5000 shifts
+    python benchmark_allocation.py 84 1000     # custom shift counts
+    python benchmark_allocation.py --scaling   # linear scaling check
+    python benchmark_allocation.py --optimal   # greedy vs optimal
+    python benchmark_allocation.py --matrix    # rank matrix compile time
+    python benchmark_allocation.py --draws     # multi-draw core scaling
+    python benchmark_allocation.py --repair    # incremental repair cost
+    python benchmark_allocation.py --caps      # overlapping capacity caps
+    python benchmark_allocation.py --trading   # top trading cycles pass
+    python benchmark_allocation.py --swaps     # swap offer matching
+    python benchmark_allocation.py --memo      # seeded results and cache key cost
+    python benchmark_allocation.py --trace     # decision trace overhead
+"""
+
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+from allocator import allocate, allocate_draws, best_draw
+from caps import CapCounter, parse_caps
+from decisions import DecisionTrace
+from preference_matrix import compile_preferences
+from previews import PreferencesHasher, content_hash, preferences_hash, reporters_hash
+from repair import AllocationIndex, repair
+from shifts import generate_shifts
+from swaps import SwapBook, SwapMarket
+from trading import trade_shifts
+
+def make_roster(shifts, reporters, seed=42, submitted=0.9):
+    """Synthetic reporters and preferences for a ShiftCatalog.
+    
+    About `submitted` of the reporters submit complete preferences; the
+    rest get random shifts in the last phase.
+    """
+    rng = random.Random(seed)
+    capped_week = shifts.weeks[-1]
+    main_ids = [shift.id for shift in shifts if shift.week != capped_week]
+    kinds = ['saturday_morning', 'saturday_evening', 'sunday_morning', 'sunday_evening']
+    
+    reporters_data = {'admin': {'name': 'Admin', 'is_manager': True}}
+    preferences = {}
+    for n in range(reporters):
+        username = f'reporter{n}'
+        reporters_data[username] = {'name': f'Reporter {n}', 'is_manager': False}
+        if rng.random() < submitted:
+            picks = rng.sample(main_ids, 15)
+            # A few reporters want the capped week too
+            if rng.random() < 0.1:
+                picks[rng.randrange(10)] = rng.choice(shifts.by_week[capped_week]).id
+            preferences[username] = {
+                'top_10': picks[:10],
+                'bottom_5': picks[10:],
+                'shift_type_pref': {kind: str(i + 1) for i, kind in enumerate(rng.sample(kinds, 4))}
+            }
+    return reporters_data, preferences
+
+def shifts_for(count):
+    """A season of `count` shifts (four per weekend)"""
+    return generate_shifts(weeks=max(count // 4, 2))
+
+def reporters_for(shifts):
+    """Roughly today's ratio: 123 reporters for 126 slots"""
+    return int(shifts.total_slots() * 123 / 126)
+
+def quiet(*args):
+    pass
+
+def time_allocation(shifts, reporters_data, preferences, runs=3, mode='greedy'):
+    times = []
+    for run in range(runs):
+        start = time.perf_counter()
+        result = allocate(reporters_data, preferences, shifts, log=quiet, mode=mode, seed=run)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+def time_lookups(shifts, lookups=20000):
+    """Seconds per lookup by id: linear scan of dicts vs the catalog"""
+    as_list = shifts.as_dicts()
+    rng = random.Random(1)
+    ids = [rng.randrange(len(shifts)) for _ in range(lookups)]
+    
+    start = time.perf_counter()
+    for shift_id in ids:
+        next(s for s in as_list if s['id'] == shift_id)
+    scan = (time.perf_counter() - start) / lookups
+    
+    start = time.perf_counter()
+    for shift_id in ids:
+        shifts.get(shift_id)
+    catalog = (time.perf_counter() - start) / lookups
+    return scan, catalog
+
+def scaling():
+    print("=" * 80)
+    print("ALLOCATION SCALING (time per reporter should stay flat)")
+    print("=" * 80)
+    print(f"\n{'reporters':>10} {'shifts':>8} {'total ms':>10} {'µs/reporter':>12} {'vs first':>9}")
+    
+    first = None
+    reporters = 1000
+    while reporters <= 64000:
+        # Enough shifts for everyone, at today's slots-per-reporter ratio
+        shifts = shifts_for(int(reporters * 126 / 123 / 1.5))
+        reporters_data, preferences = make_roster(shifts, reporters)
+        elapsed, _ = time_allocation(shifts, reporters_data, preferences)
+        per_reporter = elapsed / reporters * 1e6
+        first = first or per_reporter
+        print(f"{reporters:>10} {len(shifts):>8} {elapsed * 1000:>10.1f} {per_reporter:>12.1f} "
+              f"{per_reporter / first:>8.2f}x")
+        reporters *= 2
+
+def quality(result, preferences):
+    """Top-10 count, sum of top-10 ranks, fallbacks and bottom-5 shifts"""
+    top_10 = rank_sum = fallback = bottom_5 = 0
+    for rep, shift_ids in result['assignments'].items():
+        prefs = preferences.get(rep)
+        if not shift_ids or not prefs:
+            continue
+        shift_id = shift_ids[0]
+        if shift_id in prefs['top_10']:
+            top_10 += 1
+            rank_sum += prefs['top_10'].index(shift_id) + 1
+        elif shift_id in prefs['bottom_5']:
+            bottom_5 += 1
+        else:
+            fallback += 1
+    return top_10, rank_sum, fallback, bottom_5
+
+def compare_modes():
+    print("=" * 80)
+    print("GREEDY VS OPTIMAL")
+    print("=" * 80)
+    
+    # Today's season, then 10,000 reporters competing for about 5,000 slots
+    for shifts, reporters in [(generate_shifts(), 123), (shifts_for(3336), 10000)]:
+        reporters_data, preferences = make_roster(shifts, reporters)
+        print(f"\n📅 {len(shifts)} shifts, {shifts.total_slots()} slots, {reporters} reporters "
+              f"({len(preferences)} with preferences)")
+        print(f"   {'mode':8} {'time ms':>10} {'assigned':>9} {'top 10':>7} {'rank sum':>9} "
+              f"{'fallback':>9} {'bottom 5':>9}")
+        for mode in ['greedy', 'optimal']:
+            elapsed, result = time_allocation(shifts, reporters_data, preferences, runs=1, mode=mode)
+            top_10, rank_sum, fallback, bottom_5 = quality(result, preferences)
+            print(f"   {mode:8} {elapsed * 1000:>10.1f} {result['stats']['total_assigned']:>9} {top_10:>7} "
+                  f"{rank_sum:>9} {fallback:>9} {bottom_5:>9}")
+
+def list_ranks(preferences, picks):
+    """Rank of each (reporter, shift) the old way: `in` and .index() on the lists"""
+    ranks = []
+    for username, shift_id in picks:
+        prefs = preferences[username]
+        if shift_id in prefs['top_10']:
+            ranks.append(prefs['top_10'].index(shift_id) + 1)
+        elif shift_id in prefs['bottom_5']:
+            ranks.append(-1)
+        else:
+            ranks.append(0)
+    return ranks
+
+def matrix_benchmark():
+    print("=" * 80)
+    print("PREFERENCE MATRIX")
+    print("=" * 80)
+    print(f"\n{'reporters':>10} {'compile ms':>11} {'matrix MB':>10} {'list lookups ms':>16} {'matrix lookups ms':>18}")
+    
+    shifts = generate_shifts()
+    rng = random.Random(7)
+    for reporters in [1000, 10000, 100000]:
+        _, preferences = make_roster(shifts, reporters, submitted=1.0)
+        picks = [(username, rng.randrange(len(shifts))) for username in preferences]
+        
+        start = time.perf_counter()
+        matrix = compile_preferences(preferences, shifts)
+        compile_time = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        expected = list_ranks(preferences, picks)
+        list_time = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        ranks = matrix.lookup([u for u, _ in picks], [s for _, s in picks])
+        matrix_time = time.perf_counter() - start
+        assert ranks.tolist() == expected
+        
+        print(f"{reporters:>10} {compile_time * 1000:>11.1f} {matrix.ranks.nbytes / 1e6:>10.1f} "
+              f"{list_time * 1000:>16.1f} {matrix_time * 1000:>18.1f}")
+
+def draw_scaling(draws=16):
+    print("=" * 80)
+    print(f"MULTI-DRAW SCALING ({draws} draws, {os.cpu_count()} CPU cores available)")
+    print("=" * 80)
+    
+    shifts = shifts_for(3336)
+    reporters_data, preferences = make_roster(shifts, reporters_for(shifts))
+    matrix = compile_preferences(preferences, shifts)
+    seeds = list(range(draws))
+    print(f"\n📅 {len(shifts)} shifts, {shifts.total_slots()} slots, {len(reporters_data) - 1} reporters")
+    print(f"\n{'workers':>8} {'wall s':>8} {'speedup':>8} {'best seed':>10}")
+    
+    first = None
+    for workers in [1, 2, 4, 8]:
+        start = time.perf_counter()
+        results = allocate_draws(reporters_data, preferences, shifts, seeds, workers=workers, matrix=matrix)
+        elapsed = time.perf_counter() - start
+        first = first or elapsed
+        print(f"{workers:>8} {elapsed:>8.2f} {first / elapsed:>7.2f}x {best_draw(results)[0]:>10}")
+
+def repair_benchmark():
+    print("=" * 80)
+    print("INCREMENTAL REPAIR (time should follow the change, not the headcount)")
+    print("=" * 80)
+    print(f"\n{'reporters':>10} {'index ms':>9} {'change':>7} {'repair ms':>10} {'moved':>6}")
+    
+    for reporters in [10000, 100000]:
+        shifts = shifts_for(int(reporters * 126 / 123 / 1.5))
+        reporters_data, preferences = make_roster(shifts, reporters)
+        # Leave room for late joiners: everyone but the last 100 is allocated
+        joiners = [f'reporter{n}' for n in range(reporters - 100, reporters)]
+        allocated = {u: r for u, r in reporters_data.items() if u not in joiners}
+        matrix = compile_preferences(preferences, shifts)
+        assignments = allocate(allocated, preferences, shifts, log=quiet, matrix=matrix, seed=1)['assignments']
+        
+        start = time.perf_counter()
+        index = AllocationIndex(assignments, shifts)
+        index_time = time.perf_counter() - start
+        
+        for change in [1, 10, 100]:
+            leavers = [u for u in assignments if u in index.assigned][:change // 2 or 1]
+            start = time.perf_counter()
+            outcome = repair(index, preferences, matrix, reporters_data, remove=leavers,
+                             add=joiners[:change - len(leavers)] if change > 1 else [])
+            elapsed = time.perf_counter() - start
+            joiners = joiners[change:]
+            print(f"{reporters:>10} {index_time * 1000:>9.1f} {change:>7} {elapsed * 1000:>10.2f} "
+                  f"{len(outcome['moves']):>6}")
+
+def make_caps(shifts, count, seed=7):
+    """count overlapping caps: week windows, optionally narrowed to a day or kind"""
+    rng = random.Random(seed)
+    weeks = shifts.weeks
+    specs = []
+    for n in range(count):
+        first = rng.randrange(len(weeks) // 2)
+        window = weeks[first:first + len(weeks) // 2]
+        spec = {'name': f'cap {n}', 'weeks': window}
+        if n % 3 == 1:
+            spec['days'] = [rng.choice(['Saturday', 'Sunday'])]
+        elif n % 3 == 2:
+            spec['kinds'] = [rng.choice(['saturday_morning', 'sunday_morning', 'sunday_evening'])]
+        # Tight enough that some caps fill during the allocation
+        spec['max_slots'] = sum(s.slots for s in shifts if s.week in set(window)) // rng.choice([3, 6])
+        specs.append(spec)
+    return parse_caps(specs, shifts)
+
+def cap_benchmark():
+    print("=" * 80)
+    print("CAPACITY CAPS (the cap check should not grow with the number of caps)")
+    print("=" * 80)
+    
+    shifts = shifts_for(5000)
+    reporters_data, preferences = make_roster(shifts, reporters_for(shifts))
+    matrix = compile_preferences(preferences, shifts)
+    print(f"\n{'caps':>5} {'caps/shift':>10} {'allocate ms':>12} {'assigned':>9} "
+          f"{'check µs':>9} {'scan µs':>8}")
+    
+    for count in [0, 12, 24, 48, 96]:
+        caps = make_caps(shifts, count)
+        per_shift = sum(len(cap.shift_ids) for cap in caps) / len(shifts)
+        times = []
+        for run in range(3):
+            start = time.perf_counter()
+            result = allocate(reporters_data, preferences, shifts, log=quiet, matrix=matrix, caps=caps, seed=run)
+            times.append(time.perf_counter() - start)
+        
+        # One check per shift: the counter, then a scan of every cap
+        counter = CapCounter(caps, shifts)
+        for shift_id, holders in result['shift_assignments'].items():
+            for _ in holders:
+                counter.add(shift_id)
+        ids = shifts.ids()
+        start = time.perf_counter()
+        for shift_id in ids:
+            counter.has_room(shift_id)
+        check = (time.perf_counter() - start) / len(ids)
+        start = time.perf_counter()
+        for shift_id in ids:
+            all(used < cap.max_slots for cap, used in zip(caps, counter.used) if shift_id in cap.shift_ids)
+        scan = (time.perf_counter() - start) / len(ids)
+        
+        print(f"{count:>5} {per_shift:>10.1f} {min(times) * 1000:>12.1f} "
+              f"{result['stats']['total_assigned']:>9} {check * 1e6:>9.3f} {scan * 1e6:>8.2f}")
+
+def trading_benchmark():
+    print("=" * 80)
+    print("TOP TRADING CYCLES (time should grow linearly with the roster)")
+    print("=" * 80)
+    print(f"\n{'reporters':>10} {'start':>8} {'trade ms':>9} {'improved':>9} {'into top 10':>12} "
+          f"{'mean gain':>10} {'cycles':>7} {'longest':>8}")
+    
+    for reporters in [1000, 10000, 100000]:
+        shifts = shifts_for(int(reporters * 126 / 123 / 1.5))
+        reporters_data, preferences = make_roster(shifts, reporters)
+        matrix = compile_preferences(preferences, shifts)
+        greedy = allocate(reporters_data, preferences, shifts, log=quiet, matrix=matrix, seed=1)['assignments']
+        
+        # Every slot dealt out at random, ignoring preferences
+        rng = random.Random(1)
+        slots = [shift.id for shift in shifts for _ in range(shift.slots)]
+        rng.shuffle(slots)
+        usernames = [u for u in reporters_data if not reporters_data[u].get('is_manager')]
+        dealt = {u: [slots[i]] if i < len(slots) else [] for i, u in enumerate(usernames)}
+        
+        for label, assignments in [('greedy', greedy), ('random', dealt)]:
+            start = time.perf_counter()
+            changed, report = trade_shifts(assignments, preferences, matrix)
+            elapsed = time.perf_counter() - start
+            print(f"{reporters:>10} {label:>8} {elapsed * 1000:>9.1f} {report['reporters_improved']:>9} "
+                  f"{report['into_top_10']:>12} {report['mean_rank_gain']:>10} {report['cycles']:>7} "
+                  f"{report['longest_cycle']:>8}")
+
+def swap_benchmark(matches=2000):
+    print("=" * 80)
+    print("SWAP OFFER MATCHING (should not grow with the number of open offers)")
+    print("=" * 80)
+    shift_ids = generate_shifts().ids()
+    unwanted = shift_ids[0]  # never in anyone's wants
+    print(f"\n{'open offers':>12} {'random µs':>10} {'found':>6} {'unwanted µs':>12} {'post ms':>8}")
+    
+    for count in [1000, 10000, 100000]:
+        rng = random.Random(count)
+        
+        def make_offer(n):
+            shift_id = rng.choice(shift_ids)
+            wants = [s for s in rng.sample(shift_ids, 6) if s not in (shift_id, unwanted)]
+            return {'id': str(n), 'username': f'reporter{n}', 'shift_id': shift_id, 'wants': wants}
+        
+        offers = [make_offer(n) for n in range(count)]
+        book = SwapBook(offers)
+        newcomers = [dict(make_offer(count + n), username='newcomer') for n in range(matches)]
+        start = time.perf_counter()
+        found = sum(book.match(offer) is not None for offer in newcomers)
+        random_us = (time.perf_counter() - start) / matches * 1e6
+        
+        lonely = [dict(offer, shift_id=unwanted) for offer in newcomers]
+        start = time.perf_counter()
+        for offer in lonely:
+            book.match(offer)
+        unwanted_us = (time.perf_counter() - start) / matches * 1e6
+        
+        # Whole post: locked read, match, swap, rewrite of the offers file
+        post_ms = float('nan')
+        if count <= 10000:
+            with tempfile.TemporaryDirectory() as tmp:
+                market = SwapMarket(os.path.join(tmp, 'swap_offers.json'))
+                market._update(lambda data, book: [data['offers'].update({o['id']: o}) or book.add(o) for o in offers])
+                start = time.perf_counter()
+                for offer in newcomers[:20]:
+                    market.post(offer['username'], offer['shift_id'], offer['wants'], lambda trades: [])
+                post_ms = (time.perf_counter() - start) / 20 * 1000
+        print(f"{count:>12,} {random_us:>10.1f} {found:>6} {unwanted_us:>12.1f} {post_ms:>8.1f}")
+
+def memo_benchmark():
+    print("=" * 80)
+    print("SEEDED ALLOCATION AND RESULT CACHE KEY")
+    print("=" * 80)
+    print(f"\n{'reporters':>10} {'same result':>12} {'old hash ms':>12} {'hash ms':>8} {'rehash ms':>10} "
+          f"{'greedy ms':>10} {'optimal ms':>11}")
+    
+    for reporters in [1000, 10000, 100000]:
+        shifts = shifts_for(int(reporters * 126 / 123 / 2))
+        reporters_data, preferences = make_roster(shifts, reporters)
+        matrix = compile_preferences(preferences, shifts)
+        same = True
+        times = {}
+        for mode in (['greedy', 'optimal'] if reporters <= 10000 else ['greedy']):
+            start = time.perf_counter()
+            first = allocate(reporters_data, preferences, shifts, log=quiet, matrix=matrix, mode=mode, seed=99)
+            times[mode] = time.perf_counter() - start
+            again = allocate(reporters_data, preferences, shifts, log=quiet, matrix=matrix, mode=mode, seed=99)
+            same = same and first['assignments'] == again['assignments']
+        
+        start = time.perf_counter()
+        content_hash(preferences), reporters_hash(reporters_data)
+        old_hash = time.perf_counter() - start
+        
+        hasher = PreferencesHasher()
+        start = time.perf_counter()
+        first = hasher(preferences), reporters_hash(reporters_data)
+        hash_time = time.perf_counter() - start
+        
+        # A new version of the data (as loaded from storage) with one reporter's preferences changed
+        changed = {username: dict(prefs) for username, prefs in preferences.items()}
+        username = next(iter(changed))
+        changed[username]['top_10'] = changed[username]['top_10'][::-1]
+        start = time.perf_counter()
+        again = hasher(changed), reporters_hash(reporters_data)
+        rehash = time.perf_counter() - start
+        same = same and again[0] == preferences_hash(changed)[0] != first[0]
+        
+        optimal = f"{times['optimal'] * 1000:.1f}" if 'optimal' in times else '-'
+        print(f"{reporters:>10} {str(same):>12} {old_hash * 1000:>12.1f} {hash_time * 1000:>8.1f} "
+              f"{rehash * 1000:>10.1f} {times['greedy'] * 1000:>10.1f} {optimal:>11}")
+
+def trace_benchmark(runs=15):
+    print("=" * 80)
+    print("DECISION TRACE OVERHEAD (recording + to_dict, should stay under 5%)")
+    print("=" * 80)
+    print(f"\n{'reporters':>10} {'mode':>8} {'runs':>5} {'plain ms':>9} {'traced ms':>10} {'to_dict ms':>11} "
+          f"{'overhead':>9} {'under 5%':>9}")
+    
+    for reporters in [1000, 10000, 100000]:
+        shifts = shifts_for(int(reporters * 126 / 123 / 1.5))
+        reporters_data, preferences = make_roster(shifts, reporters)
+        matrix = compile_preferences(preferences, shifts)
+        for mode in (['greedy', 'optimal'] if reporters <= 10000 else ['greedy']):
+            # Min of N, interleaved and taking turns to go first, so machine noise hits both alike
+            n = runs if mode == 'greedy' and reporters < 100000 else 7
+            times = {False: [], True: []}
+            saved = []
+            for run in range(n):
+                for traced in ((False, True) if run % 2 else (True, False)):
+                    trace = DecisionTrace(mode) if traced else None
+                    gc.collect()
+                    start = time.perf_counter()
+                    allocate(reporters_data, preferences, shifts, log=quiet, matrix=matrix, mode=mode, seed=run,
+                             trace=trace)
+                    times[traced].append(time.perf_counter() - start)
+                    if traced:
+                        start = time.perf_counter()
+                        trace.to_dict(seed=run)
+                        saved.append(time.perf_counter() - start)
+            
+            plain, traced = min(times[False]), min(times[True])
+            overhead = ((traced + min(saved)) / plain - 1) * 100
+            print(f"{reporters:>10} {mode:>8} {n:>5} {plain * 1000:>9.1f} {traced * 1000:>10.1f} "
+                  f"{min(saved) * 1000:>11.1f} {overhead:>8.1f}% {str(overhead < 5):>9}")
+
+def main():
+    if '--trace' in sys.argv:
+        return trace_benchmark()
+    if '--memo' in sys.argv:
+        return memo_benchmark()
+    if '--swaps' in sys.argv:
+        return swap_benchmark()
+    if '--trading' in sys.argv:
+        return trading_benchmark()
+    if '--caps' in sys.argv:
+        return cap_benchmark()
+    if '--repair' in sys.argv:
+        return repair_benchmark()
+    if '--draws' in sys.argv:
+        return draw_scaling()
+    if '--scaling' in sys.argv:
+        return scaling()
+    if '--optimal' in sys.argv:
+        return compare_modes()
+    if '--matrix' in sys.argv:
+        return matrix_benchmark()
+    
+    sizes = [int(a) for a in sys.argv[1:]] or [84, 5000]
+    
+    print("=" * 80)
+    print("ALLOCATION BENCHMARK")
+    print("=" * 80)
+    
+    for size in sizes:
+        shifts = shifts_for(size)
+        reporters = reporters_for(shifts)
+        reporters_data, preferences = make_roster(shifts, reporters)
+        elapsed, result = time_allocation(shifts, reporters_data, preferences)
+        scan, catalog = time_lookups(shifts)
+        
+        stats = result['stats']
+        print(f"\n📅 {len(shifts)} shifts, {shifts.total_slots()} slots, {reporters} reporters "
+              f"({len(preferences)} with preferences)")
+        print(f"   allocate():          {elapsed * 1000:10.1f} ms  "
+              f"({elapsed / reporters * 1e6:.1f} µs per reporter)")
+        print(f"   assigned:            {stats['total_assigned']:10}  "
+              f"(capped week: {stats['week21_filled']})")
+        print(f"   lookup, list scan:   {scan * 1e6:10.2f} µs")
+        print(f"   lookup, catalog:     {catalog * 1e6:10.2f} µs  ({scan / catalog:.0f}x faster)")
+
+if __name__ == '__main__':
+    main()
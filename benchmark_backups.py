@@ -0,0 +1,136 @@
+"""
+Benchmark backup size and restore time at larger rosters
+
+Builds synthetic data at 1x, 10x and 100x today's roster (123 reporters,
+every one with preferences and assignments) and compares:
+
+1. Download size: the old pretty-printed JSON vs the gzip and xz archives
+2. Time to write each archive (what /api/backup streams)
+3. Time to parse and validate an archive (what /api/restore-backup reads)
+4. Time to apply the restored data with each storage backend
+5. Automatic backup cost in the object store, first run and unchanged rerun
+
+Usage:
+    python benchmark_backups.py            # 1x, 10x, 100x
+    python benchmark_backups.py 1 10 1000  # custom multipliers
+"""
+
+import io
+import json
+import random
+import shutil
+import sys
+import tempfile
+import time
+from backups import BackupStore, iter_archive, read_archive
+from storage import get_storage
+
+BASE_REPORTERS = 123
+SHIFTS = 84
+
+def make_datasets(scale, seed=42):
+    """Synthetic reporters/preferences/settings/assignments, scale x today's size"""
+    rng = random.Random(seed)
+    reporters = {'admin': {'name': 'Admin', 'password': 'scrypt:32768:8:1$' + 'a' * 110, 'is_manager': True}}
+    preferences = {}
+    assignments = {}
+    
+    for n in range(BASE_REPORTERS * scale):
+        username = f'reporter{n}'
+        reporters[username] = {
+            'name': f'Reporter {n}',
+            'email': f'reporter{n}@example.com',
+            # Hashes are random, so they compress about as badly as real ones
+            'password': 'scrypt:32768:8:1$' + ''.join(rng.choices('0123456789abcdef', k=110)),
+            'is_manager': False
+        }
+        shift_ids = rng.sample(range(80), 15)
+        preferences[username] = {
+            'top_10': shift_ids[:10],
+            'bottom_5': shift_ids[10:],
+            'shift_type_pref': dict(zip(['saturday_morning', 'sunday_morning', 'sunday_evening'],
+                                        rng.sample(['1', '2', '3'], 3))),
+            'submitted_at': '2025-12-01T09:00:00'
+        }
+        assignments[username] = rng.sample(range(SHIFTS), 2)
+    
+    settings = {'is_locked': True, 'deadline': '2025-12-15T17:00:00'}
+    return {'reporters': reporters, 'preferences': preferences,
+            'settings': settings, 'assignments': assignments}
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+def best_of(fn, runs=3):
+    """Fastest of a few runs (the rest is noise), plus the result"""
+    times = []
+    for _ in range(runs):
+        result, elapsed = timed(fn)
+        times.append(elapsed)
+    return result, min(times)
+
+def size_label(n):
+    if n >= 1024 * 1024:
+        return f'{n / 1024 / 1024:.1f} MB'
+    return f'{n / 1024:.1f} KB'
+
+def run(scale):
+    datasets = make_datasets(scale)
+    reporters = len(datasets['reporters']) - 1
+    print(f"\n{'=' * 80}")
+    print(f"{scale}x: {reporters} reporters")
+    print('=' * 80)
+    
+    legacy, legacy_time = best_of(lambda: json.dumps(dict(datasets, timestamp='now'), indent=2).encode('utf-8'))
+    gz, gz_time = best_of(lambda: b''.join(iter_archive(datasets)))
+    xz, xz_time = best_of(lambda: b''.join(iter_archive(datasets, compression='xz')), runs=1)
+    
+    print(f"\n📦 Download size and time to build it:")
+    print(f"   legacy JSON (indent=2) {size_label(len(legacy)):>10}  {legacy_time * 1000:8.1f} ms")
+    print(f"   gzip archive           {size_label(len(gz)):>10}  {gz_time * 1000:8.1f} ms  "
+          f"({len(legacy) / len(gz):.1f}x smaller)")
+    print(f"   xz archive             {size_label(len(xz)):>10}  {xz_time * 1000:8.1f} ms  "
+          f"({len(legacy) / len(xz):.1f}x smaller)")
+    
+    print(f"\n🔍 Parse + validate for restore:")
+    for label, payload in [('legacy JSON', legacy), ('gzip archive', gz), ('xz archive', xz)]:
+        (restored, _), elapsed = best_of(lambda: read_archive(io.BytesIO(payload)))
+        assert restored == datasets, f'{label} did not round-trip'
+        print(f"   {label:22} {elapsed * 1000:8.1f} ms")
+    
+    print(f"\n💾 Apply restored data:")
+    for backend in ['json', 'journal', 'sqlite']:
+        data_dir = tempfile.mkdtemp(prefix=f'bench_restore_{backend}_')
+        try:
+            storage = get_storage(data_dir, backend)
+            _, elapsed = best_of(lambda: storage.replace_all(datasets))
+            assert storage.load('preferences') == datasets['preferences']
+            print(f"   {backend:22} {elapsed * 1000:8.1f} ms")
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    
+    backup_dir = tempfile.mkdtemp(prefix='bench_backups_')
+    try:
+        store = BackupStore(backup_dir)
+        first, first_time = timed(lambda: store.create(datasets))
+        second, second_time = timed(lambda: store.create(datasets))
+        first_bytes = store._read_manifest(first)['bytes_written']
+        second_bytes = store._read_manifest(second)['bytes_written']
+        print(f"\n🗄️  Automatic backup (object store):")
+        print(f"   first backup           {size_label(first_bytes):>10}  {first_time * 1000:8.1f} ms")
+        print(f"   unchanged data         {size_label(second_bytes):>10}  {second_time * 1000:8.1f} ms")
+    finally:
+        shutil.rmtree(backup_dir, ignore_errors=True)
+
+def main():
+    scales = [int(a) for a in sys.argv[1:]] or [1, 10, 100]
+    print("=" * 80)
+    print("BACKUP FORMAT BENCHMARK")
+    print("=" * 80)
+    for scale in scales:
+        run(scale)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+"""
+Allocation benchmark suite on synthetic seasons, with JSON Lines output
+
+/api/populate-test-data only gives the real reporters uniform random
+preferences over today's season. This suite generates whole seasons -
+any number of reporters, weeks, shifts per weekend and slots per shift -
+with preferences skewed the way real ones are: a few shifts are wanted by
+many reporters (a Zipf-like popularity), and holiday weekends (Christmas
+and New Year) far more than the rest.
+
+For each roster size and mode it runs what /api/allocate does, phase by
+phase, then the allocation report and both exports:
+
+    hash_inputs          content hashes of preferences and reporters (result cache key)
+    compile_preferences  the reporter x shift rank matrix
+    allocate.<phase>     each phase the allocator reports (preferences, random,
+                         network, solving, matching, trading)
+    score                score_allocation() of the draw
+    select_draw          best draw, Pareto set and draw summaries
+    trace                the decision trace spelled out for saving
+    save                 assignments, meta and trace written to a scratch data dir
+    allocation_report    score plus the report body, as /api/allocation-report
+    export_excel         the .xlsx schedule (reports.schedule_workbook)
+    export_mailmerge     the mail merge CSV (reports.mailmerge_csv)
+
+Each phase is one JSON object per line on stdout (best of --runs), so
+runs can be kept and compared; progress goes to stderr. --baseline
+compares against an earlier run's output and exits with status 1 if any
+phase got slower than --tolerance times its old time.
+
+Usage:
+    python benchmark_suite.py                          # 123 to 100,000 reporters
+    python benchmark_suite.py 123 5000 > run.jsonl     # chosen roster sizes
+    python benchmark_suite.py --mode optimal 123 10000
+    python benchmark_suite.py --weeks 30 --per-weekend 2 --slots 3 --skew 1.2 --holiday-boost 20
+    python benchmark_suite.py --baseline old.jsonl > new.jsonl
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from allocator import ALLOCATOR_VERSION, WEEK_21_MAX_SLOTS, allocate, best_draw, draw_summary, pareto_front
+from caps import default_caps
+from decisions import DecisionTrace
+from preference_matrix import compile_preferences, score_allocation
+from previews import preferences_hash, reporters_hash
+from reports import allocation_report_data, mailmerge_csv, schedule_workbook
+from shifts import WEEKEND_SHIFTS, ShiftType, generate_shifts
+from storage import get_storage, save_json
+
+SIZES = [123, 1000, 10000, 100000]
+
+# Optimal mode's flow grows faster than linearly; by default it stops here
+OPTIMAL_MAX_REPORTERS = 10000
+
+def is_holiday(shift):
+    """Christmas and New Year weekends: a Saturday from Dec 20 to Jan 3"""
+    saturday = datetime.strptime(shift.date, '%Y-%m-%d') - timedelta(days=1 if shift.day == 'Sunday' else 0)
+    return (saturday.month == 12 and saturday.day >= 20) or (saturday.month == 1 and saturday.day <= 3)
+
+def make_season(reporters, weeks=None, per_weekend=4, slots=None, skew=1.0, holiday_boost=10.0,
+                submitted=0.9, seed=42):
+    """A synthetic season: (shifts, reporters_data, preferences).
+    
+    Without weeks, the season is as long as it takes to give today's 126
+    slots per 123 reporters. Shift popularity is 1 / rank ** skew over a
+    random order of the shifts (skew 0: every shift alike), times
+    holiday_boost on holiday weekends. Top 10s are drawn by popularity,
+    bottom 5s uniformly from the rest. About `submitted` of the reporters
+    have preferences.
+    """
+    rng = random.Random(seed)
+    if weeks is None:
+        weekend_slots = sum(s if slots is None else slots for _, _, _, s in WEEKEND_SHIFTS[:per_weekend])
+        weeks = max(2, math.ceil(reporters * 126 / 123 / weekend_slots))
+    shifts = generate_shifts(weeks=weeks, per_weekend=per_weekend, slots=slots)
+    
+    # Top 10s stay out of the capped last week, as in today's data, except for a few
+    capped_week = shifts.weeks[-1]
+    main = [shift for shift in shifts if shift.week != capped_week]
+    order = list(range(len(main)))
+    rng.shuffle(order)
+    weights = [0.0] * len(main)
+    for rank, i in enumerate(order, start=1):
+        weights[i] = rank ** -skew * (holiday_boost if is_holiday(main[i]) else 1.0)
+    cumulative = []
+    total = 0.0
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+    main_ids = [shift.id for shift in main]
+    all_ids = shifts.ids()
+    kinds = [t.value for t in ShiftType if t is not ShiftType.SATURDAY and shifts.by_type[t]]
+    
+    reporters_data = {'admin': {'name': 'Admin', 'is_manager': True}}
+    preferences = {}
+    for n in range(reporters):
+        username = f'reporter{n}'
+        reporters_data[username] = {'name': f'Reporter {n}', 'is_manager': False}
+        if rng.random() >= submitted:
+            continue
+        # Weighted draws until there are ten different shifts
+        top_10 = {}
+        while len(top_10) < 10:
+            for shift_id in rng.choices(main_ids, cum_weights=cumulative, k=20):
+                top_10.setdefault(shift_id, None)
+        top_10 = list(top_10)[:10]
+        if rng.random() < 0.1:
+            top_10[rng.randrange(10)] = rng.choice(shifts.by_week[capped_week]).id
+        bottom_5 = []
+        while len(bottom_5) < 5:
+            shift_id = rng.choice(all_ids)
+            if shift_id not in top_10 and shift_id not in bottom_5:
+                bottom_5.append(shift_id)
+        preferences[username] = {
+            'top_10': top_10,
+            'bottom_5': bottom_5,
+            'shift_type_pref': {kind: str(i + 1) for i, kind in enumerate(rng.sample(kinds, len(kinds)))}
+        }
+    return shifts, reporters_data, preferences
+
+class PhaseClock:
+    """Seconds per phase, from progress(phase, percent) calls: a phase runs until the next one starts"""
+    
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+        self.times = {}
+        self.phase = prefix + 'setup'
+        self.started = time.perf_counter()
+    
+    def __call__(self, phase, percent=None):
+        phase = self.prefix + phase
+        if phase != self.phase:
+            self.stop()
+            self.phase = phase
+    
+    def stop(self):
+        now = time.perf_counter()
+        self.times[self.phase] = self.times.get(self.phase, 0.0) + now - self.started
+        self.started = now
+
+def timed(times, phase, fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    times[phase] = time.perf_counter() - start
+    return result
+
+def quiet(*args):
+    pass
+
+def run_once(shifts, reporters_data, preferences, mode, trade, data_dir, seed):
+    """One pass through every phase; returns ({phase: seconds}, result stats)"""
+    times = {}
+    timed(times, 'hash_inputs', lambda: (preferences_hash(preferences)[0], reporters_hash(reporters_data)))
+    matrix = timed(times, 'compile_preferences', compile_preferences, preferences, shifts)
+    caps = default_caps(shifts, WEEK_21_MAX_SLOTS)
+    
+    clock = PhaseClock('allocate.')
+    trace = DecisionTrace(mode)
+    result = allocate(reporters_data, preferences, shifts, log=quiet, mode=mode, matrix=matrix, progress=clock,
+                      caps=caps, trade=trade, seed=seed, trace=trace)
+    clock.stop()
+    times.update(clock.times)
+    
+    score = timed(times, 'score', score_allocation, result['assignments'], matrix)
+    draws = [(seed, result, score)]
+    chosen = timed(times, 'select_draw', lambda: (best_draw(draws), pareto_front(draws),
+                                                    [draw_summary(draw) for draw in draws]))[0]
+    saved_trace = timed(times, 'trace', trace.to_dict, caps, seed)
+    
+    storage = get_storage(data_dir, 'json')
+    meta = {'mode': mode, 'allocator_version': ALLOCATOR_VERSION, 'seed': seed, 'draws': [draw_summary(chosen)]}
+    def save():
+        storage.commit_allocation(result['assignments'])
+        save_json(os.path.join(data_dir, 'allocation_meta.json'), meta)
+        save_json(os.path.join(data_dir, 'allocation_trace.json'), saved_trace)
+    timed(times, 'save', save)
+    
+    assignments = result['assignments']
+    timed(times, 'allocation_report', lambda: allocation_report_data(score_allocation(assignments, matrix),
+                                                                     reporters_data, result.get('trading')))
+    timed(times, 'export_excel', schedule_workbook, assignments, reporters_data, matrix, shifts)
+    timed(times, 'export_mailmerge', mailmerge_csv, assignments, reporters_data, shifts)
+    
+    stats = {'assigned': result['stats']['total_assigned'], 'top_10': score['top_10'],
+             'fallback': len(score['fallback']), 'bottom_5': len(score['bottom_5'])}
+    return times, stats
+
+def run_suite(args):
+    """Yields one record per (roster size, mode, phase)"""
+    for reporters in args.sizes:
+        start = time.perf_counter()
+        shifts, reporters_data, preferences = make_season(
+            reporters, args.weeks, args.per_weekend, args.slots, args.skew, args.holiday_boost,
+            args.submitted, args.seed)
+        generate = time.perf_counter() - start
+        holiday_shifts = sum(is_holiday(shift) for shift in shifts)
+        print(f"📅 {reporters} reporters, {len(shifts)} shifts ({holiday_shifts} on holidays), "
+              f"{shifts.total_slots()} slots: generated in {generate:.1f}s", file=sys.stderr)
+        
+        modes = args.mode or ['greedy'] + (['optimal'] if reporters <= OPTIMAL_MAX_REPORTERS else [])
+        for mode in modes:
+            best = {}
+            with tempfile.TemporaryDirectory() as data_dir:
+                for run in range(args.runs):
+                    times, stats = run_once(shifts, reporters_data, preferences, mode, args.trade, data_dir,
+                                            args.seed + run)
+                    for phase, seconds in times.items():
+                        best[phase] = min(seconds, best.get(phase, seconds))
+            print(f"   {mode:8} {sum(best.values()):8.2f}s total, {stats['assigned']} assigned, "
+                  f"{stats['top_10']} top 10", file=sys.stderr)
+            
+            for phase, seconds in best.items():
+                yield {
+                    'suite': 'allocation',
+                    'allocator_version': ALLOCATOR_VERSION,
+                    'reporters': reporters,
+                    'shifts': len(shifts),
+                    'slots': shifts.total_slots(),
+                    'per_weekend': args.per_weekend,
+                    'skew': args.skew,
+                    'holiday_boost': args.holiday_boost,
+                    'mode': mode,
+                    'trade': args.trade,
+                    'phase': phase,
+                    'seconds': round(seconds, 6),
+                    'us_per_reporter': round(seconds / reporters * 1e6, 3),
+                    'runs': args.runs,
+                    **stats
+                }
+
+def record_key(record):
+    return tuple(record.get(k) for k in ('reporters', 'shifts', 'per_weekend', 'skew', 'holiday_boost', 'mode',
+                                         'trade', 'phase'))
+
+def load_baseline(path):
+    baseline = {}
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            if 'phase' in record and 'seconds' in record:
+                baseline[record_key(record)] = record['seconds']
+    return baseline
+
+def main():
+    parser = argparse.ArgumentParser(description='Allocation benchmark suite (JSON Lines on stdout)')
+    parser.add_argument('sizes', nargs='*', type=int, default=SIZES, help='roster sizes (reporters)')
+    parser.add_argument('--mode', action='append', choices=['greedy', 'optimal'],
+                        help=f'allocation mode (repeatable; default greedy, plus optimal up to '
+                             f'{OPTIMAL_MAX_REPORTERS} reporters)')
+    parser.add_argument('--trade', action='store_true', help='finish with the top trading cycles pass')
+    parser.add_argument('--weeks', type=int, help='season length (default: enough slots for everyone)')
+    parser.add_argument('--per-weekend', type=int, default=4, choices=range(1, len(WEEKEND_SHIFTS) + 1),
+                        help='shifts per weekend')
+    parser.add_argument('--slots', type=int, help="slots per shift (default: today's 1, 1, 2, 2)")
+    parser.add_argument('--skew', type=float, default=1.0, help='popularity skew (0 = uniform)')
+    parser.add_argument('--holiday-boost', type=float, default=10.0,
+                        help='how much more popular holiday weekends are')
+    parser.add_argument('--submitted', type=float, default=0.9, help='share of reporters with preferences')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--runs', type=int, default=3, help='best of this many runs per phase')
+    parser.add_argument('--baseline', help='earlier output to compare against')
+    parser.add_argument('--tolerance', type=float, default=1.25, help='slowdown that counts as a regression')
+    args = parser.parse_args()
+    
+    baseline = load_baseline(args.baseline) if args.baseline else {}
+    print(json.dumps({'suite': 'allocation', 'environment': {
+        'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+        'started': datetime.now().isoformat()}}), flush=True)
+    
+    regressions = []
+    for record in run_suite(args):
+        old = baseline.get(record_key(record))
+        if old:
+            record['baseline_seconds'] = old
+            # Phases under a millisecond are all noise
+            if record['seconds'] > old * args.tolerance and record['seconds'] > 0.001:
+                regressions.append(record)
+        print(json.dumps(record), flush=True)
+    
+    for record in regressions:
+        print(f"🐢 {record['reporters']} reporters, {record['mode']}, {record['phase']}: "
+              f"{record['seconds']:.4f}s (was {record['baseline_seconds']:.4f}s)", file=sys.stderr)
+    if regressions:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
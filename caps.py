@@ -0,0 +1,163 @@
+"""
+Capacity caps on groups of shifts
+
+The last week of the season (week 21) used to be the one special case: at
+most WEEK_21_MAX_SLOTS reporters in total, and only reporters who put one
+of its shifts in their top 10. A cap generalises that to any group of
+shifts - a week, a holiday weekend, every Sunday evening - declared in the
+'allocation_caps' setting:
+
+    {"name": "week 21", "weeks": [21], "max_slots": 3, "top_10_only": true}
+    {"name": "Christmas", "dates": ["2025-12-27", "2025-12-28"], "max_slots": 4}
+
+A cap's group is the shifts matching every selector it gives (weeks, days,
+kinds, dates, shift_ids). Shifts of a top_10_only cap are only handed out
+from top-10 preferences, never as a fallback, emergency or random shift.
+Without the setting, the week 21 cap above applies.
+
+CapCounter keeps the slots used per cap and, per shift, how many of its caps
+are full. Checking a shift is one list index however many caps overlap it;
+only the assignment that fills (or frees) a cap's last slot walks the cap's
+shifts.
+"""
+
+from shifts import ShiftType
+
+# Group selectors a cap may use, and the Shift field each one matches
+CAP_SELECTORS = {'weeks': 'week', 'days': 'day', 'dates': 'date', 'shift_ids': 'id'}
+
+class Cap:
+    """At most max_slots reporters across a group of shifts"""
+    
+    __slots__ = ('name', 'shift_ids', 'max_slots', 'top_10_only')
+    
+    def __init__(self, name, shift_ids, max_slots, top_10_only=False):
+        self.name = name
+        self.shift_ids = frozenset(shift_ids)
+        self.max_slots = max_slots
+        self.top_10_only = top_10_only
+    
+    def to_dict(self):
+        return {'name': self.name, 'shift_ids': sorted(self.shift_ids),
+                'max_slots': self.max_slots, 'top_10_only': self.top_10_only}
+
+def default_caps(shifts, max_slots, capped_week=None):
+    """The original rule: the last week (or capped_week) takes max_slots, top 10 only"""
+    if capped_week is None:
+        capped_week = shifts.weeks[-1]
+    return [Cap(f'week {capped_week}', (s.id for s in shifts.by_week.get(capped_week, [])),
+                max_slots, top_10_only=True)]
+
+def parse_caps(specs, shifts):
+    """Caps from the 'allocation_caps' setting; raises ValueError if malformed"""
+    if not isinstance(specs, list):
+        raise ValueError('allocation_caps must be a list')
+    caps = []
+    for n, spec in enumerate(specs, start=1):
+        if not isinstance(spec, dict):
+            raise ValueError(f'Cap {n} must be an object')
+        name = str(spec.get('name') or f'cap {n}')
+        if any(cap.name == name for cap in caps):
+            raise ValueError(f'Two caps are named {name!r}')
+        max_slots = spec.get('max_slots')
+        if not isinstance(max_slots, int) or isinstance(max_slots, bool) or max_slots < 0:
+            raise ValueError(f'{name}: max_slots must be a non-negative integer')
+        
+        members = {shift.id for shift in shifts}
+        selected = False
+        for selector, field in CAP_SELECTORS.items():
+            if selector in spec:
+                if not isinstance(spec[selector], list):
+                    raise ValueError(f'{name}: {selector} must be a list')
+                values = set(spec[selector])
+                members &= {shift.id for shift in shifts if shift[field] in values}
+                selected = True
+        if 'kinds' in spec:
+            if not isinstance(spec['kinds'], list):
+                raise ValueError(f'{name}: kinds must be a list')
+            kinds = [ShiftType.parse(kind) for kind in spec['kinds']]
+            if None in kinds:
+                raise ValueError(f'{name}: unknown shift kind in {spec["kinds"]}')
+            members &= {shift.id for kind in kinds for shift in shifts.by_type[kind]}
+            selected = True
+        if not selected:
+            raise ValueError(f'{name}: give at least one of {", ".join(CAP_SELECTORS)}, kinds')
+        caps.append(Cap(name, members, max_slots, bool(spec.get('top_10_only'))))
+    return caps
+
+def restricted_shifts(caps):
+    """Ids of shifts that are only given out from top-10 preferences"""
+    return frozenset().union(*(cap.shift_ids for cap in caps if cap.top_10_only))
+
+def describe_caps(caps):
+    """For the allocation log, e.g. 'CAP WEEK 21 AT 3 SLOTS'"""
+    return '; '.join(f'CAP {cap.name.upper()} AT {cap.max_slots} SLOTS' for cap in caps) or 'NO CAPS'
+
+def cap_tree(caps):
+    """Parent of each cap (index, or None) if every two caps are nested or disjoint.
+    
+    Optimal mode routes each shift's flow through its caps, innermost
+    first, which only works for such a laminar family. Raises ValueError
+    for caps that partly overlap.
+    """
+    order = sorted(range(len(caps)), key=lambda i: -len(caps[i].shift_ids))
+    parents = [None] * len(caps)
+    for position, i in enumerate(order):
+        mine = caps[i].shift_ids
+        for j in order[:position]:
+            theirs = caps[j].shift_ids
+            if mine <= theirs:
+                # Larger caps come first, so the last container found is the smallest
+                parents[i] = j
+            elif mine & theirs:
+                raise ValueError(f'Caps "{caps[i].name}" and "{caps[j].name}" overlap without one '
+                                 f'containing the other, which optimal mode cannot enforce')
+    return parents
+
+class CapCounter:
+    """Slots used per cap, with an O(1) 'is any of this shift's caps full' check"""
+    
+    def __init__(self, caps, shifts):
+        self.caps = caps
+        self.used = [0] * len(caps)
+        size = max(shifts.ids(), default=-1) + 1
+        self.shift_caps = [()] * size
+        for i, cap in enumerate(caps):
+            for shift_id in cap.shift_ids:
+                self.shift_caps[shift_id] += (i,)
+        # Number of full caps each shift belongs to
+        self.blocked = [0] * size
+        for i, cap in enumerate(caps):
+            if cap.max_slots <= 0:
+                self._block(i, 1)
+    
+    def _block(self, i, step):
+        """Add step to the blocked count of cap i's shifts; returns the shifts that changed state"""
+        changed = []
+        blocked = self.blocked
+        for shift_id in self.caps[i].shift_ids:
+            blocked[shift_id] += step
+            if blocked[shift_id] == (1 if step > 0 else 0):
+                changed.append(shift_id)
+        return changed
+    
+    def has_room(self, shift_id):
+        return not self.blocked[shift_id]
+    
+    def add(self, shift_id):
+        """Count one reporter on the shift; returns the shifts that just became blocked"""
+        changed = []
+        for i in self.shift_caps[shift_id]:
+            self.used[i] += 1
+            if self.used[i] == self.caps[i].max_slots:
+                changed += self._block(i, 1)
+        return changed
+    
+    def remove(self, shift_id):
+        """Take one reporter off the shift; returns the shifts that just became unblocked"""
+        changed = []
+        for i in self.shift_caps[shift_id]:
+            if self.used[i] == self.caps[i].max_slots:
+                changed += self._block(i, -1)
+            self.used[i] -= 1
+        return changed
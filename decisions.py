@@ -0,0 +1,167 @@
+"""
+Allocation decision trace
+
+The allocator used to print one line per reporter (✓ top 10, ⚠ fallback,
+🚨 emergency, 🎲 random). Under gunicorn that is synchronous I/O on the
+request path, and the lines were gone once the log rotated. Instead,
+allocate() adds six values per decision to a DecisionTrace:
+
+    reporter, shift id or None, phase, detail, skipped, top 10 or None
+
+- phase: TOP_10, FALLBACK, EMERGENCY, RANDOM, UNASSIGNED or TRADED
+- detail: the top-10 rank (TOP_10, TRADED) or the rank of the shift type
+  used (FALLBACK)
+- skipped: bit i is set if top-10 choice i + 1 was passed over because one
+  of its caps was full, bit 10 + i if it is not a shift at all; the other
+  choices passed over were full
+- top 10: the reporter's own top-10 list, recorded as it is rather than
+  copied, if they were turned away from any of it: choices 1 to r - 1 for
+  whoever got choice r, all ten for a fallback or worse
+
+The values go into one flat list (records.extend), not a tuple each:
+100,000 tuples kept alive set off the garbage collector over and over
+while the allocation runs, which cost more than the recording itself.
+to_dict() only slices the list into columns for saving, so recording and
+saving together stay under 5% of the allocation (benchmark_allocation.py
+--trace). Which choices were turned down and why, and who took each shift
+first, are only worked out when someone asks: explain() answers "why did X
+get a fallback shift" and select() lists decisions, both from the saved
+columns.
+
+The trace describes the allocation as it was made; later repairs and swaps
+are not in it.
+"""
+
+TOP_10, FALLBACK, EMERGENCY, RANDOM, UNASSIGNED, TRADED = range(6)
+PHASES = ('top_10', 'fallback', 'emergency', 'random', 'unassigned', 'traded')
+
+# Saved columns, one entry per decision
+COLUMNS = ('reporter', 'shift_id', 'phase', 'detail', 'skipped', 'top_10')
+WIDTH = len(COLUMNS)  # values recorded per decision
+
+class DecisionTrace:
+    """Six values per decision (see COLUMNS; the top 10 last), in order, in one list"""
+    
+    __slots__ = ('mode', 'records')
+    
+    def __init__(self, mode='greedy'):
+        self.mode = mode
+        self.records = []
+    
+    def __len__(self):
+        return len(self.records) // WIDTH
+    
+    def counts(self):
+        """Decisions per phase name"""
+        phases = self.records[2::WIDTH]
+        return {name: phases.count(code) for code, name in enumerate(PHASES)}
+    
+    def to_dict(self, caps=(), seed=None):
+        """The trace as JSON-friendly columns (see COLUMNS); phases are indexes into PHASES.
+        
+        Optimal mode places everyone at once, so there a choice was passed
+        over if it (or one of its caps) was full once everyone was placed.
+        """
+        records = self.records
+        columns = [records[i::WIDTH] for i in range(WIDTH)]
+        phases = columns[2]
+        
+        # Only the shifts that have caps, to name the cap that turned someone away
+        cap_names = {}
+        for cap in caps:
+            for shift_id in cap.shift_ids:
+                cap_names[str(shift_id)] = '/'.join(filter(None, (cap_names.get(str(shift_id)), cap.name)))
+        return {
+            'mode': self.mode,
+            'seed': seed,
+            'phases': list(PHASES),
+            'counts': {name: phases.count(code) for code, name in enumerate(PHASES)},
+            'cap_names': cap_names,
+            'columns': dict(zip(COLUMNS, columns))
+        }
+
+def _ordinal(n):
+    return f"{n}{'th' if 10 <= n % 100 <= 20 else {1: 'st', 2: 'nd', 3: 'rd'}.get(n % 10, 'th')}"
+
+def _decision(trace, i):
+    """Decision i of a saved trace as a dict, with the reason each passed-over choice was rejected"""
+    columns = trace['columns']
+    phase, detail, skipped = columns['phase'][i], columns['detail'][i], columns['skipped'][i]
+    tried = columns['top_10'][i] or ()
+    if phase == TOP_10:
+        tried = tried[:detail - 1]
+    rejected = []
+    for j, choice in enumerate(tried):
+        if skipped >> (10 + j) & 1:
+            reason = 'unknown'
+        elif skipped >> j & 1:
+            reason = 'cap:' + trace['cap_names'].get(str(choice), '')
+        else:
+            reason = 'full'
+        rejected.append({'shift_id': choice, 'reason': reason})
+    return {
+        'reporter': columns['reporter'][i],
+        'shift_id': columns['shift_id'][i],
+        'phase': PHASES[phase],
+        'detail': detail,
+        'rejected': rejected,
+        'position': i + 1
+    }
+
+def explain(trace, reporter):
+    """The reporter's decisions from a saved trace, each with a sentence saying why.
+    
+    A rejected shift that was full lists the reporters placed on it before
+    this one ('taken_by'), read back from the decisions that came earlier;
+    in optimal mode, where everyone is placed at once, all of its holders.
+    """
+    columns = trace['columns']
+    mine = [i for i, username in enumerate(columns['reporter']) if username == reporter]
+    if not mine:
+        return []
+    
+    holders = {}  # shift id -> reporters placed on it before this reporter's turn
+    shift_ids, phases, reporters = columns['shift_id'], columns['phase'], columns['reporter']
+    for i in range(len(reporters) if trace['mode'] == 'optimal' else mine[0]):
+        if shift_ids[i] is not None and phases[i] != TRADED and reporters[i] != reporter:
+            holders.setdefault(shift_ids[i], []).append(reporters[i])
+    
+    explained = []
+    for i in mine:
+        decision = _decision(trace, i)
+        shift_id, phase, detail, rejected = (decision[k] for k in ('shift_id', 'phase', 'detail', 'rejected'))
+        for entry in rejected:
+            entry['taken_by'] = holders.get(entry['shift_id'], []) if entry['reason'] == 'full' else []
+        turned_away = f"choices {', '.join(str(r['shift_id']) for r in rejected)} had no room" if rejected else ''
+        if phase == 'top_10':
+            why = f"Got their {_ordinal(detail)} choice, shift {shift_id}"
+            why += f" ({turned_away})" if turned_away else ''
+        elif phase == 'fallback':
+            why = (f"None of their top 10 had room ({turned_away}); got shift {shift_id}, "
+                   f"the first open shift of their {_ordinal(detail)} shift type outside their bottom 5")
+        elif phase == 'emergency':
+            why = (f"None of their top 10 or preferred shift types had room; got shift {shift_id}, "
+                   f"the first open shift left")
+        elif phase == 'random':
+            why = f"No complete preferences; got a random open shift, {shift_id}"
+        elif phase == 'traded':
+            why = f"Traded up to their {_ordinal(detail)} choice, shift {shift_id}, in the trading pass"
+        else:
+            why = "Could not be placed - no capacity remaining"
+        if trace['mode'] == 'optimal' and phase != 'traded':
+            why += ' (optimal mode: placed by the min-cost flow with everyone else at once)'
+        decision['why'] = why
+        explained.append(decision)
+    return explained
+
+def select(trace, phase=None, shift_id=None, limit=100):
+    """Saved decisions matching a phase name and/or shift id (at most limit), as dicts"""
+    columns = trace['columns']
+    code = PHASES.index(phase) if phase is not None else None
+    found = []
+    for i, (shift, decided) in enumerate(zip(columns['shift_id'], columns['phase'])):
+        if (code is None or decided == code) and (shift_id is None or shift == shift_id):
+            found.append(_decision(trace, i))
+            if len(found) >= limit:
+                break
+    return found
@@ -0,0 +1,191 @@
+"""
+Background allocation jobs
+
+Allocation can outlast gunicorn's 30 second worker timeout, so
+/api/allocate starts a job and returns its id at once. The job runs in a
+thread of the worker that received the request and writes its state to
+data/jobs/<id>.json as it goes (phase, percent done, then the result or
+the error), so any worker can answer status polls.
+
+Only one job runs at a time across all workers: the runner holds an
+exclusive flock on data/jobs/runner.lock for the whole job. A request for
+the same inputs as the running job (same key) attaches to it instead of
+being refused. If a worker dies mid-job the kernel drops its flock, and
+the job is reported as failed the next time anyone looks at it.
+"""
+
+import json
+import os
+import secrets
+import threading
+import time
+import traceback
+from datetime import datetime
+from storage import HAS_FCNTL, write_json
+if HAS_FCNTL:
+    import fcntl
+
+# Job files kept on disk; older finished jobs are removed
+MAX_JOBS = 20
+
+# Progress is written to the job file at most this often
+PROGRESS_INTERVAL = 0.25
+
+class JobBusy(Exception):
+    """Another job (with different inputs) is running"""
+    
+    def __init__(self, job):
+        super().__init__('Another allocation is already running')
+        self.job = job
+
+class JobRunner:
+    """Runs one job at a time across processes, tracked in job files"""
+    
+    def __init__(self, directory, max_jobs=MAX_JOBS):
+        self.directory = directory
+        self.max_jobs = max_jobs
+        self.lock_path = os.path.join(directory, 'runner.lock')
+        self.current_path = os.path.join(directory, 'current.json')
+        # Without fcntl (Windows) only threads of this process are serialised
+        self._thread_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+    
+    def _path(self, job_id):
+        return os.path.join(self.directory, f'job_{job_id}.json')
+    
+    def _read(self, path):
+        # Plain read: job files come and go, so they stay out of the storage cache
+        with open(path) as f:
+            return json.load(f)
+    
+    def _try_lock(self):
+        """The held lock (to release when the job ends), or None if a job is running"""
+        if not HAS_FCNTL:
+            return self._thread_lock if self._thread_lock.acquire(blocking=False) else None
+        f = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return None
+        return f
+    
+    def _release(self, lock):
+        if HAS_FCNTL:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+            lock.close()
+        else:
+            lock.release()
+    
+    def _is_running(self):
+        lock = self._try_lock()
+        if lock is None:
+            return True
+        self._release(lock)
+        return False
+    
+    def get(self, job_id):
+        """The job's state dict, or None"""
+        if not (isinstance(job_id, str) and job_id.isalnum()):
+            return None
+        try:
+            job = self._read(self._path(job_id))
+        except (OSError, ValueError):
+            return None
+        if job['state'] == 'running' and not self._is_running():
+            # Nobody holds the runner lock any more: the worker died mid-job
+            job = dict(job, state='failed', error='Interrupted (the worker running it stopped)')
+        return job
+    
+    def submit(self, key, fn, description=''):
+        """Start fn(progress) as a job, or attach to the running job with the same key.
+        
+        Returns (job, attached). Raises JobBusy if a different job is running.
+        progress(phase, percent) may be called by fn to report how far it is.
+        """
+        # Compare keys the way they read back from a job file (tuples -> lists)
+        key = json.loads(json.dumps(key))
+        lock = self._try_lock()
+        if lock is None:
+            running = self._current()
+            if running is not None and running['state'] == 'running' and running['key'] == key:
+                return running, True
+            raise JobBusy(running)
+        
+        try:
+            job = {
+                'id': secrets.token_hex(8),
+                'key': key,
+                'description': description,
+                'state': 'running',
+                'phase': 'starting',
+                'percent': 0,
+                'started_at': datetime.now().isoformat(),
+                'finished_at': None,
+                'error': None,
+                'result': None
+            }
+            # The runner lock serialises every writer, so the files need no lock of their own
+            write_json(self._path(job['id']), job)
+            write_json(self.current_path, {'id': job['id']})
+            self._prune()
+            thread = threading.Thread(target=self._run, args=(job, fn, lock),
+                                      name=f"allocation-job-{job['id']}", daemon=True)
+            thread.start()
+        except Exception:
+            self._release(lock)
+            raise
+        return job, False
+    
+    def _current(self):
+        try:
+            return self.get(self._read(self.current_path)['id'])
+        except (OSError, ValueError, KeyError):
+            return None
+    
+    def _run(self, job, fn, lock):
+        path = self._path(job['id'])
+        last_write = 0
+        
+        def progress(phase, percent):
+            nonlocal last_write
+            now = time.monotonic()
+            changed = phase != job['phase']
+            job['phase'] = phase
+            job['percent'] = round(min(max(percent, 0), 100), 1)
+            if changed or now - last_write >= PROGRESS_INTERVAL:
+                last_write = now
+                write_json(path, job)
+        
+        try:
+            result = fn(progress)
+            job.update(state='done', phase='done', percent=100, result=result)
+        except Exception as e:
+            traceback.print_exc()
+            job.update(state='failed', error=str(e))
+        finally:
+            job['finished_at'] = datetime.now().isoformat()
+            try:
+                write_json(path, job)
+            finally:
+                self._release(lock)
+    
+    def _prune(self):
+        entries = []
+        names = os.listdir(self.directory)
+        for name in names:
+            if name.startswith('job_') and name.endswith('.json'):
+                path = os.path.join(self.directory, name)
+                try:
+                    entries.append((os.path.getmtime(path), path))
+                except OSError:
+                    continue
+        entries.sort(reverse=True)
+        stale = [path for _, path in entries[self.max_jobs:]]
+        # .lock sidecars left by job files saved with save_json before
+        stale += [os.path.join(self.directory, name) for name in names if name.endswith('.json.lock')]
+        for path in stale:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,45 @@
+"""
+Migrate the JSON data files into the SQLite storage backend
+
+This script:
+1. Reads data/reporters.json, preferences.json, settings.json, assignments.json
+2. Copies them into data/weekend_reporter.db (or the SQLITE_PATH env var)
+3. Shows record counts so you can check nothing was missed
+
+Run it once, then start the app with STORAGE_BACKEND=sqlite.
+The JSON files are left untouched so you can switch back.
+"""
+
+import os
+import sys
+from storage import DATASETS, SQLITE_FILENAME, migrate_json_to_sqlite
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+
+def main():
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else DATA_DIR
+    db_path = os.environ.get('SQLITE_PATH', os.path.join(data_dir, SQLITE_FILENAME))
+    
+    print("=" * 80)
+    print("MIGRATING JSON DATA FILES TO SQLITE")
+    print("=" * 80)
+    print(f"  Source: {data_dir}")
+    print(f"  Target: {db_path}")
+    
+    migrated = migrate_json_to_sqlite(data_dir, db_path)
+    
+    print("\n📋 Migrated datasets:")
+    for dataset in DATASETS:
+        if dataset in migrated:
+            print(f"  ✓ {dataset:12} {migrated[dataset]} records")
+        else:
+            print(f"  ✗ {dataset:12} not found - skipped")
+    
+    print("\n📋 Next Steps:")
+    print("  1. Set STORAGE_BACKEND=sqlite in the app environment")
+    print("  2. Restart the app")
+    print("\n" + "=" * 80)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""
+Min-cost max-flow solver for the optimal allocation mode
+
+Primal-dual successive shortest paths: each phase runs Dijkstra on reduced
+costs (node potentials keep them non-negative), then pushes a blocking flow
+(Dinic style, BFS levels plus current-arc DFS) through every arc whose
+reduced cost is zero. All augmenting paths of the same length are saturated
+in one phase, so the number of Dijkstra runs is the number of distinct
+shortest-path lengths, not the amount of flow.
+
+Arcs live in flat lists (to, cap, cost) with the reverse of arc e at e ^ 1.
+"""
+
+import heapq
+
+INF = float('inf')
+
+class MinCostFlow:
+    """Directed graph with integer capacities and costs"""
+    
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.adjacent = [[] for _ in range(nodes)]
+        self.to = []
+        self.cap = []
+        self.cost = []
+        self.phases = 0
+    
+    def add_node(self):
+        self.adjacent.append([])
+        self.nodes += 1
+        return self.nodes - 1
+    
+    def add_edge(self, u, v, cap, cost):
+        """Add arc u -> v; returns its id (use flow(id) after solve())"""
+        e = len(self.to)
+        self.to += (v, u)
+        self.cap += (cap, 0)
+        self.cost += (cost, -cost)
+        self.adjacent[u].append(e)
+        self.adjacent[v].append(e + 1)
+        return e
+    
+    def flow(self, e):
+        return self.cap[e ^ 1]
+    
+    def solve(self, source, sink, limit=INF, progress=None):
+        """Send as much flow as possible (up to limit) at minimum cost.
+        
+        Costs must be non-negative. Returns (flow, cost). progress, if given,
+        is called with the flow so far after each phase.
+        """
+        potential = [0] * self.nodes
+        total_flow = 0
+        total_cost = 0
+        while total_flow < limit:
+            distance = self._shortest_paths(source, sink, potential)
+            if distance is None:
+                break
+            self.phases += 1
+            pushed = self._blocking_flow(source, sink, potential, limit - total_flow)
+            total_flow += pushed
+            # Every path pushed in this phase has reduced length 0, i.e. real cost
+            # potential[sink] - potential[source]
+            total_cost += pushed * (potential[sink] - potential[source])
+            if progress:
+                progress(total_flow)
+        return total_flow, total_cost
+    
+    def _shortest_paths(self, source, sink, potential):
+        """Dijkstra on reduced costs, then update potentials in place.
+        
+        Stops once the sink is settled; unsettled nodes get the sink's
+        distance, which still keeps every residual reduced cost >= 0.
+        Returns the sink distance, or None if the sink is unreachable.
+        """
+        to, cap, cost, adjacent = self.to, self.cap, self.cost, self.adjacent
+        distance = {source: 0}
+        settled = []
+        done = set()
+        heap = [(0, source)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if u in done:
+                continue
+            done.add(u)
+            settled.append(u)
+            if u == sink:
+                break
+            base = d + potential[u]
+            for e in adjacent[u]:
+                if cap[e] > 0:
+                    v = to[e]
+                    nd = base + cost[e] - potential[v]
+                    if nd < distance.get(v, INF):
+                        distance[v] = nd
+                        heapq.heappush(heap, (nd, v))
+        
+        if sink not in done:
+            return None
+        limit = distance[sink]
+        for u in settled:
+            potential[u] += distance[u] - limit
+        # Equivalent to adding min(distance, limit) to every node, shifted by -limit
+        # so only settled nodes need touching
+        return limit
+    
+    def _blocking_flow(self, source, sink, potential, limit):
+        to, cap, cost, adjacent = self.to, self.cap, self.cost, self.adjacent
+        total = 0
+        while total < limit:
+            # BFS levels over admissible arcs (residual, zero reduced cost)
+            level = [-1] * self.nodes
+            level[source] = 0
+            queue = [source]
+            for u in queue:
+                next_level = level[u] + 1
+                pu = potential[u]
+                for e in adjacent[u]:
+                    if cap[e] > 0:
+                        v = to[e]
+                        if level[v] < 0 and cost[e] + pu == potential[v]:
+                            level[v] = next_level
+                            queue.append(v)
+                if level[sink] >= 0:
+                    # Nothing beyond the sink's level can be on a shortest augmenting path
+                    break
+            if level[sink] < 0:
+                break
+            
+            current = [0] * self.nodes
+            while total < limit:
+                pushed = self._augment(source, sink, level, current, potential, limit - total)
+                if not pushed:
+                    break
+                total += pushed
+        return total
+    
+    def _augment(self, source, sink, level, current, potential, limit):
+        """One augmenting path along the level graph (iterative DFS)"""
+        to, cap, cost, adjacent = self.to, self.cap, self.cost, self.adjacent
+        sink_level = level[sink]
+        path = []
+        u = source
+        while True:
+            if u == sink:
+                pushed = min(limit, min(cap[e] for e in path))
+                for e in path:
+                    cap[e] -= pushed
+                    cap[e ^ 1] += pushed
+                return pushed
+            
+            arcs = adjacent[u]
+            count = len(arcs)
+            i = current[u]
+            next_level = level[u] + 1
+            pu = potential[u]
+            while i < count:
+                e = arcs[i]
+                if cap[e] > 0:
+                    v = to[e]
+                    if level[v] == next_level and cost[e] + pu == potential[v] and (v == sink or next_level < sink_level):
+                        break
+                i += 1
+            current[u] = i
+            
+            if i < count:
+                path.append(arcs[i])
+                u = to[arcs[i]]
+            elif u == source:
+                return 0
+            else:
+                # Dead end: drop u from the level graph and retreat
+                level[u] = -1
+                e = path.pop()
+                u = to[e ^ 1]
+                current[u] += 1
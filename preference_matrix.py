@@ -0,0 +1,191 @@
+"""
+Reporter x shift rank matrix for allocation, reports and exports
+
+Preferences are stored as lists per reporter (top_10, bottom_5), so "what
+rank did this reporter give this shift" used to be `shift_id in top_10`
+followed by `top_10.index(shift_id)`, over and over. compile_preferences()
+turns all of them into one dense NumPy array once:
+
+    ranks[row, shift_id] = 1..10 for a top-10 shift (its rank)
+                           BOTTOM_5 (-1) for a bottom-5 shift
+                           0 otherwise
+
+Reporters with complete preferences are compiled in a few vectorised
+scatters rather than a Python loop. int8 keeps the array at one byte per
+reporter and shift (100,000 reporters x 84 shifts is 8 MB). A season so
+long that the array would pass MAX_DENSE_CELLS (only seen in synthetic
+benchmarks) gets one small {shift id: rank} dict per reporter instead,
+behind the same methods.
+
+The app caches the compiled matrix against the preferences dataset's
+version (storage.version('preferences')), so it is rebuilt only after a
+submission.
+"""
+
+from itertools import chain
+import numpy as np
+
+BOTTOM_5 = -1
+NOT_RANKED = 0
+
+# Largest dense matrix (reporters x shifts, one byte each) before falling back to dicts
+MAX_DENSE_CELLS = 64 * 1024 * 1024
+
+class _RankRow(dict):
+    """One reporter's ranks in a sparse matrix; unranked shifts read as NOT_RANKED"""
+    
+    def __missing__(self, shift_id):
+        return NOT_RANKED
+
+class PreferenceMatrix:
+    """Ranks of every shift for every reporter, one row per reporter.
+    
+    ranks is the dense array, or None when sparse_rows (one _RankRow per
+    reporter) is used instead. complete marks the rows with a full top 10
+    and bottom 5 (what the allocator needs); with_top_10 counts the
+    reporters with a full top 10, whom the allocation report has always
+    counted as having preferences.
+    """
+    
+    def __init__(self, usernames, ranks, complete, with_top_10, sparse_rows=None):
+        self.usernames = usernames
+        self.index = {username: row for row, username in enumerate(usernames)}
+        self.ranks = ranks
+        self.complete = complete
+        self.with_top_10 = with_top_10
+        self.sparse_rows = sparse_rows
+    
+    def __len__(self):
+        return len(self.usernames)
+    
+    def __contains__(self, username):
+        return username in self.index
+    
+    def row(self, username):
+        """The reporter's row of ranks (indexed by shift id), or None"""
+        i = self.index.get(username)
+        if i is None:
+            return None
+        return self.ranks[i] if self.ranks is not None else self.sparse_rows[i]
+    
+    def rank(self, username, shift_id):
+        """1-10 for a top-10 shift, BOTTOM_5, or NOT_RANKED (also for unknown reporters/shifts)"""
+        i = self.index.get(username)
+        if i is None:
+            return NOT_RANKED
+        if self.ranks is None:
+            return self.sparse_rows[i][shift_id]
+        if not 0 <= shift_id < self.ranks.shape[1]:
+            return NOT_RANKED
+        return int(self.ranks[i, shift_id])
+    
+    def lookup(self, usernames, shift_ids):
+        """Ranks for many (reporter, shift) pairs at once; usernames must be in the matrix"""
+        if self.ranks is None:
+            return np.fromiter((self.sparse_rows[self.index[u]][s] for u, s in zip(usernames, shift_ids)),
+                               dtype=np.int8, count=len(usernames))
+        rows = np.fromiter((self.index[u] for u in usernames), dtype=np.intp, count=len(usernames))
+        columns = np.asarray(shift_ids, dtype=np.intp)
+        valid = (columns >= 0) & (columns < self.ranks.shape[1])
+        result = np.zeros(len(rows), dtype=np.int8)
+        result[valid] = self.ranks[rows[valid], columns[valid]]
+        return result
+
+def _scatter(ranks, rows, shift_ids, values):
+    """ranks[rows, shift_ids] = values, ignoring shift ids outside the matrix"""
+    valid = (shift_ids >= 0) & (shift_ids < ranks.shape[1])
+    ranks[rows[valid], shift_ids[valid]] = values[valid]
+
+def _rank_row(prefs, shift_count):
+    """One reporter's {shift id: rank} (top 10 wins over bottom 5, best rank wins)"""
+    row = _RankRow()
+    for shift_id in prefs.get('bottom_5', ()):
+        if isinstance(shift_id, int) and 0 <= shift_id < shift_count:
+            row[shift_id] = BOTTOM_5
+    for rank, shift_id in reversed(list(enumerate(prefs.get('top_10', ()), start=1))):
+        if isinstance(shift_id, int) and 0 <= shift_id < shift_count:
+            row[shift_id] = rank
+    return row
+
+def compile_preferences(preferences, shifts):
+    """Build a PreferenceMatrix with a column for every shift id in the ShiftCatalog"""
+    shift_count = max(shifts.ids(), default=-1) + 1
+    usernames = list(preferences)
+    if len(usernames) * shift_count > MAX_DENSE_CELLS:
+        prefs_list = [preferences[u] or {} for u in usernames]
+        complete = np.array([len(p.get('top_10', ())) == 10 and len(p.get('bottom_5', ())) == 5
+                             for p in prefs_list], dtype=bool)
+        with_top_10 = sum(1 for p in prefs_list if len(p.get('top_10', ())) == 10)
+        return PreferenceMatrix(usernames, None, complete, with_top_10,
+                                [_rank_row(p, shift_count) for p in prefs_list])
+    
+    ranks = np.zeros((len(usernames), shift_count), dtype=np.int8)
+    complete = np.zeros(len(usernames), dtype=bool)
+    
+    # One pass to find the complete rows and gather their lists
+    rows, tops, bottoms, others = [], [], [], []
+    top_10_only = 0  # a full top 10 but not a full bottom 5
+    for i, username in enumerate(usernames):
+        prefs = preferences[username] or {}
+        top = prefs.get('top_10', ())
+        bottom = prefs.get('bottom_5', ())
+        if len(top) == 10 and len(bottom) == 5:
+            rows.append(i)
+            tops.append(top)
+            bottoms.append(bottom)
+        else:
+            others.append(i)
+            if len(top) == 10:
+                top_10_only += 1
+    complete[rows] = True
+    with_top_10 = len(rows) + top_10_only
+    
+    try:
+        top = np.fromiter(chain.from_iterable(tops), dtype=np.int64, count=10 * len(rows)).reshape(-1, 10)
+        bottom = np.fromiter(chain.from_iterable(bottoms), dtype=np.int64, count=5 * len(rows))
+        rows = np.array(rows, dtype=np.intp)
+    except (TypeError, ValueError):
+        # A non-integer shift id somewhere: compile every row the slow way
+        others = range(len(usernames))
+        rows = np.zeros(0, dtype=np.intp)
+        top = np.zeros((0, 10), dtype=np.int64)
+        bottom = np.zeros(0, dtype=np.int64)
+    
+    # Bottom 5 first so a shift listed in both counts as top 10 (as the
+    # list checks always did). Top 10 one rank at a time, worst first, so a
+    # repeated shift keeps its best rank; within a pass every row is
+    # distinct, so no element is written twice.
+    _scatter(ranks, np.repeat(rows, 5), bottom, np.full(bottom.size, BOTTOM_5, dtype=np.int8))
+    for column in range(9, -1, -1):
+        _scatter(ranks, rows, top[:, column], np.full(len(rows), column + 1, dtype=np.int8))
+    
+    # Incomplete (or malformed) preferences: rare, so a plain loop
+    for i in others:
+        for shift_id, rank in _rank_row(preferences[usernames[i]] or {}, shift_count).items():
+            ranks[i, shift_id] = rank
+    
+    return PreferenceMatrix(usernames, ranks, complete, with_top_10)
+
+def score_allocation(assignments, matrix):
+    """The allocation report's metrics for one set of assignments.
+    
+    As in /api/allocation-report, each reporter's first shift counts and
+    reporters without preferences are skipped; those with a full top 10
+    count as having preferences (matrix.with_top_10), even without a full
+    bottom 5. bottom_5 and fallback list (username, shift id) pairs.
+    """
+    assigned = [(username, shift_ids[0]) for username, shift_ids in assignments.items()
+                if shift_ids and username in matrix]
+    ranks = matrix.lookup([username for username, _ in assigned], [shift_id for _, shift_id in assigned])
+    top_ranks = ranks[ranks > 0]
+    counts = np.bincount(top_ranks, minlength=11)
+    with_preferences = matrix.with_top_10
+    return {
+        'rank_counts': {i: int(counts[i]) for i in range(1, 11)},
+        'top_10': len(top_ranks),
+        'top_10_rate': len(top_ranks) / with_preferences if with_preferences else 0.0,
+        'mean_rank': float(top_ranks.mean()) if len(top_ranks) else None,
+        'bottom_5': [assigned[i] for i in np.flatnonzero(ranks == BOTTOM_5)],
+        'fallback': [assigned[i] for i in np.flatnonzero(ranks == NOT_RANKED)],
+        'total_with_preferences': with_preferences
+    }
@@ -0,0 +1,162 @@
+"""
+Cached allocation results and previews
+
+The same inputs and seed always give the same allocation (see allocator.py),
+so results are memoised in data/previews/<id>.json, where id is a hash of
+everything the result depends on:
+
+- the content of the preferences and of the reporter list (hashes of the
+  data, not storage versions, so saving or restoring identical data keeps
+  the cache; PreferencesHasher re-encodes only the entries that changed)
+- the settings that affect allocation (not the deadline or the lock) and
+  the caps
+- the mode, the seeds (a preview without a seed: the number of draws), and
+  whether trading is on
+- ALLOCATOR_VERSION
+
+A preview runs the allocator without writing assignments or locking
+preferences; asking for the same preview again reads the file instead of
+re-running the allocator, in any worker. POST /api/allocate/commit then
+saves a preview's assignments as they are. Saved allocations are stored the
+same way under their seeds, so re-running one with its recorded seed costs
+nothing either.
+"""
+
+import hashlib
+import json
+import os
+from allocator import ALLOCATOR_VERSION
+from storage import write_json
+
+# Settings that do not change the allocation, so do not invalidate previews
+# (the mode and trading settings are only defaults; the key has the values used)
+IGNORED_SETTINGS = ('deadline', 'is_locked', 'allocation_mode', 'allocation_trading')
+
+# Previews kept on disk; the oldest are removed
+MAX_PREVIEWS = 20
+
+def allocation_settings(settings):
+    """The part of the settings an allocation depends on"""
+    return {k: v for k, v in settings.items() if k not in IGNORED_SETTINGS}
+
+def content_hash(data):
+    """SHA-256 of JSON data in canonical form (sorted keys, no whitespace)"""
+    canonical = json.dumps(data, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+_canonical = json.JSONEncoder(sort_keys=True, separators=(',', ':')).encode
+
+def preferences_hash(preferences, known=None):
+    """Hash of the preferences, from each reporter's entry in canonical form, in username order.
+    
+    Encoding every entry is nearly all of the cost. known, the (preferences,
+    encodings) returned by a previous call, lets entries that still compare
+    equal skip the encoding. Returns (hash, known) - pass known back next
+    time; the preferences in it must not be changed afterwards.
+    """
+    hashed, encoded = known or ({}, {})
+    encodings = {}
+    for username in sorted(preferences):
+        prefs = preferences[username]
+        text = encoded.get(username)
+        if text is None or hashed.get(username) != prefs:
+            text = _canonical([username, prefs])
+        encodings[username] = text
+    canonical = ','.join(encodings.values())
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest(), (preferences, encodings)
+
+class PreferencesHasher:
+    """preferences_hash() that re-encodes only the reporters whose entry changed since the last call.
+    
+    After a submission (or any save) the whole dataset is a new version,
+    but usually only a few entries differ; comparing the rest to what was
+    hashed last time (dict ==, in C) is several times cheaper than
+    encoding them again. Calls from several threads are safe: each builds
+    its own encodings and the last one to finish keeps its own.
+    """
+    
+    def __init__(self):
+        self._known = None
+    
+    def __call__(self, preferences):
+        digest, self._known = preferences_hash(preferences, self._known)
+        return digest
+
+def reporters_hash(reporters_data):
+    """Hash of what the allocator reads from the reporters: who, in which order, names and roles"""
+    # The order is kept: it is the order reporters are shuffled from. Three
+    # columns rather than a list per reporter: 100,000 small lists set off
+    # the garbage collector, which costs more than the hashing
+    reporters = reporters_data.values()
+    return content_hash([list(reporters_data), [reporter.get('name') for reporter in reporters],
+                         [bool(reporter.get('is_manager')) for reporter in reporters]])
+
+def preview_key(preferences_hash, reporters_hash, settings, caps, mode, seeds=None, draws=1, trade=False):
+    """The cache key for an allocation result, as a JSON-friendly dict"""
+    return {
+        'allocator_version': ALLOCATOR_VERSION,
+        'preferences': preferences_hash,
+        'reporters': reporters_hash,
+        'settings': allocation_settings(settings),
+        'caps': [cap.to_dict() for cap in caps],
+        'mode': mode,
+        'seeds': seeds,
+        'draws': len(seeds) if seeds else draws,
+        'trade': trade
+    }
+
+def is_current(key, preferences_hash, reporters_hash):
+    """True if a stored result was allocated from this data"""
+    return (key.get('allocator_version') == ALLOCATOR_VERSION and key.get('preferences') == preferences_hash
+            and key.get('reporters') == reporters_hash)
+
+class PreviewStore:
+    """Preview payloads on disk, one JSON file per key"""
+    
+    def __init__(self, directory, max_previews=MAX_PREVIEWS):
+        self.directory = directory
+        self.max_previews = max_previews
+        os.makedirs(directory, exist_ok=True)
+    
+    def preview_id(self, key):
+        return content_hash(key)[:24]
+    
+    def _path(self, preview_id):
+        return os.path.join(self.directory, f'{preview_id}.json')
+    
+    def get(self, preview_id):
+        """The stored preview, or None"""
+        # Ids come from requests, so only accept what preview_id() produces
+        if not (isinstance(preview_id, str) and len(preview_id) == 24
+                and all(c in '0123456789abcdef' for c in preview_id)):
+            return None
+        try:
+            with open(self._path(preview_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def put(self, preview_id, preview):
+        # Keyed by content, so a second writer writes the same thing: no lock needed
+        write_json(self._path(preview_id), preview)
+        self._prune()
+    
+    def _prune(self):
+        entries = []
+        names = os.listdir(self.directory)
+        for name in names:
+            if name.endswith('.json'):
+                path = os.path.join(self.directory, name)
+                try:
+                    entries.append((os.path.getmtime(path), path))
+                except OSError:
+                    continue
+        entries.sort(reverse=True)
+        stale = [path for _, path in entries[self.max_previews:]]
+        # .lock sidecars left by previews saved with save_json before
+        stale += [os.path.join(self.directory, name) for name in names if name.endswith('.json.lock')]
+        for path in stale:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,325 @@
+"""
+Incremental repair of an existing allocation
+
+After allocation, a reporter may drop out, join late or change their
+preferences, or a shift may lose or gain slots. Re-running the allocator
+reshuffles everyone; repair() instead applies the change to the current
+assignments and touches only the reporters and shifts involved:
+
+- removed reporters free their slot, which goes to an unassigned reporter
+  who wants it (if any)
+- added and changed reporters are placed in their best free top-10 shift;
+  if all of those are full, one holder of a top-10 shift may move to a free
+  shift they like at least as much (so nobody else is made worse off)
+- a shift that loses slots gives up the holders who ranked it lowest, and
+  they are re-placed the same way
+- whoever cannot get a top-10 shift falls back to a free shift of their
+  preferred types, then any free shift, as in the allocator
+
+AllocationIndex is the reverse of assignments (holders per shift, free
+slots per shift type, unassigned reporters). It is built once, O(headcount),
+and then updated in place, so a repair costs O(size of the change).
+"""
+
+import random
+from allocator import WEEK_21_MAX_SLOTS, FreeShiftPool, has_complete_preferences
+from caps import CapCounter, default_caps, restricted_shifts
+from preference_matrix import BOTTOM_5
+from shifts import ShiftType, ranked_types
+from trading import trade_shifts
+
+class AllocationIndex:
+    """Who holds each shift, and which shifts still have room"""
+    
+    def __init__(self, assignments, shifts, caps=None):
+        self.shifts = shifts
+        if caps is None:
+            caps = default_caps(shifts, WEEK_21_MAX_SLOTS)
+        self.caps = CapCounter(caps, shifts)
+        self.restricted = restricted_shifts(caps)
+        self.slots = {shift.id: shift.slots for shift in shifts}
+        self.holders = {shift.id: [] for shift in shifts}
+        self.assigned = {}  # username -> shift id
+        self.unassigned = set()
+        
+        # Shifts outside top-10-only caps with a free slot: all of them
+        # ('any') and per ShiftType
+        self.free = {'any': FreeShiftPool()}
+        for shift_type in ShiftType:
+            self.free[shift_type] = FreeShiftPool()
+        
+        for username, shift_ids in assignments.items():
+            if shift_ids and shift_ids[0] in self.holders:
+                self._hold(username, shift_ids[0])
+            else:
+                self.unassigned.add(username)
+        for shift in shifts:
+            self._refresh(shift.id)
+    
+    def _pools(self, shift):
+        if shift.id in self.restricted:
+            return []
+        return [self.free['any']] + [self.free[t] for t in ShiftType if t.covers(shift)]
+    
+    def _refresh(self, shift_id):
+        """Keep the free pools in step with one shift's remaining slots"""
+        has_room = len(self.holders[shift_id]) < self.slots[shift_id] and self.caps.has_room(shift_id)
+        for pool in self._pools(self.shifts[shift_id]):
+            if has_room:
+                pool.add(shift_id)
+            else:
+                pool.discard(shift_id)
+    
+    def _hold(self, username, shift_id):
+        """Returns the shifts whose caps just filled"""
+        self.holders[shift_id].append(username)
+        self.assigned[username] = shift_id
+        return self.caps.add(shift_id)
+    
+    def has_room(self, shift_id):
+        if shift_id not in self.holders or len(self.holders[shift_id]) >= self.slots[shift_id]:
+            return False
+        return self.caps.has_room(shift_id)
+    
+    def place(self, username, shift_id):
+        self.unassigned.discard(username)
+        for changed in self._hold(username, shift_id):
+            self._refresh(changed)
+        self._refresh(shift_id)
+    
+    def vacate(self, username):
+        """Take the reporter off their shift; returns the shift id (or None)"""
+        shift_id = self.assigned.pop(username, None)
+        if shift_id is not None:
+            self.holders[shift_id].remove(username)
+            for changed in self.caps.remove(shift_id):
+                self._refresh(changed)
+            self._refresh(shift_id)
+        return shift_id
+    
+    def forget(self, username):
+        """Remove the reporter altogether; returns the shift they freed (or None)"""
+        self.unassigned.discard(username)
+        return self.vacate(username)
+    
+    def set_slots(self, shift_id, slots):
+        self.slots[shift_id] = slots
+        self._refresh(shift_id)
+    
+    def assignments(self, usernames):
+        """The assignments entries for these reporters ([] if unassigned)"""
+        return {u: [self.assigned[u]] if u in self.assigned else [] for u in usernames}
+
+class _Repair:
+    """One repair: the index plus what each reporter wants"""
+    
+    def __init__(self, index, preferences, matrix, rng):
+        self.index = index
+        self.preferences = preferences
+        self.matrix = matrix
+        self.rng = rng
+        self.original = {}  # username -> shift id before the repair (None if unassigned)
+    
+    def _note(self, username):
+        if username not in self.original:
+            self.original[username] = self.index.assigned.get(username)
+    
+    def rank(self, username, shift_id):
+        return self.matrix.rank(username, shift_id)
+    
+    def move(self, username, shift_id):
+        self._note(username)
+        self.index.vacate(username)
+        self.index.place(username, shift_id)
+    
+    def _better_shift(self, holder):
+        """A free shift the holder likes at least as much as theirs, or None"""
+        index = self.index
+        current = index.assigned[holder]
+        prefs = self.preferences.get(holder) or {}
+        if not has_complete_preferences(prefs):
+            return None
+        current_rank = self.rank(holder, current)
+        
+        # Higher up their top 10
+        limit = current_rank - 1 if current_rank > 0 else 10
+        for shift_id in prefs['top_10'][:limit]:
+            if shift_id != current and index.has_room(shift_id):
+                return shift_id
+        if current_rank > 0:
+            return None
+        
+        # On a fallback shift: another of the same type outside their bottom 5.
+        # On a bottom-5 shift: anything else.
+        bottom_5 = set(prefs['bottom_5'])
+        if current_rank == BOTTOM_5:
+            pool = index.free['any']
+        else:
+            pool = index.free.get(index.shifts[current].kind)
+        if pool is None:
+            return None
+        return pool.choice_excluding(bottom_5 | {current}, self.rng)
+    
+    def place(self, username):
+        """Find the reporter a shift; returns how ('top_10', 'swap', 'fallback', ...) or None"""
+        index = self.index
+        self._note(username)
+        prefs = self.preferences.get(username) or {}
+        
+        if has_complete_preferences(prefs):
+            for shift_id in prefs['top_10']:
+                if index.has_room(shift_id):
+                    index.place(username, shift_id)
+                    return 'top_10'
+            
+            # One move: a holder of a top-10 shift goes somewhere no worse for them
+            for shift_id in prefs['top_10']:
+                if shift_id not in index.holders:
+                    continue
+                for holder in list(index.holders[shift_id]):
+                    target = self._better_shift(holder)
+                    if target is not None:
+                        self.move(holder, target)
+                        index.place(username, shift_id)
+                        return 'swap'
+            
+            bottom_5 = set(prefs['bottom_5'])
+            for shift_type in ranked_types(prefs.get('shift_type_pref', {})):
+                shift_id = index.free[shift_type].choice_excluding(bottom_5, self.rng)
+                if shift_id is not None:
+                    index.place(username, shift_id)
+                    return 'fallback'
+            
+            if index.free['any']:
+                index.place(username, index.free['any'].choice(self.rng))
+                return 'emergency'
+            return None
+        
+        if index.free['any']:
+            index.place(username, index.free['any'].choice(self.rng))
+            return 'random'
+        return None
+    
+    def fill(self, shift_id, eligible):
+        """Give a freed slot to the unassigned reporter who wants it most"""
+        index = self.index
+        best = None
+        for username in index.unassigned:
+            if username not in eligible:
+                continue
+            rank = self.rank(username, shift_id)
+            if rank == BOTTOM_5:
+                continue
+            # Top 10 by rank, then reporters with preferences, then without
+            score = rank if rank > 0 else (20 if has_complete_preferences(self.preferences.get(username) or {}) else 30)
+            # Ties go to the first username, not to whichever the set yields first
+            if best is None or (score, username) < best:
+                best = (score, username)
+        if best is not None and index.has_room(shift_id):
+            self._note(best[1])
+            index.place(best[1], shift_id)
+            return best[1]
+        return None
+
+def repair(index, preferences, matrix, reporters_data, remove=(), add=(), changed=(), capacity=None, rng=random,
+           trade=False):
+    """Apply a change to the allocation held in index (updated in place).
+    
+    remove: reporters who dropped out (taken out of assignments altogether)
+    add: reporters to place who have no shift yet
+    changed: reporters whose preferences changed (re-placed)
+    capacity: {shift id: new number of slots}
+    trade: finish with a top trading cycles pass over everyone (O(headcount))
+    
+    Returns a dict with 'assignments' (only the entries that changed),
+    'removed' (usernames to delete from assignments), 'moves' (username,
+    from, to), 'unassigned' and 'warnings', plus 'trading' (the trading
+    report) if trade is set.
+    """
+    job = _Repair(index, preferences, matrix, rng)
+    warnings = []
+    to_place = []
+    freed = []
+    
+    for shift_id, slots in (capacity or {}).items():
+        if shift_id not in index.holders:
+            warnings.append(f"Shift {shift_id} does not exist")
+            continue
+        index.set_slots(shift_id, max(0, slots))
+        holders = index.holders[shift_id]
+        if len(holders) > index.slots[shift_id]:
+            # Keep the holders who ranked it best; bottom-5 and fallback go first
+            keep_order = sorted(holders, key=lambda u: (job.rank(u, shift_id) <= 0, job.rank(u, shift_id)))
+            for username in keep_order[index.slots[shift_id]:]:
+                job._note(username)
+                index.vacate(username)
+                to_place.append(username)
+        elif len(holders) < index.slots[shift_id]:
+            freed.append(shift_id)
+    
+    removed = []
+    for username in remove:
+        job._note(username)
+        shift_id = index.forget(username)
+        removed.append(username)
+        if shift_id is not None:
+            freed.append(shift_id)
+    
+    for username in changed:
+        if username in index.assigned:
+            job._note(username)
+            freed.append(index.vacate(username))
+        to_place.append(username)
+    
+    for username in add:
+        if username in index.assigned:
+            warnings.append(f"{username} already has a shift")
+            continue
+        to_place.append(username)
+    
+    for username in to_place:
+        how = job.place(username)
+        if how is None:
+            index.unassigned.add(username)
+            name = reporters_data.get(username, {}).get('name', username)
+            warnings.append(f"{name} could not be placed - no capacity remaining")
+    
+    # Freed slots go to reporters who were already waiting for one
+    eligible = {u for u in index.unassigned if u not in to_place and u in reporters_data
+                and not reporters_data[u].get('is_manager')}
+    for shift_id in freed:
+        while eligible and index.has_room(shift_id):
+            username = job.fill(shift_id, eligible)
+            if username is None:
+                break
+            eligible.discard(username)
+    
+    # Placements above are made one at a time, so trades can improve on them
+    trading = None
+    if trade:
+        traded, trading = trade_shifts(index.assignments(index.assigned), preferences, matrix)
+        for username in traded:
+            job._note(username)
+            index.vacate(username)
+        for username, (shift_id,) in traded.items():
+            index.place(username, shift_id)
+    
+    removed_set = set(removed)
+    moves = []
+    for username, before in job.original.items():
+        if username in removed_set:
+            continue
+        after = index.assigned.get(username)
+        if after != before:
+            moves.append({'username': username, 'from': before, 'to': after})
+    
+    outcome = {
+        'assignments': index.assignments(m['username'] for m in moves),
+        'removed': removed,
+        'moves': moves,
+        'unassigned': sorted(u for u in index.unassigned if u not in removed_set),
+        'warnings': warnings
+    }
+    if trading is not None:
+        outcome['trading'] = trading
+    return outcome
@@ -0,0 +1,210 @@
+"""
+Allocation report and schedule exports
+
+The manager's allocation report, the Excel schedule and the mail merge CSV
+used to be built inside their Flask routes. Here they are plain functions
+of the data, so the routes only load and cache, and benchmark_suite.py can
+time them on synthetic seasons without a running app.
+
+Each one walks the assignments once to find every shift's holders, so
+their cost is O(shifts + reporters); the mail merge export used to scan
+every reporter for every shift.
+"""
+
+import csv
+from datetime import datetime
+from io import StringIO
+from preference_matrix import BOTTOM_5
+
+def allocation_report_data(score, reporters_data, trading=None):
+    """The /api/allocation-report body for a score_allocation() result"""
+    def listing(pairs):
+        return [{'name': reporters_data[username]['name'], 'username': username, 'shift_id': shift_id}
+                for username, shift_id in pairs]
+    
+    # Bottom 5 should never happen!
+    bottom_5_violations = listing(score['bottom_5'])
+    fallback_reporters = listing(score['fallback'])
+    
+    total_with_prefs = score['total_with_preferences']
+    top_10_total = score['top_10']
+    return {
+        'success': True,
+        'statistics': {
+            'total_with_preferences': total_with_prefs,
+            'got_top_10': top_10_total,
+            'got_fallback': len(fallback_reporters),
+            'bottom_5_violations': len(bottom_5_violations),
+            'rank_breakdown': score['rank_counts'],
+            'top_10_percentage': round(top_10_total / total_with_prefs * 100, 1) if total_with_prefs else 0
+        },
+        'fallback_reporters': fallback_reporters,
+        'bottom_5_violations': bottom_5_violations,
+        'trading': trading
+    }
+
+def shift_holders(assignments):
+    """{shift id: [usernames]}, in assignments order"""
+    holders = {}
+    for username, shift_ids in assignments.items():
+        for shift_id in shift_ids:
+            holders.setdefault(shift_id, []).append(username)
+    return holders
+
+def schedule_workbook(assignments, reporters, matrix, shifts):
+    """The Excel schedule (per-shift rows plus a reporter summary), as .xlsx bytes"""
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, PatternFill, Alignment
+    from io import BytesIO
+    
+    shift_reporters = shift_holders(assignments)
+    
+    # Create workbook
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Reporter Schedule"
+    
+    # Title
+    ws['A1'] = 'Weekend Reporter Shift Schedule - Dec 2025 - Apr 2026'
+    ws['A1'].font = Font(size=16, bold=True)
+    ws.merge_cells('A1:H1')
+    
+    # Headers
+    headers = ['Date', 'Day', 'Time', 'Assigned Reporters', 'Preference Rank', 'Status', 'Week', 'Notes']
+    header_row = 3
+    for col, header in enumerate(headers, start=1):
+        cell = ws.cell(row=header_row, column=col)
+        cell.value = header
+        cell.font = Font(bold=True, color="FFFFFF")
+        cell.fill = PatternFill(start_color="FF6B35", end_color="FF6B35", fill_type="solid")
+        cell.alignment = Alignment(horizontal='center', vertical='center')
+    
+    # Data
+    row = header_row + 1
+    for shift in shifts:
+        shift_id = shift['id']
+        assigned = shift_reporters.get(shift_id, [])
+        
+        ws.cell(row=row, column=1).value = shift['date']
+        ws.cell(row=row, column=2).value = shift['day']
+        ws.cell(row=row, column=3).value = shift['time']
+        
+        # Assigned reporters (can be 0, 1, or 2)
+        if assigned:
+            rep_names = []
+            pref_ranks = []
+            for rep in assigned:
+                rep_names.append(reporters[rep]['name'])
+                
+                rank = matrix.rank(rep, shift_id)
+                if rank > 0:
+                    pref_ranks.append(f"#{rank}")
+                elif rank == BOTTOM_5:
+                    pref_ranks.append("Bottom-5")
+                else:
+                    pref_ranks.append("N/A")
+            
+            ws.cell(row=row, column=4).value = ", ".join(rep_names)
+            ws.cell(row=row, column=5).value = ", ".join(pref_ranks)
+        else:
+            ws.cell(row=row, column=4).value = "VACANT"
+            ws.cell(row=row, column=4).font = Font(color="FF0000", bold=True)
+        
+        # Status
+        filled = len(assigned)
+        total = shift['slots']
+        if filled >= total:
+            ws.cell(row=row, column=6).value = "FILLED"
+            ws.cell(row=row, column=6).fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
+        else:
+            ws.cell(row=row, column=6).value = f"VACANT ({total - filled})"
+            ws.cell(row=row, column=6).fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
+        
+        ws.cell(row=row, column=7).value = shift['week']
+        
+        row += 1
+    
+    # Reporter summary
+    row += 2
+    ws.cell(row=row, column=1).value = "Reporter Summary"
+    ws.cell(row=row, column=1).font = Font(size=14, bold=True)
+    
+    row += 1
+    summary_headers = ['Reporter', 'Shifts Assigned', 'Shift Details', 'Status']
+    for col, header in enumerate(summary_headers, start=1):
+        cell = ws.cell(row=row, column=col)
+        cell.value = header
+        cell.font = Font(bold=True, color="FFFFFF")
+        cell.fill = PatternFill(start_color="FF6B35", end_color="FF6B35", fill_type="solid")
+    
+    row += 1
+    for rep, rep_data in reporters.items():
+        if rep_data.get('is_manager'):
+            continue
+        
+        ws.cell(row=row, column=1).value = rep_data['name']
+        
+        rep_shifts = assignments.get(rep, [])
+        ws.cell(row=row, column=2).value = len(rep_shifts)
+        
+        shift_details = []
+        for shift_id in rep_shifts:
+            shift = shifts[shift_id]
+            shift_details.append(f"{shift['date']} {shift['day']} {shift['time']}")
+        ws.cell(row=row, column=3).value = "; ".join(shift_details) if shift_details else "None"
+        
+        if len(rep_shifts) == 1:
+            ws.cell(row=row, column=4).value = "Complete"
+            ws.cell(row=row, column=4).fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
+        else:
+            ws.cell(row=row, column=4).value = f"Incomplete ({len(rep_shifts)}/1)"
+            ws.cell(row=row, column=4).fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
+        
+        row += 1
+    
+    # Adjust column widths
+    ws.column_dimensions['A'].width = 12
+    ws.column_dimensions['B'].width = 12
+    ws.column_dimensions['C'].width = 20
+    ws.column_dimensions['D'].width = 30
+    ws.column_dimensions['E'].width = 15
+    ws.column_dimensions['F'].width = 15
+    ws.column_dimensions['G'].width = 10
+    ws.column_dimensions['H'].width = 30
+    
+    output = BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+def mailmerge_shift(shift):
+    """E.g. 'Saturday, Dec. 14, 8-4 ET'"""
+    # Format date: "Dec. 14" from "2025-12-14"
+    date_obj = datetime.strptime(shift['date'], '%Y-%m-%d')
+    formatted_date = f"{date_obj.strftime('%b.')} {date_obj.day}"  # day without a leading zero
+    
+    # Format time: "8-4" from "8:00 AM - 4:00 PM"
+    time_str = shift['time']
+    if '8:00 AM - 4:00 PM' in time_str:
+        time_formatted = '8-4'
+    elif '3:00 PM - 10:00 PM' in time_str:
+        time_formatted = '3-10'
+    else:
+        time_formatted = time_str  # Fallback
+    
+    return f"{shift['day']}, {formatted_date}, {time_formatted} ET"
+
+def mailmerge_csv(assignments, reporters, shifts):
+    """CSV for mail merge: Reporter Name, Shift, one row per assignment in shift order"""
+    holders = shift_holders(assignments)
+    
+    output = StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['Reporter Name', 'Shift'])
+    for shift in shifts:  # shifts are already in chronological order
+        assigned = holders.get(shift['id'])
+        if not assigned:
+            continue
+        formatted = mailmerge_shift(shift)
+        for username in assigned:
+            writer.writerow([reporters[username]['name'], formatted])
+    return output.getvalue()
@@ -24,6 +24,7 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime
 from pathlib import Path
+from shifts import ShiftCatalog
 import getpass
 
 # SMTP Configuration - Update these for your environment
@@ -32,7 +33,7 @@ SMTP_PORT = 587  # Usually 587 for TLS, 465 for SSL, 25 for unencrypted
 USE_TLS = True
 
 # Shift definitions (match your app.py)
-SHIFTS = [
+SHIFTS = ShiftCatalog([
     {'id': 0, 'date': '2025-11-01', 'day': 'Saturday', 'time': '11:00 AM - 7:00 PM'},
     {'id': 1, 'date': '2025-11-02', 'day': 'Sunday', 'time': '8:00 AM - 4:00 PM'},
     {'id': 2, 'date': '2025-11-02', 'day': 'Sunday', 'time': '3:00 PM - 10:00 PM'},
@@ -96,11 +97,11 @@ SHIFTS = [
     {'id': 60, 'date': '2026-03-21', 'day': 'Saturday', 'time': '11:00 AM - 7:00 PM'},
     {'id': 61, 'date': '2026-03-22', 'day': 'Sunday', 'time': '8:00 AM - 4:00 PM'},
     {'id': 62, 'date': '2026-03-22', 'day': 'Sunday', 'time': '3:00 PM - 10:00 PM'},
-]
+])
 
 def format_shift(shift_id):
     """Convert shift ID to human-readable format"""
-    shift = next((s for s in SHIFTS if s['id'] == shift_id), None)
+    shift = SHIFTS.get(shift_id)
     if not shift:
         return f"Unknown Shift (ID: {shift_id})"
     
@@ -199,7 +200,7 @@ def main():
             continue
         
         reporter = reporters[username]
-        shift_ids_sorted = sorted(shift_ids, key=lambda sid: SHIFTS[sid]['date'])
+        shift_ids_sorted = sorted(shift_ids, key=lambda sid: SHIFTS[sid].date if sid in SHIFTS else '')
         
         shift1 = format_shift(shift_ids_sorted[0]) if len(shift_ids_sorted) >= 1 else "No shift assigned"
         shift2 = format_shift(shift_ids_sorted[1]) if len(shift_ids_sorted) >= 2 else "No second shift assigned"
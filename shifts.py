@@ -0,0 +1,176 @@
+"""
+Shift catalog for the weekend reporter app
+
+Shifts used to be a list of dicts, and every lookup by id was a linear
+`next(s for s in SHIFTS if s['id'] == shift_id)` scan. ShiftCatalog keeps
+the same records in __slots__ objects held in a list indexed by id, so a
+lookup is one list index, and builds indexes by week, day and kind
+(time-of-day type, e.g. ShiftType.SUNDAY_MORNING) once up front.
+
+ShiftType is the set of keys reporters rank in shift_type_pref, including
+the OLD 'saturday' key (any Saturday shift). by_type lists the shifts each
+type covers, so the allocator never matches times or days itself.
+
+Shift records still support shift['date'] style access, and as_dicts()
+gives plain dicts for templates and JSON.
+"""
+
+from datetime import datetime, timedelta
+from enum import Enum
+
+class ShiftType(Enum):
+    """A shift type reporters rank in shift_type_pref (value = the key)"""
+    
+    SATURDAY_MORNING = 'saturday_morning'
+    SATURDAY_EVENING = 'saturday_evening'
+    SUNDAY_MORNING = 'sunday_morning'
+    SUNDAY_EVENING = 'sunday_evening'
+    # OLD structure: any Saturday shift
+    SATURDAY = 'saturday'
+    
+    @classmethod
+    def parse(cls, key):
+        """The type for a shift_type_pref key, or None if unknown"""
+        try:
+            return cls(key)
+        except ValueError:
+            return None
+    
+    def covers(self, shift):
+        if self is ShiftType.SATURDAY:
+            return shift.day == 'Saturday'
+        return shift.kind is self
+
+def ranked_types(shift_type_pref):
+    """The reporter's shift types, best ranked first (unknown keys are skipped)"""
+    ranked = sorted(shift_type_pref.items(), key=lambda x: x[1])
+    return [t for t in (ShiftType.parse(key) for key, _ in ranked) if t is not None]
+
+def shift_kind(day, time):
+    """ShiftType.SATURDAY_MORNING, SUNDAY_EVENING, ... or None for other times"""
+    if '8:00 AM' in time:
+        return ShiftType.parse(f'{day.lower()}_morning')
+    if '3:00 PM' in time:
+        return ShiftType.parse(f'{day.lower()}_evening')
+    return None
+
+class Shift:
+    """One shift; fixed fields, no per-instance dict"""
+    
+    __slots__ = ('id', 'date', 'day', 'time', 'slots', 'week', 'kind')
+    
+    def __init__(self, id, date, day, time, slots=1, week=None, kind=None):
+        self.id = id
+        self.date = date
+        self.day = day
+        self.time = time
+        self.slots = slots
+        self.week = week
+        self.kind = kind or shift_kind(day, time)
+    
+    def __getitem__(self, field):
+        # Code written against the old dicts (shift['date']) keeps working
+        return getattr(self, field)
+    
+    def to_dict(self):
+        shift = {'id': self.id, 'date': self.date, 'day': self.day, 'time': self.time, 'slots': self.slots}
+        if self.week is not None:
+            shift['week'] = self.week
+        return shift
+
+class ShiftCatalog:
+    """Shifts in chronological order with O(1) lookup by id and prebuilt indexes"""
+    
+    def __init__(self, shifts):
+        self.shifts = [s if isinstance(s, Shift) else Shift(**s) for s in shifts]
+        
+        # Ids are small integers, so a list indexed by id beats a dict
+        size = max((s.id for s in self.shifts), default=-1) + 1
+        self._by_id = [None] * size
+        self.by_week = {}
+        self.by_day = {}
+        self.by_kind = {}
+        self.by_type = {shift_type: [] for shift_type in ShiftType}
+        for shift in self.shifts:
+            self._by_id[shift.id] = shift
+            self.by_week.setdefault(shift.week, []).append(shift)
+            self.by_day.setdefault(shift.day, []).append(shift)
+            self.by_kind.setdefault(shift.kind, []).append(shift)
+            for shift_type in ShiftType:
+                if shift_type.covers(shift):
+                    self.by_type[shift_type].append(shift)
+        self._dicts = None
+    
+    def __iter__(self):
+        return iter(self.shifts)
+    
+    def __len__(self):
+        return len(self.shifts)
+    
+    def __contains__(self, shift_id):
+        return self.get(shift_id) is not None
+    
+    def get(self, shift_id, default=None):
+        """The Shift with this id, or default"""
+        if isinstance(shift_id, int) and 0 <= shift_id < len(self._by_id):
+            shift = self._by_id[shift_id]
+            if shift is not None:
+                return shift
+        return default
+    
+    def __getitem__(self, shift_id):
+        shift = self.get(shift_id)
+        if shift is None:
+            raise KeyError(shift_id)
+        return shift
+    
+    def ids(self):
+        return [shift.id for shift in self.shifts]
+    
+    @property
+    def weeks(self):
+        return sorted(w for w in self.by_week if w is not None)
+    
+    def total_slots(self, shifts=None):
+        return sum(shift.slots for shift in (self.shifts if shifts is None else shifts))
+    
+    def with_slots(self, slots):
+        """A copy with some shifts' slot counts replaced ({shift id: slots}); self if none"""
+        if not slots:
+            return self
+        return ShiftCatalog(Shift(s.id, s.date, s.day, s.time, slots.get(s.id, s.slots), s.week, s.kind)
+                            for s in self.shifts)
+    
+    def as_dicts(self):
+        """The shifts as a list of plain dicts (built once)"""
+        if self._dicts is None:
+            self._dicts = [shift.to_dict() for shift in self.shifts]
+        return self._dicts
+
+# (day offset from Saturday, day, time, slots) of each weekend's shifts
+WEEKEND_SHIFTS = [
+    (0, 'Saturday', '8:00 AM - 4:00 PM', 1),   # Saturday morning - 1 reporter
+    (0, 'Saturday', '3:00 PM - 10:00 PM', 1),  # Saturday evening - 1 reporter
+    (1, 'Sunday', '8:00 AM - 4:00 PM', 2),     # Sunday morning - 2 reporters
+    (1, 'Sunday', '3:00 PM - 10:00 PM', 2),    # Sunday evening - 2 reporters
+]
+
+def generate_shifts(start_date=datetime(2025, 12, 13), weeks=21, per_weekend=4, slots=None):
+    """Four shifts per weekend for `weeks` weekends, starting on Saturday start_date.
+    
+    per_weekend keeps only the first 1-4 of WEEKEND_SHIFTS; slots, if
+    given, replaces every shift's slot count (for synthetic seasons).
+    """
+    shifts = []
+    shift_id = 0
+    
+    for week in range(weeks):
+        saturday = start_date + timedelta(weeks=week)
+        
+        for offset, day, time, shift_slots in WEEKEND_SHIFTS[:per_weekend]:
+            date = saturday + timedelta(days=offset)
+            shifts.append(Shift(shift_id, date.strftime('%Y-%m-%d'), day, time,
+                                shift_slots if slots is None else slots, week + 1))
+            shift_id += 1
+    
+    return ShiftCatalog(shifts)
@@ -0,0 +1,705 @@
+"""
+Storage backends for the weekend reporter data
+
+The app keeps four datasets: reporters, preferences, settings and assignments.
+Each one is a JSON object (dict) at the top level. Two interchangeable
+backends hold them:
+
+- JSONStorage: one JSON file per dataset in the data directory. This is the
+  original layout and is fine for small installs.
+- JournalStorage: like JSONStorage, but each preference submission is
+  appended to data/preferences.journal as one JSON line. preferences.json
+  becomes a snapshot that the journal is replayed on top of, and is only
+  rewritten when the journal is compacted.
+- SQLiteStorage: a single SQLite database in WAL mode, with one row per key.
+  A preference submission is a single-row upsert instead of a whole-file
+  rewrite, and allocation is committed in one transaction.
+
+Choose the backend with the STORAGE_BACKEND environment variable ('json',
+'journal' or 'sqlite'). Use migrate_to_sqlite.py to copy existing data/*.json files into
+the database before switching.
+
+JSON datasets are cached in each worker process. A shared, mmap'd counter
+per dataset (data/.generations) is bumped on every write, so a worker can
+tell its cached copy is current without reading or even stat'ing the file.
+"""
+
+import contextlib
+import json
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import time
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    # fcntl is not available on Windows
+    HAS_FCNTL = False
+
+DATASETS = ('reporters', 'preferences', 'settings', 'assignments')
+
+SQLITE_FILENAME = 'weekend_reporter.db'
+
+# The preference journal is folded into a new snapshot once it passes either limit
+JOURNAL_MAX_ENTRIES = 500
+JOURNAL_MAX_BYTES = 1024 * 1024
+
+# Parsed-file cache: path -> ((mtime_ns, size, inode), data)
+# Each gunicorn worker has its own cache. Entries are validated against the
+# dataset's shared generation counter (see _Generations), falling back to the
+# file's stat, so writes from other workers are picked up.
+_json_cache = {}
+_json_cache_stats = {'hits': 0, 'misses': 0, 'stat_skips': 0}
+
+# Filesystem timestamps are only as fine as the kernel clock tick, so a file
+# modified very recently could be rewritten again with the same mtime and size.
+# Such "racy" reads are not cached.
+_RACY_WINDOW_NS = 1_000_000_000
+
+# Edits made outside this module (by hand, or a script using json.dump) do not
+# bump a generation; a cached file is re-stat'ed at least this often anyway.
+STAT_RECHECK_SECONDS = 5.0
+
+GENERATIONS_FILENAME = '.generations'
+
+class _Generations:
+    """Per-dataset write counters shared by every worker through an mmap'd file.
+    
+    data/.generations holds one 8-byte counter per dataset. Every write
+    through this module bumps the dataset's counter after the new file is in
+    place, so a reader whose cached copy carries the current generation can
+    skip even the stat. Callers bump while holding the dataset's write lock,
+    which keeps increments from being lost.
+    """
+    
+    SLOTS = {f'{dataset}.json': i for i, dataset in enumerate(DATASETS)}
+    
+    def __init__(self, data_dir):
+        path = os.path.join(data_dir, GENERATIONS_FILENAME)
+        size = 8 * len(self.SLOTS)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+    
+    def get(self, slot):
+        return struct.unpack_from('<Q', self._map, slot * 8)[0]
+    
+    def bump(self, slot):
+        struct.pack_into('<Q', self._map, slot * 8, self.get(slot) + 1)
+
+_generations = {}
+_generations_guard = threading.Lock()
+
+def _generation_slot(filepath):
+    """(counters, slot) for a dataset file, or None for files that are not tracked"""
+    slot = _Generations.SLOTS.get(os.path.basename(filepath))
+    if slot is None:
+        return None
+    data_dir = os.path.dirname(os.path.abspath(filepath))
+    counters = _generations.get(data_dir)
+    if counters is None:
+        with _generations_guard:
+            counters = _generations.get(data_dir)
+            if counters is None:
+                try:
+                    counters = _generations[data_dir] = _Generations(data_dir)
+                except OSError:
+                    return None
+    return counters, slot
+
+def _generation(filepath):
+    tracked = _generation_slot(filepath)
+    return tracked[0].get(tracked[1]) if tracked else None
+
+def _bump_generation(filepath):
+    """Tell every worker filepath changed (caller holds its write lock)"""
+    tracked = _generation_slot(filepath)
+    if tracked:
+        tracked[0].bump(tracked[1])
+
+def _file_key(filepath):
+    st = os.stat(filepath)
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+# filepath -> (file key or None, generation, time of the stat), for version()
+_file_keys = {}
+
+def _cached_file_key(filepath, generation):
+    """_file_key(), or None if there is no file, skipping the stat as load_json() does.
+    
+    A key stat'ed under the current generation less than
+    STAT_RECHECK_SECONDS ago is still good, unless the file was then too
+    new to trust (see _RACY_WINDOW_NS).
+    """
+    cached = _file_keys.get(filepath)
+    now = time.monotonic()
+    if (cached is not None and generation is not None and cached[1] == generation
+            and now - cached[2] < STAT_RECHECK_SECONDS):
+        _json_cache_stats['stat_skips'] += 1
+        return cached[0]
+    try:
+        key = _file_key(filepath)
+    except FileNotFoundError:
+        key = None
+    if key is None or time.time_ns() - key[0] > _RACY_WINDOW_NS:
+        _file_keys[filepath] = (key, generation, now)
+    return key
+
+def _copy_json(value):
+    """Copy parsed JSON data (much cheaper than re-parsing or deepcopy)"""
+    if isinstance(value, dict):
+        return {k: _copy_json(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy_json(v) for v in value]
+    return value
+
+def load_json(filepath, verify=False):
+    """Load JSON, re-parsing only when the file changed since the last read.
+    
+    If the dataset's generation is unchanged and the file was stat'ed in the
+    last STAT_RECHECK_SECONDS, the cached copy is returned without touching
+    the file. verify=True always stats (used under the write lock).
+    """
+    # Read the generation before the file: a write landing in between
+    # leaves us caching newer data under an older generation, which just
+    # costs one extra re-parse next time
+    generation = _generation(filepath)
+    cached = _json_cache.get(filepath)
+    now = time.monotonic()
+    if (cached is not None and not verify and generation is not None and cached[2] == generation
+            and now - cached[3] < STAT_RECHECK_SECONDS):
+        _json_cache_stats['hits'] += 1
+        _json_cache_stats['stat_skips'] += 1
+        return _copy_json(cached[1])
+    
+    # Stat before reading: if the file changes mid-read we cache newer data
+    # under an older key, which just forces one extra re-parse next time
+    key = _file_key(filepath)
+    if cached is not None and cached[0] == key:
+        _json_cache_stats['hits'] += 1
+        _json_cache[filepath] = (key, cached[1], generation, now)
+        return _copy_json(cached[1])
+    
+    _json_cache_stats['misses'] += 1
+    with open(filepath, 'r') as f:
+        data = json.load(f)
+    if time.time_ns() - key[0] > _RACY_WINDOW_NS:
+        _json_cache[filepath] = (key, data, generation, now)
+    # Callers mutate what they get back, so never hand out the cached object
+    return _copy_json(data)
+
+def _write_json_temp(filepath, data):
+    """Write JSON next to filepath and fsync it; returns the temp path"""
+    tmp_path = f'{filepath}.tmp.{os.getpid()}.{threading.get_ident()}'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    return tmp_path
+
+def _write_json_atomic(filepath, data):
+    """Write JSON to a temp file, fsync it, then rename it over filepath.
+    
+    Readers see either the old file or the new one, never a partial write.
+    """
+    _json_cache.pop(filepath, None)
+    os.replace(_write_json_temp(filepath, data), filepath)
+    _bump_generation(filepath)
+
+def _lock(f, exclusive=True):
+    if HAS_FCNTL:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+def _unlock(f):
+    if HAS_FCNTL:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+# Without fcntl (Windows) we can only serialise threads within one process
+_fallback_locks = {}
+_fallback_locks_guard = threading.Lock()
+
+class FileLock:
+    """Exclusive lock on <filepath>.lock, held across a whole read-modify-write.
+    
+    The data file itself is replaced by rename on every write, so it cannot
+    carry the lock; the sidecar .lock file is never replaced.
+    """
+    
+    def __init__(self, filepath):
+        self.lock_path = f'{filepath}.lock'
+    
+    def __enter__(self):
+        if HAS_FCNTL:
+            self.f = open(self.lock_path, 'a')
+            _lock(self.f)
+        else:
+            with _fallback_locks_guard:
+                self.f = _fallback_locks.setdefault(self.lock_path, threading.Lock())
+            self.f.acquire()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if HAS_FCNTL:
+            _unlock(self.f)
+            self.f.close()
+        else:
+            self.f.release()
+        return False
+
+class AbortUpdate(Exception):
+    """Raise inside an update() callback to leave the file unchanged"""
+
+def save_json(filepath, data):
+    """Save JSON atomically (temp file + fsync + rename) under the file's lock"""
+    with FileLock(filepath):
+        _write_json_atomic(filepath, data)
+
+def write_json(filepath, data):
+    """Save JSON atomically (temp file + fsync + rename) without a lock.
+    
+    For files that are written once, or only by a writer that is already
+    serialised, like previews and job files: save_json() would leave a
+    .lock sidecar next to each of them.
+    """
+    _write_json_atomic(filepath, data)
+
+def update(filepath, fn, default=None):
+    """Atomic read-modify-write of a JSON file.
+    
+    Holds an exclusive lock across read -> fn(data) -> write temp -> fsync ->
+    rename, so concurrent writers in other workers cannot lose each other's
+    changes. fn mutates data in place; its return value is passed back to
+    the caller. If fn raises (e.g. AbortUpdate) nothing is written.
+    """
+    with FileLock(filepath):
+        if os.path.exists(filepath):
+            data = load_json(filepath, verify=True)
+        else:
+            data = {} if default is None else default
+        result = fn(data)
+        _write_json_atomic(filepath, data)
+        return result
+
+def get_cache_stats():
+    """Hit/miss counters for the JSON cache in this worker process"""
+    hits = _json_cache_stats['hits']
+    misses = _json_cache_stats['misses']
+    total = hits + misses
+    return {
+        'pid': os.getpid(),
+        'hits': hits,
+        'misses': misses,
+        'stat_skips': _json_cache_stats['stat_skips'],
+        'hit_rate': round(hits / total * 100, 1) if total else 0,
+        'cached_files': len(_json_cache)
+    }
+
+def _lock_preferences(settings):
+    settings['is_locked'] = True
+
+class JSONStorage:
+    """One pretty-printed JSON file per dataset (data/<dataset>.json)"""
+    
+    name = 'json'
+    
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+    
+    def path(self, dataset):
+        return os.path.join(self.data_dir, f'{dataset}.json')
+    
+    def exists(self, dataset):
+        return os.path.exists(self.path(dataset))
+    
+    def load(self, dataset):
+        return load_json(self.path(dataset))
+    
+    def version(self, dataset):
+        """A token that changes whenever the dataset does (for caches of derived data)"""
+        path = self.path(dataset)
+        generation = _generation(path)
+        return (generation, _cached_file_key(path, generation))
+    
+    def save(self, dataset, data):
+        save_json(self.path(dataset), data)
+    
+    def update(self, dataset, fn):
+        """Atomic read-modify-write of one dataset (see update() above)"""
+        return update(self.path(dataset), fn)
+    
+    def set_preference(self, username, prefs):
+        """Store one reporter's preferences (rewrites preferences.json)"""
+        def apply(preferences):
+            preferences[username] = prefs
+        self.update('preferences', apply)
+    
+    def commit_allocation(self, assignments):
+        """Save allocation results and lock preferences"""
+        def replace(data):
+            data.clear()
+            data.update(assignments)
+        self.update('assignments', replace)
+        self.update('settings', _lock_preferences)
+    
+    def replace_all(self, datasets):
+        """Replace several datasets at once (restore from backup).
+        
+        Every file is locked and every new version written and fsync'd before
+        the first rename, so a bad write leaves all the old files in place.
+        """
+        with contextlib.ExitStack() as stack:
+            for dataset in sorted(datasets):
+                stack.enter_context(FileLock(self.path(dataset)))
+            tmp_paths = {}
+            try:
+                for dataset, data in datasets.items():
+                    tmp_paths[dataset] = _write_json_temp(self.path(dataset), data)
+            except BaseException:
+                for tmp_path in tmp_paths.values():
+                    os.remove(tmp_path)
+                raise
+            for dataset, tmp_path in tmp_paths.items():
+                _json_cache.pop(self.path(dataset), None)
+                os.replace(tmp_path, self.path(dataset))
+                _bump_generation(self.path(dataset))
+
+class JournalStorage(JSONStorage):
+    """JSON files, with preference submissions appended to a journal.
+    
+    preferences = preferences.json (snapshot) + replay of preferences.journal.
+    Appends take an exclusive flock on the journal and fsync before
+    returning; readers take a shared flock so they never see a snapshot and
+    journal from different sides of a compaction. The snapshot is always
+    replaced by rename, so a changed snapshot key means the journal was
+    reset and has to be replayed from the start.
+    """
+    
+    name = 'journal'
+    
+    def __init__(self, data_dir):
+        super().__init__(data_dir)
+        self.journal_path = os.path.join(data_dir, 'preferences.journal')
+        # Replay state for this process: snapshot key, bytes and entries replayed
+        self._snapshot_key = None
+        self._offset = 0
+        self._entries = 0
+        self._preferences = {}
+        # Generation of preferences when the replay state was last refreshed
+        self._generation = None
+        self._checked = 0
+        self._thread_lock = threading.Lock()
+    
+    def exists(self, dataset):
+        if dataset == 'preferences' and os.path.exists(self.journal_path):
+            return True
+        return super().exists(dataset)
+    
+    def _open_journal(self):
+        return open(self.journal_path, 'a+b')
+    
+    def _refresh(self, journal):
+        """Bring the in-memory state up to date (caller holds the flock)"""
+        snapshot_path = self.path('preferences')
+        key = _file_key(snapshot_path) if os.path.exists(snapshot_path) else None
+        journal.seek(0, os.SEEK_END)
+        size = journal.tell()
+        
+        if key != self._snapshot_key or size < self._offset:
+            self._preferences = load_json(snapshot_path) if key else {}
+            self._snapshot_key = key
+            self._offset = 0
+            self._entries = 0
+        
+        if size > self._offset:
+            journal.seek(self._offset)
+            for line in journal.read(size - self._offset).splitlines(keepends=True):
+                if not line.endswith(b'\n'):
+                    # Torn write from a crash mid-append; it was never acknowledged
+                    break
+                self._offset += len(line)
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                self._preferences[entry['username']] = entry['prefs']
+                self._entries += 1
+    
+    def load(self, dataset):
+        if dataset != 'preferences':
+            return super().load(dataset)
+        generation = _generation(self.path('preferences'))
+        with self._thread_lock:
+            now = time.monotonic()
+            if (generation is not None and generation == self._generation
+                    and now - self._checked < STAT_RECHECK_SECONDS):
+                return _copy_json(self._preferences)
+            with self._open_journal() as journal:
+                _lock(journal, exclusive=False)
+                try:
+                    self._refresh(journal)
+                    self._generation = generation
+                    self._checked = now
+                    return _copy_json(self._preferences)
+                finally:
+                    _unlock(journal)
+    
+    def version(self, dataset):
+        if dataset != 'preferences':
+            return super().version(dataset)
+        # Appends grow the journal; compaction replaces the snapshot
+        journal_size = os.path.getsize(self.journal_path) if os.path.exists(self.journal_path) else 0
+        return super().version(dataset) + (journal_size,)
+    
+    def save(self, dataset, data):
+        if dataset != 'preferences':
+            return super().save(dataset, data)
+        with self._thread_lock, self._open_journal() as journal:
+            _lock(journal)
+            try:
+                self._write_snapshot(journal, data)
+            finally:
+                _unlock(journal)
+    
+    def update(self, dataset, fn):
+        if dataset != 'preferences':
+            return super().update(dataset, fn)
+        with self._thread_lock, self._open_journal() as journal:
+            _lock(journal)
+            try:
+                self._refresh(journal)
+                preferences = _copy_json(self._preferences)
+                result = fn(preferences)
+                self._write_snapshot(journal, preferences)
+                return result
+            finally:
+                _unlock(journal)
+    
+    def replace_all(self, datasets):
+        if 'preferences' not in datasets:
+            return super().replace_all(datasets)
+        with self._thread_lock, self._open_journal() as journal:
+            _lock(journal)
+            try:
+                super().replace_all(datasets)
+                # The restored snapshot supersedes everything in the journal
+                journal.truncate(0)
+                os.fsync(journal.fileno())
+                self._snapshot_key = None
+            finally:
+                _unlock(journal)
+    
+    def _write_snapshot(self, journal, preferences):
+        """Replace the snapshot and empty the journal (caller holds the flock)"""
+        _write_json_atomic(self.path('preferences'), preferences)
+        journal.truncate(0)
+        os.fsync(journal.fileno())
+        self._preferences = _copy_json(preferences)
+        self._snapshot_key = _file_key(self.path('preferences'))
+        self._offset = 0
+        self._entries = 0
+    
+    def set_preference(self, username, prefs):
+        """Append one submission to the journal (O(1), fsync'd)"""
+        line = json.dumps({
+            'username': username,
+            'prefs': prefs,
+            'ts': time.time()
+        }).encode('utf-8') + b'\n'
+        
+        with self._thread_lock, self._open_journal() as journal:
+            _lock(journal)
+            try:
+                journal.seek(0, os.SEEK_END)
+                if journal.tell():
+                    journal.seek(-1, os.SEEK_END)
+                    if journal.read(1) != b'\n':
+                        # Terminate a torn line so it cannot swallow this entry
+                        line = b'\n' + line
+                journal.write(line)
+                journal.flush()
+                os.fsync(journal.fileno())
+                _bump_generation(self.path('preferences'))
+                
+                self._refresh(journal)
+                if self._entries >= JOURNAL_MAX_ENTRIES or self._offset >= JOURNAL_MAX_BYTES:
+                    self._write_snapshot(journal, self._preferences)
+            finally:
+                _unlock(journal)
+    
+    def compact(self):
+        """Fold the journal into a new preferences.json snapshot"""
+        with self._thread_lock, self._open_journal() as journal:
+            _lock(journal)
+            try:
+                self._refresh(journal)
+                if self._entries:
+                    self._write_snapshot(journal, self._preferences)
+            finally:
+                _unlock(journal)
+    
+    def journal_stats(self):
+        with self._thread_lock, self._open_journal() as journal:
+            _lock(journal, exclusive=False)
+            try:
+                self._refresh(journal)
+                return {'entries': self._entries, 'bytes': self._offset}
+            finally:
+                _unlock(journal)
+
+class SQLiteStorage:
+    """All datasets in one SQLite database, one (key, value) table per dataset"""
+    
+    name = 'sqlite'
+    
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        with self._transaction() as conn:
+            for dataset in DATASETS:
+                conn.execute(f'CREATE TABLE IF NOT EXISTS {dataset} '
+                             '(key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            # Per-dataset change counter, bumped by every write (see version())
+            conn.execute('CREATE TABLE IF NOT EXISTS versions '
+                         '(dataset TEXT PRIMARY KEY, version INTEGER NOT NULL)')
+    
+    def _connect(self):
+        """One connection per thread, re-opened after gunicorn forks a worker"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            # isolation_level=None: we issue BEGIN/COMMIT ourselves
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # NORMAL is durable in WAL mode except for the last commits on power loss
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+    
+    def _transaction(self):
+        return _SQLiteTransaction(self._connect())
+    
+    def exists(self, dataset):
+        row = self._connect().execute(f'SELECT 1 FROM {dataset} LIMIT 1').fetchone()
+        return row is not None
+    
+    def load(self, dataset):
+        rows = self._connect().execute(f'SELECT key, value FROM {dataset} ORDER BY rowid')
+        return {key: json.loads(value) for key, value in rows}
+    
+    def version(self, dataset):
+        row = self._connect().execute('SELECT version FROM versions WHERE dataset = ?', (dataset,)).fetchone()
+        return row[0] if row else 0
+    
+    def _touch(self, conn, dataset):
+        conn.execute('INSERT INTO versions (dataset, version) VALUES (?, 1) '
+                     'ON CONFLICT(dataset) DO UPDATE SET version = version + 1', (dataset,))
+    
+    def _replace(self, conn, dataset, data):
+        self._touch(conn, dataset)
+        conn.execute(f'DELETE FROM {dataset}')
+        conn.executemany(f'INSERT INTO {dataset} (key, value) VALUES (?, ?)',
+                         [(key, json.dumps(value)) for key, value in data.items()])
+    
+    def _upsert(self, conn, dataset, key, value):
+        self._touch(conn, dataset)
+        conn.execute(f'INSERT INTO {dataset} (key, value) VALUES (?, ?) '
+                     'ON CONFLICT(key) DO UPDATE SET value = excluded.value',
+                     (key, json.dumps(value)))
+    
+    def save(self, dataset, data):
+        with self._transaction() as conn:
+            self._replace(conn, dataset, data)
+    
+    def update(self, dataset, fn):
+        """Read-modify-write inside one transaction; only changed rows are written"""
+        with self._transaction() as conn:
+            before = self.load(dataset)
+            data = _copy_json(before)
+            result = fn(data)
+            removed = [(key,) for key in before if key not in data]
+            if removed:
+                self._touch(conn, dataset)
+                conn.executemany(f'DELETE FROM {dataset} WHERE key = ?', removed)
+            for key, value in data.items():
+                if key not in before or before[key] != value:
+                    self._upsert(conn, dataset, key, value)
+            return result
+    
+    def set_preference(self, username, prefs):
+        """Store one reporter's preferences (single-row upsert)"""
+        with self._transaction() as conn:
+            self._upsert(conn, 'preferences', username, prefs)
+    
+    def commit_allocation(self, assignments):
+        """Save allocation results and lock preferences in one transaction"""
+        with self._transaction() as conn:
+            self._replace(conn, 'assignments', assignments)
+            self._upsert(conn, 'settings', 'is_locked', True)
+    
+    def replace_all(self, datasets):
+        """Replace several datasets in one transaction (restore from backup)"""
+        with self._transaction() as conn:
+            for dataset, data in datasets.items():
+                self._replace(conn, dataset, data)
+
+class _SQLiteTransaction:
+    """BEGIN IMMEDIATE ... COMMIT, rolled back if the block raises"""
+    
+    def __init__(self, conn):
+        self.conn = conn
+    
+    def __enter__(self):
+        # IMMEDIATE takes the write lock up front so concurrent writers queue
+        # on busy_timeout instead of failing halfway through
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute('COMMIT')
+        else:
+            self.conn.execute('ROLLBACK')
+        return False
+
+def get_storage(data_dir, backend=None):
+    """Create the storage backend named by STORAGE_BACKEND (default: json)"""
+    backend = (backend or os.environ.get('STORAGE_BACKEND', 'json')).lower()
+    if backend == 'json':
+        return JSONStorage(data_dir)
+    if backend == 'journal':
+        return JournalStorage(data_dir)
+    if backend == 'sqlite':
+        db_path = os.environ.get('SQLITE_PATH', os.path.join(data_dir, SQLITE_FILENAME))
+        return SQLiteStorage(db_path)
+    raise ValueError(f"Unknown STORAGE_BACKEND '{backend}' (expected 'json', 'journal' or 'sqlite')")
+
+def migrate_json_to_sqlite(data_dir, db_path):
+    """Copy every data/<dataset>.json file into the SQLite database.
+    
+    Existing rows for a dataset are replaced. Returns {dataset: record count}
+    for the datasets that were migrated.
+    """
+    source = JSONStorage(data_dir)
+    if os.path.exists(os.path.join(data_dir, 'preferences.journal')):
+        # Fold in submissions that have not been compacted into preferences.json yet
+        source = JournalStorage(data_dir)
+    target = SQLiteStorage(db_path)
+    migrated = {}
+    
+    # One transaction: either every dataset is copied or none is
+    with target._transaction() as conn:
+        for dataset in DATASETS:
+            if not source.exists(dataset):
+                continue
+            data = source.load(dataset)
+            target._replace(conn, dataset, data)
+            migrated[dataset] = len(data)
+    
+    return migrated
@@ -0,0 +1,145 @@
+"""
+Stress test concurrent preference submissions against the storage backends
+
+Simulates the deadline-day rush: several worker processes (like gunicorn
+workers), each with many threads, submit different reporters' preferences
+at the same moment while reader processes keep loading the data.
+
+Afterwards it checks that:
+1. Every submitted reporter is present in preferences (no lost updates)
+2. A counter in settings, bumped once per submitter through update(),
+   equals the number of submitters (read-modify-write is atomic)
+3. No reader ever saw a partially written or unparseable file
+
+Usage:
+    python stress_test_storage.py                 # 256 submitters, all backends
+    python stress_test_storage.py 400 json sqlite # 400 submitters, two backends
+"""
+
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from storage import get_storage
+
+PROCESSES = 8
+BACKENDS = ['json', 'journal', 'sqlite']
+
+def make_preferences(n):
+    return {
+        'top_10': [(n + i) % 80 for i in range(10)],
+        'bottom_5': [(n + 40 + i) % 80 for i in range(5)],
+        'shift_type_pref': {'saturday_morning': '1', 'sunday_morning': '2', 'sunday_evening': '3'}
+    }
+
+def bump_counter(settings):
+    settings['counter'] = settings.get('counter', 0) + 1
+
+def submitter_process(data_dir, backend, usernames, start, errors):
+    storage = get_storage(data_dir, backend)
+    
+    def submit(username, n):
+        try:
+            start.wait()
+            storage.set_preference(username, make_preferences(n))
+            storage.update('settings', bump_counter)
+        except Exception as e:
+            errors.put(f'{username}: {e!r}')
+    
+    threads = [threading.Thread(target=submit, args=(username, n)) for n, username in usernames]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+def reader_process(data_dir, backend, start, done, reads, errors):
+    storage = get_storage(data_dir, backend)
+    start.wait()
+    count = 0
+    while not done.is_set():
+        try:
+            storage.load('preferences')
+            storage.load('settings')
+            count += 1
+        except Exception as e:
+            errors.put(f'reader: {e!r}')
+    with reads.get_lock():
+        reads.value += count
+
+def run(backend, submitters):
+    data_dir = tempfile.mkdtemp(prefix=f'stress_{backend}_')
+    try:
+        storage = get_storage(data_dir, backend)
+        storage.save('preferences', {})
+        storage.save('settings', {'is_locked': False, 'counter': 0})
+        
+        ctx = multiprocessing.get_context('fork')
+        usernames = [(n, f'reporter{n}') for n in range(submitters)]
+        # Every submitter thread plus the two readers and this process start together
+        start = ctx.Barrier(submitters + 3)
+        done = ctx.Event()
+        reads = ctx.Value('i', 0)
+        errors = ctx.Queue()
+        
+        workers = [ctx.Process(target=submitter_process,
+                               args=(data_dir, backend, usernames[i::PROCESSES], start, errors))
+                   for i in range(PROCESSES)]
+        readers = [ctx.Process(target=reader_process, args=(data_dir, backend, start, done, reads, errors))
+                   for _ in range(2)]
+        for p in workers + readers:
+            p.start()
+        
+        start.wait()
+        began = time.perf_counter()
+        for p in workers:
+            p.join()
+        elapsed = time.perf_counter() - began
+        done.set()
+        for p in readers:
+            p.join()
+        
+        problems = []
+        while not errors.empty():
+            problems.append(errors.get())
+        
+        storage = get_storage(data_dir, backend)
+        preferences = storage.load('preferences')
+        settings = storage.load('settings')
+        lost = [u for _, u in usernames if preferences.get(u) != make_preferences(int(u[8:]))]
+        
+        ok = not lost and not problems and settings['counter'] == submitters
+        print(f"{'✓' if ok else '✗'} {backend:8} {submitters} submitters in {elapsed:.2f}s "
+              f"({submitters / elapsed:.0f}/s), {reads.value} concurrent reads")
+        print(f"    preferences stored: {len(preferences)}/{submitters}, lost: {len(lost)}")
+        print(f"    settings counter:   {settings['counter']}/{submitters}")
+        print(f"    errors:             {len(problems)}")
+        for problem in problems[:5]:
+            print(f"      {problem}")
+        return ok
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+def main():
+    submitters = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    backends = sys.argv[2:] or BACKENDS
+    # Let the backend choice come from here, not the environment
+    os.environ.pop('SQLITE_PATH', None)
+    
+    print("=" * 80)
+    print(f"STORAGE STRESS TEST: {submitters} CONCURRENT SUBMITTERS, {PROCESSES} PROCESSES")
+    print("=" * 80)
+    
+    results = [run(backend, submitters) for backend in backends]
+    
+    print("\n" + "=" * 80)
+    if all(results):
+        print("✅ No lost updates and no partial reads")
+    else:
+        print("❌ Lost updates or read errors detected")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
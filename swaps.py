@@ -0,0 +1,239 @@
+"""
+Swap marketplace: reporters trade their assigned shifts
+
+Once assignments are published, a reporter can post an offer for one of
+their shifts, listing the shifts they would take for it (best first).
+SwapBook indexes the open offers by offered shift, then by wanted shift:
+
+    wanting[offered][wanted] -> open offers of `offered` that accept `wanted`
+
+When an offer of shift a for any of the shifts W arrives, for each w in W:
+
+- a direct swap is an open offer in wanting[w][a]
+- a three-way chain is an offer P in wanting[w][x] and an offer Q in
+  wanting[x][a], for some shift x: the newcomer takes w from P, P takes x
+  from Q and Q takes a
+
+A second index, accepting[a], holds the shifts whose offers accept a, so an
+offer nobody wants is turned away at once. Both steps walk shift pairs (at
+most 84 x 84), never the list of offers, so matching costs the same with
+ten open offers or ten thousand.
+
+Offers are kept in data/swap_offers.json. SwapMarket.post() adds the offer
+and, if it completes a swap, executes it inside the same locked update of
+that file: the caller's execute() rewrites the assignments under their own
+lock and names anyone who no longer holds the shift they offered. Their
+offers are dropped and matching is tried again.
+
+Every swap is one shift for one shift around a cycle, so shift and cap
+counts do not change.
+"""
+
+import os
+import secrets
+from datetime import datetime
+from storage import load_json, update
+
+# Executed swaps kept in the file for the manager's view
+MAX_HISTORY = 200
+
+class SwapError(Exception):
+    """The offer cannot be posted (e.g. the reporter no longer holds the shift)"""
+
+class SwapBook:
+    """Open offers, indexed by offered shift and wanted shift"""
+    
+    def __init__(self, offers=()):
+        self.offers = {}  # offer id -> offer
+        self.wanting = {}  # offered shift -> {wanted shift: {offer id: None}}
+        self.by_holder = {}  # (username, offered shift) -> offer id
+        self.accepting = {}  # wanted shift -> {offered shift: open offers of it that accept the wanted one}
+        for offer in offers:
+            self.add(offer)
+    
+    def add(self, offer):
+        self.offers[offer['id']] = offer
+        self.by_holder[(offer['username'], offer['shift_id'])] = offer['id']
+        edges = self.wanting.setdefault(offer['shift_id'], {})
+        for wanted in offer['wants']:
+            # Dicts as ordered sets: the oldest offer is matched first
+            edges.setdefault(wanted, {})[offer['id']] = None
+            takers = self.accepting.setdefault(wanted, {})
+            takers[offer['shift_id']] = takers.get(offer['shift_id'], 0) + 1
+    
+    def remove(self, offer_id):
+        """Take an offer out of the book; returns it (or None)"""
+        offer = self.offers.pop(offer_id, None)
+        if offer is None:
+            return None
+        del self.by_holder[(offer['username'], offer['shift_id'])]
+        edges = self.wanting[offer['shift_id']]
+        for wanted in offer['wants']:
+            del edges[wanted][offer_id]
+            if not edges[wanted]:
+                del edges[wanted]
+            takers = self.accepting[wanted]
+            takers[offer['shift_id']] -= 1
+            if not takers[offer['shift_id']]:
+                del takers[offer['shift_id']]
+                if not takers:
+                    del self.accepting[wanted]
+        if not edges:
+            del self.wanting[offer['shift_id']]
+        return offer
+    
+    def _pick(self, offered, wanted, exclude):
+        """The oldest offer of `offered` accepting `wanted`, from anyone not in exclude"""
+        for offer_id in self.wanting.get(offered, {}).get(wanted, ()):
+            # Each reporter has at most one offer per shift, so this skips at most len(exclude)
+            if self.offers[offer_id]['username'] not in exclude:
+                return self.offers[offer_id]
+        return None
+    
+    def match(self, offer):
+        """Offers that complete a swap with this one: [P] (direct) or [P, Q] (chain), or None.
+        
+        The newcomer gets the first shift in their list that any swap can
+        give them; for that shift a direct swap beats a chain.
+        """
+        given, me = offer['shift_id'], offer['username']
+        # Shifts whose holders would take the one on offer: the last link of any swap
+        takers = self.accepting.get(given)
+        if not takers:
+            return None
+        for wanted in offer['wants']:
+            if wanted in takers:
+                partner = self._pick(wanted, given, {me})
+                if partner is not None:
+                    return [partner]
+            # Middle shifts: wanted by a holder of `wanted`, held by a taker
+            edges = self.wanting.get(wanted, {})
+            for middle in (edges if len(edges) <= len(takers) else takers):
+                if middle == given or middle not in edges or middle not in takers:
+                    continue
+                last = self._pick(middle, given, {me})
+                if last is None:
+                    continue
+                partner = self._pick(wanted, middle, {me, last['username']})
+                if partner is not None:
+                    return [partner, last]
+        return None
+
+def swap_trades(offer, partners):
+    """(username, shift given, shift taken) for everyone in the swap"""
+    chain = [offer] + partners
+    # Each takes the shift of the next one round the cycle
+    return [(o['username'], o['shift_id'], chain[(i + 1) % len(chain)]['shift_id']) for i, o in enumerate(chain)]
+
+class SwapMarket:
+    """Open offers and executed swaps in one JSON file, with a per-worker SwapBook"""
+    
+    def __init__(self, path, max_history=MAX_HISTORY):
+        self.path = path
+        self.max_history = max_history
+        # (revision, SwapBook); the file's revision goes up on every write
+        self._book = None
+    
+    def load(self):
+        if not os.path.exists(self.path):
+            return {'revision': 0, 'offers': {}, 'swaps': []}
+        return load_json(self.path)
+    
+    def _index(self, data):
+        revision = data.get('revision', 0)
+        if self._book is None or self._book[0] != revision:
+            self._book = (revision, SwapBook(data.get('offers', {}).values()))
+        return self._book[1]
+    
+    def _update(self, fn):
+        """Locked read-modify-write of the file, keeping the cached book in step"""
+        def apply(data):
+            book = self._index(data)
+            # Changed in place below, so no other request may use it until the write is done
+            self._book = None
+            data.setdefault('offers', {})
+            data.setdefault('swaps', [])
+            result = fn(data, book)
+            data['revision'] = data.get('revision', 0) + 1
+            return result, (data['revision'], book)
+        
+        result, self._book = update(self.path, apply)
+        return result
+    
+    def post(self, username, shift_id, wants, execute):
+        """Post an offer and execute the first swap it completes.
+        
+        execute(trades) applies [(username, given, taken), ...] to the
+        assignments and returns the usernames who no longer hold the shift
+        they offered (or already hold the one they would take); the swap is
+        only applied if that list is empty.
+        
+        Returns (offer, swap): the offer left open (None if it was swapped
+        straight away) and the executed swap (or None).
+        """
+        offer = {
+            'id': secrets.token_hex(6),
+            'username': username,
+            'shift_id': shift_id,
+            'wants': list(wants),
+            'created_at': datetime.now().isoformat()
+        }
+        
+        def apply(data, book):
+            offers = data['offers']
+            # A new offer for the same shift replaces the old one
+            old = book.by_holder.get((username, shift_id))
+            if old is not None:
+                book.remove(old)
+                del offers[old]
+            
+            while True:
+                partners = book.match(offer)
+                if partners is None:
+                    book.add(offer)
+                    offers[offer['id']] = offer
+                    return offer, None
+                trades = swap_trades(offer, partners)
+                stale = set(execute(trades))
+                if not stale:
+                    break
+                if username in stale:
+                    raise SwapError(f'{username} no longer holds shift {shift_id}')
+                for partner in partners:
+                    if partner['username'] in stale:
+                        book.remove(partner['id'])
+                        del offers[partner['id']]
+            
+            for partner in partners:
+                book.remove(partner['id'])
+                del offers[partner['id']]
+            swap = {
+                'trades': [{'username': u, 'gave': given, 'took': taken} for u, given, taken in trades],
+                'offers': [offer['id']] + [p['id'] for p in partners],
+                'executed_at': datetime.now().isoformat()
+            }
+            data['swaps'] = (data['swaps'] + [swap])[-self.max_history:]
+            return None, swap
+        
+        return self._update(apply)
+    
+    def cancel(self, offer_id, username=None):
+        """Withdraw an open offer (only the poster's own, unless username is None); returns it or None"""
+        def apply(data, book):
+            offer = book.offers.get(offer_id)
+            if offer is None or (username is not None and offer['username'] != username):
+                return None
+            book.remove(offer_id)
+            del data['offers'][offer_id]
+            return offer
+        return self._update(apply)
+    
+    def clear(self):
+        """Drop every open offer (a new allocation replaces the shifts they were for)"""
+        if not os.path.exists(self.path):
+            return
+        def apply(data, book):
+            for offer_id in list(book.offers):
+                book.remove(offer_id)
+            data['offers'].clear()
+        self._update(apply)
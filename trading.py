@@ -0,0 +1,155 @@
+"""
+Top trading cycles: swap shifts after allocation so nobody is worse off
+
+A random order leaves reporters holding shifts that someone else ranks
+higher, and the other way round. trade_shifts() finds the trades they would
+all agree to with Gale's top trading cycles:
+
+- every reporter with preferences points at a holder of the best shift in
+  their top 10 that beats the shift they hold (a fallback or bottom-5 shift
+  is beaten by any top-10 shift)
+- following the pointers from anyone reaches either a reporter with nothing
+  better to point at, who keeps their shift and leaves, or a cycle; everyone
+  in a cycle takes the shift they pointed at, and they all leave
+- repeat until everyone has left
+
+Every trade is one shift for one shift, so each shift keeps the same number
+of holders, and so does every cap (week 21 included). A reporter only takes
+a shift from their own top 10, so top-10-only caps are respected too.
+Reporters without preferences keep their shift.
+
+The pointers are walked with one path stack, and each reporter's pointer
+only moves down their top 10 (a shift whose holders have all left never
+gets one back), so the pass costs O(reporters x 10) rather than looking at
+every pair of reporters.
+"""
+
+from decisions import TRADED
+
+# Rank used for a fallback or bottom-5 shift when comparing and reporting
+UNRANKED = 11
+
+def _quiet(*args):
+    pass
+
+def _rank(matrix, username, shift_id):
+    rank = matrix.rank(username, shift_id)
+    return rank if rank > 0 else UNRANKED
+
+def trade_shifts(assignments, preferences, matrix):
+    """Run top trading cycles over the assignments (first shift of each reporter).
+    
+    Returns (changed, report): changed is {username: [new shift id]} for
+    the reporters who traded; report counts the reporters who improved, how
+    many ranks they gained on average, and the cycles executed.
+    """
+    # Holders still in the market, per shift (dicts as ordered sets, so the
+    # result does not depend on hashing)
+    holders = {}
+    shift_of = {}
+    for username, shift_ids in assignments.items():
+        row = matrix.index.get(username)
+        if shift_ids and row is not None and matrix.complete[row]:
+            shift_of[username] = shift_ids[0]
+            holders.setdefault(shift_ids[0], {})[username] = None
+    
+    position = dict.fromkeys(shift_of, 0)  # next top-10 entry to try, per reporter
+    
+    def target(username):
+        """(shift id, holder) to point at, or None if nothing beats their own shift"""
+        top_10 = preferences[username]['top_10']
+        own_rank = _rank(matrix, username, shift_of[username])
+        i = position[username]
+        while i < min(own_rank - 1, len(top_10)):
+            shift_id = top_10[i]
+            if holders.get(shift_id):
+                position[username] = i
+                return shift_id, next(iter(holders[shift_id]))
+            i += 1
+        position[username] = i
+        return None
+    
+    def leave(username):
+        del holders[shift_of[username]][username]
+    
+    new_shift = {}
+    cycles = []
+    for start in shift_of:
+        if start not in holders[shift_of[start]]:
+            continue  # already left
+        stack = [start]
+        on_stack = {start: 0}
+        pointed = []  # pointed[i]: the shift stack[i] points at
+        while stack:
+            username = stack[-1]
+            if len(pointed) == len(stack):
+                # Back at a reporter whose pointer went stale (its holder left)
+                pointed.pop()
+            found = target(username)
+            if found is None:
+                # Keeps their own shift; whoever pointed at them re-points
+                leave(username)
+                stack.pop()
+                del on_stack[username]
+                continue
+            shift_id, holder = found
+            pointed.append(shift_id)
+            if holder not in on_stack:
+                on_stack[holder] = len(stack)
+                stack.append(holder)
+                continue
+            
+            # A cycle: stack[k:] each take the shift they point at
+            k = on_stack[holder]
+            cycle = stack[k:]
+            for member, shift_id in zip(cycle, pointed[k:]):
+                new_shift[member] = shift_id
+            for member in cycle:
+                leave(member)
+                del on_stack[member]
+            cycles.append(len(cycle))
+            del stack[k:]
+            del pointed[k:]
+    
+    changed = {}
+    gains = []
+    into_top_10 = 0
+    for username, shift_id in new_shift.items():
+        if shift_id == shift_of[username]:
+            continue
+        changed[username] = [shift_id]
+        before = _rank(matrix, username, shift_of[username])
+        if before == UNRANKED:
+            into_top_10 += 1
+        else:
+            gains.append(before - matrix.rank(username, shift_id))
+    
+    report = {
+        'reporters_improved': len(changed),
+        'into_top_10': into_top_10,
+        'mean_rank_gain': round(sum(gains) / len(gains), 2) if gains else 0.0,
+        'cycles': len(cycles),
+        'longest_cycle': max(cycles, default=0)
+    }
+    return changed, report
+
+def apply_trades(result, changed, report, log=_quiet, trace=None, matrix=None):
+    """Apply trade_shifts() output to an allocate() result in place.
+    
+    Each trade is added to trace (a decisions.DecisionTrace, which then
+    needs the matrix for the new rank), if given.
+    """
+    assignments = result['assignments']
+    shift_assignments = result['shift_assignments']
+    for username, (shift_id,) in changed.items():
+        old = assignments[username][0]
+        shift_assignments[old].remove(username)
+        shift_assignments[shift_id].append(username)
+        assignments[username] = [shift_id] + assignments[username][1:]
+        if trace is not None:
+            trace.records.extend((username, shift_id, TRADED, matrix.rank(username, shift_id), 0, None))
+    result['trading'] = report
+    log(f"\n=== TRADING: {report['reporters_improved']} reporters improved "
+        f"({report['into_top_10']} into their top 10, mean gain {report['mean_rank_gain']} ranks), "
+        f"{report['cycles']} cycles ===")
+    return result